@@ -1,5 +1,6 @@
 import os
 from pathlib import Path
+from datetime import time
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -17,6 +18,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'MariaAlvezApp',
     'Terceiros', 
 ]
@@ -101,6 +103,7 @@ JAZZMIN_SETTINGS = {
         "MariaAlvezApp.Animal": "fas fa-paw",
         "MariaAlvezApp.ConsultaClinica": "fas fa-stethoscope",
         "MariaAlvezApp.AgendamentoConsultas": "fas fa-calendar-check",
+        "MariaAlvezApp.Produto": "fas fa-prescription-bottle",
         "MariaAlvezApp.EstoqueMedicamento": "fas fa-capsules",
         "MariaAlvezApp.MovimentoEstoqueMedicamento": "fas fa-exchange-alt",
         "MariaAlvezApp.RegistroVacinacao": "fas fa-syringe",
@@ -171,4 +174,53 @@ STATICFILES_DIRS = [BASE_DIR / "static"]
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 MEDIA_URL = '/media/'
-MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
\ No newline at end of file
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# Geração de PDFs em segundo plano (python manage.py processar_relatorios_pdf)
+RELATORIOS_PDF_CONCORRENCIA = int(os.environ.get('RELATORIOS_PDF_CONCORRENCIA', 2))  # Máximo de PDFs renderizando ao mesmo tempo
+RELATORIOS_PDF_RETENCAO_HORAS = 24  # Tarefas finalizadas (e seus arquivos) são removidas depois disso
+RELATORIOS_PDF_TIMEOUT_MINUTOS = 15  # Tarefas "processando" há mais tempo que isso são consideradas travadas
+
+# Cache dos PDFs de relatório. Usa o banco (tabela criada por `createcachetable`) para que
+# todos os workers do servidor compartilhem os PDFs e o lock de renderização.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'relatorios': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'cache_relatorios',
+    },
+}
+RELATORIOS_PDF_CACHE = 'relatorios'
+RELATORIOS_PDF_CACHE_TIMEOUT = 60 * 60 * 24  # Segundos que um PDF renderizado fica em cache
+RELATORIOS_PDF_CACHE_ESPERA = 120  # Segundos que uma requisição espera por uma renderização idêntica em andamento
+RELATORIOS_PDF_CACHE_TAMANHO_MAXIMO = 5 * 1024 * 1024  # Bytes; PDFs maiores não vão para o cache nem ficam em memória
+
+# Pool de processos que convertem HTML em PDF nas views síncronas (0 = converte no próprio processo web)
+RELATORIOS_PDF_POOL_PROCESSOS = int(os.environ.get('RELATORIOS_PDF_POOL_PROCESSOS', 2))
+RELATORIOS_PDF_POOL_FILA = 8  # PDFs que podem aguardar um processo livre; além disso a view responde 503
+RELATORIOS_PDF_POOL_TIMEOUT = 120  # Segundos de espera por uma vaga na fila e pela renderização
+
+# Snapshot diário dos cards do painel gerencial / página inicial do admin (ver MariaAlvezApp/dashboard.py)
+DASHBOARD_CACHE = 'relatorios'
+
+# Resolução de CEP (ver MariaAlvezApp/cep.py). CEP_BUSCADOR vazio = somente a base local (offline)
+CEP_BUSCADOR = os.environ.get('CEP_BUSCADOR', 'MariaAlvezApp.cep.buscar_viacep')
+CEP_TIMEOUT = 3  # Segundos de espera pela API externa, só usada quando o CEP não está na base
+CEP_CACHE_TAMANHO = 10000  # CEPs mantidos em memória por processo
+
+# Conciliação do estoque (ver MariaAlvezApp/estoque.py e o comando conciliar_estoque)
+ESTOQUE_MARGEM_CONSOLIDACAO = 300  # Segundos: movimentos mais recentes que isso não entram em saldos consolidados
+
+# Grade de horários da agenda de consultas (ver MariaAlvezApp/agenda.py)
+AGENDA_INICIO = time(8, 0)
+AGENDA_FIM = time(18, 0)  # Último horário de início
+AGENDA_INTERVALO_MINUTOS = 15
+AGENDA_DURACAO_CONSULTA_MINUTOS = 15
+AGENDA_DURACAO_CASTRACAO_MINUTOS = 60
+AGENDA_CAPACIDADE_POR_HORARIO = None  # Agendamentos simultâneos; None = um por veterinário cadastrado
+
+# Previsão de consumo e sugestão de reposição (ver MariaAlvezApp/previsao.py)
+ESTOQUE_PREVISAO_JANELA_DIAS = 90  # Histórico de saídas usado para o consumo diário
+ESTOQUE_PRAZO_REPOSICAO_DIAS = 15  # Tempo entre o pedido e a chegada do medicamento
+ESTOQUE_COBERTURA_DIAS = 30  # Dias de consumo que o pedido deve cobrir após a chegada
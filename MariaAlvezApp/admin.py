@@ -1,30 +1,41 @@
 # MariaAlvezApp/admin.py
 
 from django.contrib import admin
+from django.contrib.admin import helpers
+from django.contrib.admin.options import IS_POPUP_VAR
+from django.contrib.admin.utils import unquote
 from django.urls import path, reverse
 from django.http import HttpResponseRedirect
+from django.core.exceptions import PermissionDenied
+from django.template.response import TemplateResponse
 from django.utils import timezone 
 from django.utils.html import format_html
 from django import forms
 from datetime import datetime # Necessário para datetime e strftime
 from django.db import models # Necessário para isinstance(db_field, models.DateField)
-import requests # Necessário para clean_cep no TutorAdminForm
+from django.db.models import Exists, OuterRef, Prefetch
 
 # Importe o NOVO formulário de agendamento (já estava aqui)
 from .forms import AgendamentoConsultasForm 
+from .busca import BuscaTextualAdminMixin
+from . import agenda, estoque, importacao
 
 # Importe todos os seus modelos
 from .models import (
     Veterinario, Tutor, Animal, ConsultaClinica,
     AgendamentoConsultas, RegistroVacinacao, RegistroVermifugos, 
-    Exames, EstoqueMedicamento, MovimentoEstoqueMedicamento,
+    Exames, Produto, EstoqueMedicamento, MovimentoEstoqueMedicamento,
     RelatoriosGerais,
-    MedicamentoConsulta 
+    MedicamentoConsulta, EnderecoCEP, SaldoConsolidado
 )
 
 # Registra o Veterinário (já estava aqui)
 admin.site.register(Veterinario)
 
+# Página inicial do admin com os cards do painel. O admin/index.html do Jazzmin tem prioridade
+# sobre o do app (vem antes em INSTALLED_APPS), então o template é estendido com outro nome.
+admin.site.index_template = 'jazzmin/index.html'
+
 # --- CLASSE TUTORADMINFORM ATUALIZADA ---
 class TutorAdminForm(forms.ModelForm):
     class Meta:
@@ -62,28 +73,18 @@ class TutorAdminForm(forms.ModelForm):
         if len(cep) != 8 or not cep.isdigit():
             raise forms.ValidationError("Digite um CEP válido com 8 números (ex: 89506538).")
 
-        url = f"https://viacep.com.br/ws/{cep}/json/"
-        try:
-            response = requests.get(url, timeout=3)
-            response.raise_for_status() # Levanta um erro para status de resposta HTTP ruins
-            data = response.json()
-        except requests.RequestException as e:
-            raise forms.ValidationError(f"Erro ao consultar o CEP: {e}. Tente novamente.")
-        except ValueError: # Para erros de JSON, se a resposta não for JSON válida
-            raise forms.ValidationError("Resposta inválida da API de CEP.")
-
-        if data.get("erro"):
-            raise forms.ValidationError("CEP não encontrado.")
-
-        # Estes campos são preenchidos no clean() do MODELO Tutor.
-        # Aqui no form, apenas garantimos que os dados estão no cleaned_data.
-        # O modelo Tutor, em seu método clean(), usará esses dados para buscar e preencher.
-        self.cleaned_data['endereco'] = f"{data.get('logradouro', '')}, {data.get('bairro', '')}".strip(', ')
-        self.cleaned_data['cidade'] = data.get('localidade', '')
-        self.cleaned_data['estado'] = data.get('uf', '')
-
+        # O endereço é buscado uma única vez, no clean() do MODELO Tutor (base local de CEPs, ver cep.py)
         return cep
 
+class ImportacaoCadastrosForm(forms.Form):
+    arquivo = forms.FileField(label="Arquivo CSV ou XLSX", help_text="Uma linha por animal, com os dados do tutor (ver colunas abaixo).")
+
+    def clean_arquivo(self):
+        arquivo = self.cleaned_data['arquivo']
+        if not arquivo.name.lower().endswith(('.csv', '.xlsx')):
+            raise forms.ValidationError("Envie um arquivo .csv ou .xlsx.")
+        return arquivo
+
 # --- CLASSE TUTORADMIN ATUALIZADA ---
 @admin.register(Tutor)
 class TutorAdmin(admin.ModelAdmin):
@@ -99,6 +100,34 @@ class TutorAdmin(admin.ModelAdmin):
             'all': ('admin/css/custom_admin.css',)
         }
     
+    def get_urls(self):
+        urls = super().get_urls()
+        return [path('importar/', self.admin_site.admin_view(self.importar_view), name='MariaAlvezApp_tutor_importar')] + urls
+
+    def importar_view(self, request):
+        # Importação em lote de tutores e animais (ver importacao.py); mesmo fluxo do comando importar_cadastros
+        if not (self.has_add_permission(request) and self.admin_site._registry[Animal].has_add_permission(request)):
+            raise PermissionDenied
+        resultado = None
+        form = ImportacaoCadastrosForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            arquivo = form.cleaned_data['arquivo']
+            try:
+                resultado = importacao.importar(arquivo.file, arquivo.name)
+            except (UnicodeDecodeError, ValueError) as exc:
+                form.add_error('arquivo', str(exc))
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.opts,
+            'title': "Importar tutores e animais",
+            'form': form,
+            'resultado': resultado,
+            'erros': resultado.erros[:200] if resultado else [],
+            'colunas': importacao.COLUNAS,
+            'colunas_obrigatorias': importacao.COLUNAS_OBRIGATORIAS,
+        }
+        return TemplateResponse(request, 'admin/MariaAlvezApp/tutor/importar.html', context)
+
     # --- MÉTODO CRUCIAL PARA FORÇAR O WIDGET type="date" E EVITAR INJEÇÃO JS DO ADMIN ---
     def formfield_for_dbfield(self, db_field, request, **kwargs):
         # Verifica se o campo é o data_nascimento do modelo Tutor
@@ -113,17 +142,64 @@ class TutorAdmin(admin.ModelAdmin):
 @admin.register(Animal)
 class AnimalAdmin(admin.ModelAdmin):
     list_display = ('nome', 'especie')
-    search_fields = ['nome', 'especie']
+    search_fields = ['nome', 'especie', 'tutor__nome']
+    autocomplete_fields = ['tutor']
+
+    def get_queryset(self, request):
+        # O __str__ do animal mostra o tutor (usado no autocomplete dos outros cadastros)
+        return super().get_queryset(request).select_related('tutor')
 
 # Registra AgendamentoConsultas (já estava aqui)
 @admin.register(AgendamentoConsultas)
 class AgendamentoConsultasAdmin(admin.ModelAdmin):
     # Usa o formulário personalizado aqui
     form = AgendamentoConsultasForm 
-    list_display = ('animal', 'get_tutor_display', 'data_consulta', 'consulta_associada_link')
-    list_filter = ('data_consulta', 'animal__tutor', 'animal')
+    list_display = ('animal', 'get_tutor_display', 'veterinario', 'data_consulta', 'consulta_associada_link')
+    # Animal e tutor são filtrados pela busca: como filtro lateral listariam todos os cadastros
+    list_filter = ('data_consulta', 'veterinario')
     search_fields = ('animal__nome', 'animal__tutor__nome')
     date_hierarchy = 'data_consulta'
+    autocomplete_fields = ['animal']
+
+    def get_queryset(self, request):
+        # Com select_related no get_queryset o changelist ignora list_select_related
+        return super().get_queryset(request).select_related('animal__tutor', 'veterinario', 'consulta_gerada')
+
+    def changeform_view(self, request, object_id=None, form_url='', extra_context=None):
+        try:
+            return super().changeform_view(request, object_id, form_url, extra_context)
+        except agenda.HorarioOcupado as exc:
+            # O banco recusou a gravação (restrição de exclusão): outro agendamento ocupou o horário
+            # depois da validação. A transação já foi desfeita; o formulário volta com o erro na hora
+            return self._formulario_com_conflito(request, object_id, form_url, extra_context, exc)
+
+    def _formulario_com_conflito(self, request, object_id, form_url, extra_context, exc):
+        obj = self.get_object(request, unquote(object_id)) if object_id else None
+        form = self.get_form(request, obj, change=obj is not None)(request.POST, request.FILES, instance=obj)
+        form.is_valid()
+        for motivo in exc.message_dict.get('data_consulta', exc.messages):
+            if motivo not in form.errors.get('hora_consulta', []):
+                form.add_error('hora_consulta', motivo)
+        admin_form = helpers.AdminForm(
+            form, list(self.get_fieldsets(request, obj)), self.get_prepopulated_fields(request, obj),
+            self.get_readonly_fields(request, obj), model_admin=self,
+        )
+        context = {
+            **self.admin_site.each_context(request),
+            'title': f"{'Alterar' if obj else 'Adicionar'} {self.opts.verbose_name}",
+            'subtitle': str(obj) if obj else None,
+            'adminform': admin_form,
+            'object_id': object_id,
+            'original': obj,
+            'is_popup': IS_POPUP_VAR in request.POST,
+            'to_field': None,
+            'media': self.media + admin_form.media,
+            'inline_admin_formsets': [],
+            'errors': helpers.AdminErrorList(form, []),
+            'preserved_filters': self.get_preserved_filters(request),
+            **(extra_context or {}),
+        }
+        return self.render_change_form(request, context, add=obj is None, change=obj is not None, obj=obj, form_url=form_url)
 
     @admin.display(description="Tutor")
     def get_tutor_display(self, obj):
@@ -154,7 +230,9 @@ class RelatoriosGeraisAdmin(admin.ModelAdmin):
 class MedicamentoConsultaInline(admin.TabularInline):
     model = MedicamentoConsulta
     extra = 0
-    fields = ['medicamento_estoque', 'quantidade_aplicada']
+    fields = ['produto', 'quantidade_aplicada', 'medicamento_estoque']
+    readonly_fields = ['medicamento_estoque']
+    autocomplete_fields = ['produto']
 
 class ExameInline(admin.TabularInline):
     model = Exames
@@ -163,22 +241,31 @@ class ExameInline(admin.TabularInline):
 
 # Registra ConsultaClinica (já estava aqui)
 @admin.register(ConsultaClinica)
-class ConsultaClinicaAdmin(admin.ModelAdmin):
+class ConsultaClinicaAdmin(BuscaTextualAdminMixin, admin.ModelAdmin):
     list_display = ('animal', 'data_atendimento', 'veterinario', 'tipo_atendimento', 'diagnostico', 'get_medicamentos_aplicados_display', 'agendamento_origem_display')
-    search_fields = ('animal__nome', 'veterinario__nome', 'diagnostico') 
+    search_fields = ('animal__nome', 'veterinario__nome', 'diagnostico', 'observacoes')
+    campos_busca_textual = ('diagnostico', 'observacoes')
     fieldsets = (
         ("Geral", {'fields': ('animal', 'veterinario', 'data_atendimento', 'tipo_atendimento', 'agendamento_origem', 'diagnostico', 'observacoes')}),
         ('Detalhes Físicos', {'fields': ('frequencia_cardiaca', 'frequencia_respiratoria', 'temperatura', 'peso', 'avaliacao_mucosa', 'tempo_preenchimento_capilar'), 'classes': ('collapse',)}),
     )
     inlines = [MedicamentoConsultaInline, ExameInline]
+    autocomplete_fields = ['animal', 'agendamento_origem']
     
     date_hierarchy = 'data_atendimento'
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'animal__tutor', 'veterinario', 'agendamento_origem'
+        ).prefetch_related(
+            Prefetch('medicamentoconsulta_set', queryset=MedicamentoConsulta.objects.select_related('medicamento_estoque__produto'))
+        )
+
     @admin.display(description="Medicamentos na Consulta")
     def get_medicamentos_aplicados_display(self, obj):
         medicamentos_consulta = obj.medicamentoconsulta_set.all() 
         if medicamentos_consulta:
-            return format_html("<br>".join([f"{mc.medicamento_estoque.medicamento} ({mc.quantidade_aplicada} un.)" for mc in medicamentos_consulta]))
+            return format_html("<br>".join([f"{mc.medicamento_estoque.produto.nome} ({mc.quantidade_aplicada} un., lote {mc.medicamento_estoque.lote})" for mc in medicamentos_consulta]))
         return "Nenhum"
 
     @admin.display(description="Agendamento de Origem")
@@ -192,14 +279,62 @@ class ConsultaClinicaAdmin(admin.ModelAdmin):
             return self.readonly_fields + ('agendamento_origem', 'animal', 'data_atendimento')
         return self.readonly_fields
 
+@admin.register(Exames)
+class ExamesAdmin(BuscaTextualAdminMixin, admin.ModelAdmin):
+    list_display = ('nome', 'tipo', 'animal', 'data_exame')
+    list_filter = ('tipo',)
+    search_fields = ('animal__nome', 'nome', 'descricao')
+    campos_busca_textual = ('nome', 'descricao')
+    date_hierarchy = 'data_exame'
+    autocomplete_fields = ['consulta', 'animal']
+    list_select_related = ('animal__tutor',)
+
+class LoteInline(admin.TabularInline):
+    model = EstoqueMedicamento
+    extra = 0
+    fields = ('lote', 'data_validade', 'quantidade')
+    readonly_fields = ('quantidade',)
+    show_change_link = True
+
+@admin.register(Produto)
+class ProdutoAdmin(admin.ModelAdmin):
+    list_display = ('nome', 'tipo_medicamento', 'quantidade_total')
+    list_filter = ('tipo_medicamento',)
+    search_fields = ('nome',)
+    readonly_fields = ('quantidade_total',)
+    inlines = [LoteInline]
+
+    # Campos que dão saída de estoque: o autocomplete só oferece medicamentos com lote utilizável
+    CAMPOS_DISPENSACAO = {
+        ('medicamentoconsulta', 'produto'),
+        ('registrovacinacao', 'produto'),
+        ('registrovermifugos', 'produto'),
+    }
+
+    def get_queryset(self, request):
+        qs = super().get_queryset(request)
+        if request.resolver_match and request.resolver_match.url_name == 'autocomplete':
+            if (request.GET.get('model_name'), request.GET.get('field_name')) in self.CAMPOS_DISPENSACAO:
+                lotes = estoque.lotes_disponiveis(EstoqueMedicamento.objects.filter(produto=OuterRef('pk')))
+                return qs.filter(Exists(lotes))
+        return qs
+
 # Registra EstoqueMedicamento (já estava aqui)
 @admin.register(EstoqueMedicamento)
 class EstoqueMedicamentoAdmin(admin.ModelAdmin):
-    list_display = ('medicamento', 'lote', 'quantidade', 'data_validade_formatada', 'destaque_validade')
+    list_display = ('produto', 'lote', 'quantidade', 'data_validade_formatada', 'destaque_validade')
+    list_filter = ('produto__tipo_medicamento',)
     readonly_fields = ('data_cadastro',)
+    search_fields = ('produto__nome', 'lote')
+    autocomplete_fields = ['produto']
+    list_select_related = ('produto',)
+    ordering = ('data_validade', 'pk')
 
     def get_queryset(self, request):
-        qs = super().get_queryset(request)
+        qs = super().get_queryset(request).select_related('produto')
+        # O autocomplete dos outros cadastros também oferece lotes zerados (ex.: entrada de estoque)
+        if request.resolver_match and request.resolver_match.url_name == 'autocomplete':
+            return qs
         return qs.filter(quantidade__gt=0)
     
     def data_validade_formatada(self, obj):
@@ -211,27 +346,43 @@ class EstoqueMedicamentoAdmin(admin.ModelAdmin):
 class MovimentoEstoqueMedicamentoAdmin(admin.ModelAdmin):
     list_display = ('estoque_item', 'tipo', 'quantidade', 'data', 'observacao')
     list_filter = ('tipo', 'data')
-    search_fields = ('estoque_item__medicamento', 'estoque_item__lote', 'observacao') 
+    search_fields = ('estoque_item__produto__nome', 'estoque_item__lote', 'observacao') 
+    autocomplete_fields = ['estoque_item']
+    list_select_related = ('estoque_item__produto',)
     
     def has_change_permission(self, request, obj=None): return False 
     def get_readonly_fields(self, request, obj=None):
         if obj is None: return ('data',)
         else: return ('estoque_item', 'tipo', 'quantidade', 'data', 'observacao')
 
+# Gravados pelo comando conciliar_estoque --consolidar; só consulta
+@admin.register(SaldoConsolidado)
+class SaldoConsolidadoAdmin(admin.ModelAdmin):
+    list_display = ('estoque_item', 'saldo', 'ate', 'criado_em')
+    search_fields = ('estoque_item__produto__nome', 'estoque_item__lote')
+    list_select_related = ('estoque_item__produto',)
+    date_hierarchy = 'ate'
+
+    def has_add_permission(self, request): return False
+    def has_change_permission(self, request, obj=None): return False
+
 # Registra RegistroVacinacao (já estava aqui)
 @admin.register(RegistroVacinacao)
 class RegistroVacinacaoAdmin(admin.ModelAdmin):
     list_display = ('animal', 'medicamento_aplicado_display', 'data_aplicacao', 'data_revacinacao', 'status_revacacao_display')
-    search_fields = ('animal__nome', 'medicamento_aplicado__medicamento', 'medicamento_aplicado__lote') 
-    list_filter = ('data_aplicacao', 'data_revacinacao', 'medicamento_aplicado__medicamento') 
+    search_fields = ('animal__nome', 'produto__nome', 'medicamento_aplicado__lote') 
+    list_filter = ('data_aplicacao', 'data_revacinacao', 'produto') 
     ordering = ('-data_aplicacao',)
-    fieldsets = ((None, {'fields': ('animal', 'medicamento_aplicado', 'data_aplicacao', 'data_revacinacao')}),)
+    fieldsets = ((None, {'fields': ('animal', 'produto', 'medicamento_aplicado', 'data_aplicacao', 'data_revacinacao')}),)
+    readonly_fields = ('medicamento_aplicado',)
+    autocomplete_fields = ['animal', 'produto']
+    list_select_related = ('animal__tutor', 'medicamento_aplicado__produto')
     
     @admin.display(description="Medicamento Aplicado (Lote/Validade)")
     def medicamento_aplicado_display(self, obj):
         if obj.medicamento_aplicado:
             validade = obj.medicamento_aplicado.data_validade.strftime('%d/%m/%Y')
-            return format_html(f"{obj.medicamento_aplicado.medicamento} (Lote: {obj.medicamento_aplicado.lote}) Val: {validade})")
+            return format_html(f"{obj.medicamento_aplicado.produto.nome} (Lote: {obj.medicamento_aplicado.lote}) Val: {validade})")
         return "N/A"
     
     @admin.display(description="Status Revacinação", ordering='data_revacinacao')
@@ -246,16 +397,19 @@ class RegistroVacinacaoAdmin(admin.ModelAdmin):
 @admin.register(RegistroVermifugos)
 class RegistroVermifugosAdmin(admin.ModelAdmin):
     list_display = ('animal', 'medicamento_administrado_display', 'data_administracao', 'data_readministracao', 'status_readministracao_display')
-    search_fields = ('animal__nome', 'medicamento_administrado__medicamento', 'medicamento_administrado__lote') 
-    list_filter = ('data_administracao', 'data_readministracao', 'medicamento_administrado__medicamento') 
+    search_fields = ('animal__nome', 'produto__nome', 'medicamento_administrado__lote') 
+    list_filter = ('data_administracao', 'data_readministracao', 'produto') 
     ordering = ('-data_administracao',)
-    fieldsets = ((None, {'fields': ('animal', 'medicamento_administrado', 'data_administracao', 'data_readministracao')}),)
+    fieldsets = ((None, {'fields': ('animal', 'produto', 'medicamento_administrado', 'data_administracao', 'data_readministracao')}),)
+    readonly_fields = ('medicamento_administrado',)
+    autocomplete_fields = ['animal', 'produto']
+    list_select_related = ('animal__tutor', 'medicamento_administrado__produto')
     
     @admin.display(description="Vermífugo Administrado (Lote/Validade)")
     def medicamento_administrado_display(self, obj):
         if obj.medicamento_administrado:
             validade = obj.medicamento_administrado.data_validade.strftime('%d/%m/%Y')
-            return format_html(f"{obj.medicamento_administrado.medicamento} (Lote: {obj.medicamento_administrado.lote}) Val: {validade})")
+            return format_html(f"{obj.medicamento_administrado.produto.nome} (Lote: {obj.medicamento_administrado.lote}) Val: {validade})")
         return "N/A"
     
     @admin.display(description="Status Readministração", ordering='data_readministracao')
@@ -264,4 +418,11 @@ class RegistroVermifugosAdmin(admin.ModelAdmin):
         dias = (obj.data_readministracao - timezone.now().date()).days
         if dias < 0: return format_html('<b style="color: red;">ATRASADA! ({} dias)</b>', abs(dias))
         elif dias <= 30: return format_html('<b style="color: orange;">Readministrar em {} dias</b>', dias)
-        else: return format_html('<span style="color: green;">OK (Em {} dias)</b>', dias)
\ No newline at end of file
+        else: return format_html('<span style="color: green;">OK (Em {} dias)</b>', dias)
+
+@admin.register(EnderecoCEP)
+class EnderecoCEPAdmin(admin.ModelAdmin):
+    list_display = ('cep', 'logradouro', 'bairro', 'cidade', 'uf', 'origem', 'atualizado_em')
+    list_filter = ('origem', 'uf')
+    search_fields = ('cep', 'logradouro', 'cidade')
+    readonly_fields = ('atualizado_em',)
@@ -0,0 +1,180 @@
+# MariaAlvezApp/agenda.py
+#
+# Horários livres da agenda de consultas. O dia é uma grade de AGENDA_INTERVALO_MINUTOS, de
+# AGENDA_INICIO até AGENDA_FIM (último horário de início). A ocupação de cada veterinário e de
+# cada animal num dia é um bitmap (int; bit i = horário i da grade ocupado) e a de cada horário
+# é uma contagem, para a capacidade da clínica (agendamentos ainda sem veterinário também
+# ocupam uma vaga). Tudo sai de uma única consulta pelo intervalo de datas, então uma semana
+# com centenas de agendamentos por dia custa o mesmo número de consultas que um dia vazio.
+#
+# A verificação do formulário é uma leitura antes da escrita: dois usuários podem marcar o
+# mesmo horário ao mesmo tempo. No PostgreSQL quem garante é o banco, com restrições de
+# exclusão (btree_gist) sobre tstzrange(data_consulta, data_fim) por animal e por veterinário
+# (migração 0019); a violação vira HorarioOcupado, um ValidationError com a mensagem de conflito.
+
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+
+from .models import AgendamentoConsultas, Veterinario
+
+
+CONFLITO_ANIMAL = "Já existe uma consulta agendada para este animal nesse horário."
+CONFLITO_VETERINARIO = "O veterinário já tem uma consulta agendada nesse horário."
+SEM_VAGAS = "Não há vagas nesse horário. Escolha outro horário livre."
+
+# Restrições de exclusão do PostgreSQL -> mensagem mostrada no formulário
+RESTRICOES = {
+    'agendamento_animal_sem_sobreposicao': CONFLITO_ANIMAL,
+    'agendamento_veterinario_sem_sobreposicao': CONFLITO_VETERINARIO,
+}
+
+
+class HorarioOcupado(ValidationError):
+    """O banco recusou o agendamento: outro ocupou o horário entre a validação e a gravação."""
+
+
+def motivo_da_violacao(exc):
+    """Mensagem de conflito se o IntegrityError `exc` veio de uma das RESTRICOES, senão None."""
+    diag = getattr(exc.__cause__, 'diag', None)
+    nome = getattr(diag, 'constraint_name', None)
+    if nome is None:
+        nome = next((restricao for restricao in RESTRICOES if restricao in str(exc)), None)
+    return RESTRICOES.get(nome)
+
+
+def grade():
+    """Horários de início da grade do dia (datetime.time)."""
+    intervalo = timedelta(minutes=settings.AGENDA_INTERVALO_MINUTOS)
+    atual = datetime.combine(datetime.min, settings.AGENDA_INICIO)
+    fim = datetime.combine(datetime.min, settings.AGENDA_FIM)
+    horarios = []
+    while atual <= fim:
+        horarios.append(atual.time())
+        atual += intervalo
+    return horarios
+
+
+def duracao(is_castracao):
+    """Duração do agendamento, em minutos."""
+    return settings.AGENDA_DURACAO_CASTRACAO_MINUTOS if is_castracao else settings.AGENDA_DURACAO_CONSULTA_MINUTOS
+
+
+def _minutos_desde_inicio(hora):
+    return (hora.hour * 60 + hora.minute) - (settings.AGENDA_INICIO.hour * 60 + settings.AGENDA_INICIO.minute)
+
+
+def mascara(inicio_minutos, duracao_minutos, total_horarios):
+    """Bits dos horários da grade que se sobrepõem a [início, início + duração) (minutos desde AGENDA_INICIO)."""
+    intervalo = settings.AGENDA_INTERVALO_MINUTOS
+    primeiro = max(inicio_minutos // intervalo, 0)
+    ultimo = min(-(-(inicio_minutos + duracao_minutos) // intervalo), total_horarios)
+    if ultimo <= primeiro:
+        return 0
+    return ((1 << (ultimo - primeiro)) - 1) << primeiro
+
+
+@dataclass
+class OcupacaoDia:
+    veterinarios: dict = field(default_factory=dict)  # pk do veterinário -> bitmap
+    animais: dict = field(default_factory=dict)       # pk do animal -> bitmap
+    contagem: list = field(default_factory=list)      # Agendamentos em cada horário da grade
+
+
+def ocupacao(inicio, fim, excluir=None):
+    """{data: OcupacaoDia} de `inicio` a `fim` (datas locais), com uma única consulta.
+
+    `excluir` é o pk de um agendamento a ignorar (o que está sendo editado).
+    """
+    from .relatorios import intervalo_de_dias  # relatorios importa forms, que importa este módulo
+
+    total = len(grade())
+    dias = {inicio + timedelta(days=n): OcupacaoDia(contagem=[0] * total) for n in range((fim - inicio).days + 1)}
+    agendamentos = (
+        AgendamentoConsultas.objects.filter(intervalo_de_dias('data_consulta', inicio, fim))
+        .values_list('data_consulta', 'data_fim', 'veterinario_id', 'animal_id', 'is_castracao')
+    )
+    if excluir:
+        agendamentos = agendamentos.exclude(pk=excluir)
+
+    for data_consulta, data_fim, veterinario, animal, is_castracao in agendamentos:
+        local = timezone.localtime(data_consulta)
+        dia = dias[local.date()]
+        # data_fim guarda a duração da época do agendamento; sem ela (ex.: bulk_create), a atual
+        minutos = (data_fim - data_consulta) // timedelta(minutes=1) if data_fim else duracao(is_castracao)
+        bits = mascara(_minutos_desde_inicio(local.time()), minutos, total)
+        if veterinario:
+            dia.veterinarios[veterinario] = dia.veterinarios.get(veterinario, 0) | bits
+        if animal:
+            dia.animais[animal] = dia.animais.get(animal, 0) | bits
+        indice = 0
+        while bits >> indice:
+            if (bits >> indice) & 1:
+                dia.contagem[indice] += 1
+            indice += 1
+    return dias
+
+
+def capacidade(total_veterinarios):
+    """Agendamentos simultâneos aceitos: AGENDA_CAPACIDADE_POR_HORARIO ou um por veterinário."""
+    return settings.AGENDA_CAPACIDADE_POR_HORARIO or max(total_veterinarios, 1)
+
+
+def disponibilidade(inicio, dias=1, veterinario=None, animal=None, is_castracao=False, excluir=None, agora=None):
+    """Horários de `dias` dias a partir de `inicio`, com o que está livre em cada um.
+
+    Um horário é `livre` se comporta a duração do agendamento sem passar da capacidade e sem
+    conflito com a agenda do `veterinario` e do `animal` informados. `veterinarios_livres`
+    lista, para a visão da semana, os veterinários com a agenda livre naquele horário.
+    """
+    agora = agora or timezone.now()
+    horarios = grade()
+    veterinarios = list(Veterinario.objects.order_by('nome', 'pk').values_list('pk', 'nome'))
+    limite = capacidade(len(veterinarios))
+    fim = inicio + timedelta(days=dias - 1)
+    ocupado = ocupacao(inicio, fim, excluir)
+    minutos = duracao(is_castracao)
+
+    resultado = []
+    for data, dia in sorted(ocupado.items()):
+        linhas = []
+        for hora in horarios:
+            bits = mascara(_minutos_desde_inicio(hora), minutos, len(horarios))
+            vagas = min(limite - dia.contagem[i] for i in range(len(horarios)) if (bits >> i) & 1)
+            livres = [pk for pk, _ in veterinarios if not dia.veterinarios.get(pk, 0) & bits] if vagas > 0 else []
+            livre = (
+                vagas > 0
+                and timezone.make_aware(datetime.combine(data, hora)) > agora
+                and not (animal and dia.animais.get(animal, 0) & bits)
+                and (veterinario is None or veterinario in livres)
+            )
+            linhas.append({'hora': hora.strftime('%H:%M'), 'livre': livre, 'vagas': max(vagas, 0), 'veterinarios_livres': livres})
+        resultado.append({'data': data.isoformat(), 'horarios': linhas})
+
+    return {
+        'intervalo_minutos': settings.AGENDA_INTERVALO_MINUTOS,
+        'duracao_minutos': minutos,
+        'capacidade': limite,
+        'veterinarios': [{'id': pk, 'nome': nome} for pk, nome in veterinarios],
+        'dias': resultado,
+    }
+
+
+def conflito(data_hora, veterinario=None, animal=None, is_castracao=False, excluir=None):
+    """Motivo pelo qual o horário não pode ser agendado, ou None se estiver livre."""
+    local = timezone.localtime(data_hora)
+    ocupado = ocupacao(local.date(), local.date(), excluir)[local.date()]
+    total = len(grade())
+    bits = mascara(_minutos_desde_inicio(local.time()), duracao(is_castracao), total)
+
+    if animal and ocupado.animais.get(animal, 0) & bits:
+        return CONFLITO_ANIMAL
+    if veterinario and ocupado.veterinarios.get(veterinario, 0) & bits:
+        return CONFLITO_VETERINARIO
+    limite = capacidade(Veterinario.objects.count())
+    if any(ocupado.contagem[i] >= limite for i in range(total) if (bits >> i) & 1):
+        return SEM_VAGAS
+    return None
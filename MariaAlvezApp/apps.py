@@ -5,3 +5,7 @@ class MariaalvezappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'MariaAlvezApp'
     verbose_name = "Clínica"
+
+    def ready(self):
+        from .signals import conectar_sinais
+        conectar_sinais()
@@ -0,0 +1,59 @@
+# MariaAlvezApp/autocomplete.py
+#
+# Fontes do endpoint de autocomplete usado nos filtros dos relatórios (ver SelecaoAutocomplete
+# em forms.py). Cada fonte define a queryset, já com os JOINs usados pelo __str__, e os campos
+# pesquisados: início do texto e, no PostgreSQL, similaridade de trigramas (trechos de
+# palavras, pequenos erros de digitação). Resultados que começam com o termo vêm primeiro.
+
+from functools import reduce
+from operator import or_
+
+from django.db.models import Case, IntegerField, Q, Value, When
+
+from . import busca
+from .models import Animal, EstoqueMedicamento, Tutor
+from Terceiros.models import EmpresaTerceirizada
+
+LIMITE_PADRAO = 20
+LIMITE_MAXIMO = 50
+
+
+class FonteAutocomplete:
+    def __init__(self, model, campos, select_related=()):
+        self.model = model
+        self.campos = campos
+        self.select_related = select_related
+
+    def get_queryset(self):
+        return self.model.objects.select_related(*self.select_related)
+
+    def _condicao(self, lookup, termo):
+        return reduce(or_, (Q(**{f'{campo}__{lookup}': termo}) for campo in self.campos))
+
+    def buscar(self, termo, limite=LIMITE_PADRAO):
+        qs = self.get_queryset()
+        if termo:
+            prefixo = self._condicao('istartswith', termo)
+            semelhante = self._condicao('trigram_word_similar' if busca.disponivel() else 'icontains', termo)
+            qs = qs.filter(prefixo | semelhante).annotate(
+                prioridade=Case(When(prefixo, then=Value(0)), default=Value(1), output_field=IntegerField())
+            ).order_by('prioridade', self.campos[0], 'pk')
+        else:
+            qs = qs.order_by(self.campos[0], 'pk')
+        return [{'id': obj.pk, 'texto': str(obj)} for obj in qs[:limite]]
+
+
+FONTES = {
+    'animal': FonteAutocomplete(Animal, ('nome', 'tutor__nome'), select_related=('tutor',)),
+    'tutor': FonteAutocomplete(Tutor, ('nome', 'cpf')),
+    'medicamento': FonteAutocomplete(EstoqueMedicamento, ('produto__nome', 'lote'), select_related=('produto',)),
+    'empresa': FonteAutocomplete(EmpresaTerceirizada, ('razao_social',)),
+}
+
+
+def limite_da_requisicao(valor):
+    try:
+        limite = int(valor)
+    except (TypeError, ValueError):
+        return LIMITE_PADRAO
+    return max(1, min(limite, LIMITE_MAXIMO))
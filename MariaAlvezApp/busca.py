@@ -0,0 +1,119 @@
+# MariaAlvezApp/busca.py
+#
+# Busca textual em diagnósticos, observações, exames e serviços. No PostgreSQL cada tabela
+# pesquisada tem uma coluna tsvector `busca` (configuração em português, sem acentos),
+# mantida por trigger e indexada com GIN; as colunas de texto também têm índice de trigramas
+# para trechos de palavras e pequenos erros de digitação. Em outros bancos (ex.: SQLite nos
+# testes) a busca cai para icontains.
+
+from functools import reduce
+from operator import or_
+
+from django.db import connection
+from django.db.models import F, FloatField, Q, Value
+
+CONFIGURACAO = 'portugues_unaccent'
+
+
+def disponivel():
+    return connection.vendor == 'postgresql'
+
+
+def _consulta(termo):
+    from django.contrib.postgres.search import SearchQuery
+    return SearchQuery(termo, config=CONFIGURACAO, search_type='websearch')
+
+
+def condicao(termo, campos_texto, campo_vetor='busca'):
+    if not disponivel():
+        return reduce(or_, (Q(**{f'{campo}__icontains': termo}) for campo in campos_texto))
+    resultado = Q(**{campo_vetor: _consulta(termo)})
+    for campo in campos_texto:
+        resultado |= Q(**{f'{campo}__trigram_word_similar': termo})
+    return resultado
+
+
+def relevancia(termo, campo_vetor='busca'):
+    if not disponivel():
+        return Value(0.0, output_field=FloatField())
+    from django.contrib.postgres.search import SearchRank
+    return SearchRank(F(campo_vetor), _consulta(termo))
+
+
+def sql_busca_textual(tabela, pesos):
+    """
+    SQL (instalar, remover) da coluna `busca` de `tabela`: trigger que recalcula o tsvector
+    quando as colunas de texto mudam, preenchimento das linhas existentes e índices.
+    `pesos` é uma sequência de (coluna, peso), com peso de 'A' (mais relevante) a 'D'.
+    Gerador do SQL de novas migrações, que o guardam como texto (ver 0011, onde também está a
+    configuração portugues_unaccent): migrações não importam este módulo, então mudanças
+    aqui não alteram as já existentes.
+    """
+    colunas = [coluna for coluna, _ in pesos]
+    vetor = " || ".join(
+        f"setweight(to_tsvector('{CONFIGURACAO}', coalesce({{linha}}\"{coluna}\", '')), '{peso}')"
+        for coluna, peso in pesos
+    )
+    funcao = f'"{tabela}_busca_atualizar"'
+    instalar = [
+        f"""CREATE OR REPLACE FUNCTION {funcao}() RETURNS trigger AS $$
+        BEGIN
+            NEW.busca := {vetor.format(linha='NEW.')};
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql""",
+        f"""CREATE TRIGGER "{tabela}_busca" BEFORE INSERT OR UPDATE OF {', '.join(f'"{c}"' for c in colunas)}
+        ON "{tabela}" FOR EACH ROW EXECUTE FUNCTION {funcao}()""",
+        f'UPDATE "{tabela}" SET busca = {vetor.format(linha="")}',
+        f'CREATE INDEX "{tabela}_busca_gin" ON "{tabela}" USING gin (busca)',
+    ] + [
+        f'CREATE INDEX "{tabela}_{coluna}_trgm" ON "{tabela}" USING gin ("{coluna}" gin_trgm_ops)'
+        for coluna in colunas
+    ]
+    remover = [
+        f'DROP TRIGGER IF EXISTS "{tabela}_busca" ON "{tabela}"',
+        f'DROP FUNCTION IF EXISTS {funcao}()',
+        f'DROP INDEX IF EXISTS "{tabela}_busca_gin"',
+    ] + [f'DROP INDEX IF EXISTS "{tabela}_{coluna}_trgm"' for coluna in colunas]
+    return instalar, remover
+
+
+class BuscaTextualAdminMixin:
+    """
+    Busca do admin: as colunas de `campos_busca_textual` usam a busca textual (tsvector +
+    trigramas) e os demais `search_fields` a similaridade de trigramas (icontains fora do
+    PostgreSQL). Com um termo de busca, a listagem vem ordenada por relevância.
+    """
+    campos_busca_textual = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term or not self.campos_busca_textual:
+            return super().get_search_results(request, queryset, search_term)
+
+        outros_campos = [
+            campo for campo in self.get_search_fields(request) if campo not in self.campos_busca_textual
+        ]
+        # Um único OR entre a busca indexada e campos de outras tabelas (animal__nome...) leva o
+        # PostgreSQL a ler a tabela inteira. Cada ramo vira uma consulta de pks com o próprio
+        # índice (GIN do tsvector/trigramas) e a listagem filtra pela união; sem duplicatas.
+        lookup = 'trigram_word_similar' if disponivel() else 'icontains'
+        base = self.model._default_manager.order_by()
+        ramos = [base.filter(condicao(search_term, self.campos_busca_textual)).values('pk')]
+        ramos += [base.filter(**{f'{campo}__{lookup}': search_term}).values('pk') for campo in outros_campos]
+        return queryset.filter(pk__in=ramos[0].union(*ramos[1:])), False
+
+    def _termo_busca(self, request):
+        return request.GET.get('q', '').strip() if self.campos_busca_textual else ''
+
+    def get_queryset(self, request):
+        termo = self._termo_busca(request)
+        if not termo:
+            return super().get_queryset(request)
+        # Igual ao ModelAdmin.get_queryset, mas anota a relevância antes de ordenar por ela
+        qs = self.model._default_manager.get_queryset().annotate(relevancia_busca=relevancia(termo))
+        return qs.order_by(*self.get_ordering(request))
+
+    def get_ordering(self, request):
+        if self._termo_busca(request) and 'o' not in request.GET:
+            return ('-relevancia_busca',)
+        return super().get_ordering(request)
@@ -0,0 +1,101 @@
+# MariaAlvezApp/cache_pdf.py
+#
+# Cache dos PDFs de relatório. A chave combina o nome do relatório, os filtros normalizados,
+# a data de referência ("hoje", usada nos status de validade) e a versão de cada tabela
+# que o relatório lê. A versão de uma tabela é o instante (em ns) da última alteração,
+# atualizado pelos sinais de save/delete (ver signals.py), então ela também serve de Last-Modified.
+# Só PDFs até RELATORIOS_PDF_CACHE_TAMANHO_MAXIMO são guardados; os maiores saem direto do
+# arquivo temporário em que foram gerados.
+
+import hashlib
+import io
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+def _cache():
+    return caches[settings.RELATORIOS_PDF_CACHE]
+
+
+def _chave_versao(modelo):
+    return f"relatorios:versao:{modelo._meta.label_lower}"
+
+
+def versao_modelo(modelo):
+    # Se a versão sumiu do cache (expiração/reinício), começa uma nova: nunca reaproveita PDFs antigos
+    return _cache().get_or_set(_chave_versao(modelo), time.time_ns, None)
+
+
+def versoes_modelos(modelos):
+    """Versões de vários modelos com uma única leitura do cache: {label do modelo: versão}."""
+    cache = _cache()
+    chaves = {_chave_versao(modelo): modelo for modelo in modelos}
+    versoes = cache.get_many(chaves)
+    for chave in chaves.keys() - versoes.keys():
+        versoes[chave] = cache.get_or_set(chave, time.time_ns, None)
+    return {chaves[chave]._meta.label_lower: versao for chave, versao in versoes.items()}
+
+
+def invalidar_modelo(modelo):
+    _cache().set(_chave_versao(modelo), time.time_ns(), None)
+
+
+def filtros_normalizados(dados):
+    # Ignora o cursor da paginação e filtros vazios; a ordem dos parâmetros não importa
+    filtros = []
+    for campo in dados:
+        if campo == 'cursor':
+            continue
+        valores = dados.getlist(campo) if hasattr(dados, 'getlist') else [dados[campo]]
+        filtros.extend((campo, str(valor)) for valor in valores if valor not in ('', None))
+    return sorted(filtros)
+
+
+def assinatura(relatorio):
+    """Retorna (chave do cache, instante da última alteração em segundos) para o relatório."""
+    versoes = sorted(versoes_modelos(relatorio.modelos_dependentes()).items())
+    conteudo = repr((relatorio.nome, relatorio.motor_pdf, relatorio.hoje.isoformat(), filtros_normalizados(relatorio.dados), versoes))
+    chave = f"relatorios:pdf:{hashlib.sha256(conteudo.encode()).hexdigest()}"
+    ultima_alteracao = max(versao for _, versao in versoes) // 1_000_000_000
+    return chave, ultima_alteracao
+
+
+def _guardar(cache, chave, arquivo):
+    tamanho = arquivo.seek(0, io.SEEK_END)
+    arquivo.seek(0)
+    if tamanho <= settings.RELATORIOS_PDF_CACHE_TAMANHO_MAXIMO:
+        cache.set(chave, arquivo.read(), settings.RELATORIOS_PDF_CACHE_TIMEOUT)
+        arquivo.seek(0)
+
+
+def obter_ou_gerar(chave, gerar):
+    """
+    Devolve o PDF (arquivo binário) do cache ou o gera uma única vez: requisições simultâneas
+    com a mesma chave esperam a renderização em andamento (single-flight) em vez de renderizar
+    de novo. `gerar` também deve devolver um arquivo; se ele for grande demais para o cache,
+    quem esperava gera o seu.
+    """
+    cache = _cache()
+    espera_maxima = settings.RELATORIOS_PDF_CACHE_ESPERA
+    chave_lock = f"{chave}:lock"
+    limite = time.monotonic() + espera_maxima
+
+    while True:
+        pdf = cache.get(chave)
+        if pdf is not None:
+            return io.BytesIO(pdf)
+
+        if cache.add(chave_lock, 1, timeout=espera_maxima):
+            try:
+                arquivo = gerar()
+                _guardar(cache, chave, arquivo)
+                return arquivo
+            finally:
+                cache.delete(chave_lock)
+
+        if time.monotonic() >= limite:
+            # Quem estava renderizando demorou demais; não deixa o usuário sem resposta
+            return gerar()
+        time.sleep(0.25)
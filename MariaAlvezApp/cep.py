@@ -0,0 +1,219 @@
+# MariaAlvezApp/cep.py
+#
+# Resolução CEP -> endereço. Ordem de consulta: cache LRU do processo, tabela local EnderecoCEP
+# (alimentada pelo comando `importar_ceps` e pelas consultas anteriores) e, só quando o CEP não
+# está na base, o buscador externo configurado em CEP_BUSCADOR (ViaCEP por padrão), com timeout
+# curto. Com CEP_BUSCADOR vazio a resolução é totalmente offline.
+
+import csv
+import re
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .models import EnderecoCEP
+
+CAMPOS = ('logradouro', 'bairro', 'cidade', 'uf')
+
+# Nomes de coluna aceitos pelo importador além de cep/logradouro/bairro/cidade/uf
+SINONIMOS_COLUNAS = {
+    'localidade': 'cidade',
+    'municipio': 'cidade',
+    'município': 'cidade',
+    'estado': 'uf',
+    'endereco': 'logradouro',
+    'endereço': 'logradouro',
+}
+
+
+class CEPInvalido(ValueError):
+    pass
+
+
+class CEPNaoEncontrado(Exception):
+    pass
+
+
+class CEPIndisponivel(Exception):
+    """O buscador externo falhou (timeout, erro de rede ou resposta inválida)."""
+
+
+def normalizar(cep):
+    digitos = re.sub(r'\D', '', cep or '')
+    if len(digitos) != 8:
+        raise CEPInvalido(f"CEP inválido: {cep!r}")
+    return digitos
+
+
+class CacheLRU:
+    def __init__(self, tamanho):
+        self.tamanho = tamanho
+        self._dados = OrderedDict()
+        self._lock = threading.Lock()
+
+    def obter(self, chave):
+        with self._lock:
+            valor = self._dados.get(chave)
+            if valor is not None:
+                self._dados.move_to_end(chave)
+            return valor
+
+    def guardar(self, chave, valor):
+        with self._lock:
+            self._dados[chave] = valor
+            self._dados.move_to_end(chave)
+            while len(self._dados) > self.tamanho:
+                self._dados.popitem(last=False)
+
+    def limpar(self):
+        with self._lock:
+            self._dados.clear()
+
+
+_cache = CacheLRU(settings.CEP_CACHE_TAMANHO)
+
+
+def buscar_viacep(cep, timeout):
+    """Buscador padrão. Retorna os CAMPOS do endereço, ou None se o CEP não existir."""
+    import requests
+
+    try:
+        response = requests.get(f'https://viacep.com.br/ws/{cep}/json/', timeout=timeout)
+        response.raise_for_status()
+        dados = response.json()
+    except (requests.RequestException, ValueError) as exc:
+        raise CEPIndisponivel(str(exc)) from exc
+    if dados.get('erro'):
+        return None
+    return {
+        'logradouro': dados.get('logradouro', ''),
+        'bairro': dados.get('bairro', ''),
+        'cidade': dados.get('localidade', ''),
+        'uf': dados.get('uf', ''),
+    }
+
+
+def _buscador():
+    return import_string(settings.CEP_BUSCADOR) if settings.CEP_BUSCADOR else None
+
+
+def _como_dict(registro):
+    return {'cep': registro.cep, **{campo: getattr(registro, campo) for campo in CAMPOS}}
+
+
+def resolver(cep):
+    cep = normalizar(cep)
+    endereco = _cache.obter(cep)
+    if endereco is None:
+        registro = EnderecoCEP.objects.filter(pk=cep).first()
+        if registro is None:
+            buscador = _buscador()
+            dados = buscador(cep, timeout=settings.CEP_TIMEOUT) if buscador else None
+            if not dados:
+                raise CEPNaoEncontrado(cep)
+            registro, _ = EnderecoCEP.objects.update_or_create(
+                cep=cep,
+                defaults={**{campo: dados.get(campo) or '' for campo in CAMPOS}, 'origem': EnderecoCEP.CONSULTA},
+            )
+        endereco = _como_dict(registro)
+        _cache.guardar(cep, endereco)
+    return dict(endereco)
+
+
+# --- IMPORTAÇÃO DE BASE DE CEPS ---
+
+def _gravar(lote):
+    EnderecoCEP.objects.bulk_create(
+        lote.values(),
+        update_conflicts=True,
+        unique_fields=['cep'],
+        update_fields=[*CAMPOS, 'origem', 'atualizado_em'],
+    )
+
+
+def importar(arquivo, tamanho_lote=5000):
+    """
+    Importa um CSV (separado por vírgula, ponto e vírgula, tab ou barra vertical) com cabeçalho
+    cep, logradouro, bairro, cidade, uf. CEPs já existentes são atualizados.
+    Retorna (importados, ignorados).
+    """
+    amostra = arquivo.read(8192)
+    arquivo.seek(0)
+    try:
+        dialeto = csv.Sniffer().sniff(amostra, delimiters=',;\t|')
+    except csv.Error:
+        dialeto = csv.excel
+    leitor = csv.DictReader(arquivo, dialect=dialeto)
+    colunas = {nome: SINONIMOS_COLUNAS.get(nome.strip().lower(), nome.strip().lower()) for nome in leitor.fieldnames or ()}
+    if 'cep' not in colunas.values() or 'cidade' not in colunas.values() or 'uf' not in colunas.values():
+        raise ValueError("O arquivo precisa das colunas cep, cidade e uf.")
+
+    importados = ignorados = 0
+    lote = {}
+    for linha in leitor:
+        dados = {colunas[nome]: (valor or '').strip() for nome, valor in linha.items() if nome in colunas}
+        try:
+            cep = normalizar(dados.get('cep'))
+        except CEPInvalido:
+            ignorados += 1
+            continue
+        if not dados.get('cidade') or len(dados.get('uf', '')) != 2:
+            ignorados += 1
+            continue
+        # Dicionário por CEP: linhas repetidas no mesmo lote quebrariam o ON CONFLICT do PostgreSQL
+        lote[cep] = EnderecoCEP(
+            cep=cep,
+            logradouro=dados.get('logradouro', ''),
+            bairro=dados.get('bairro', ''),
+            cidade=dados['cidade'],
+            uf=dados['uf'].upper(),
+            origem=EnderecoCEP.IMPORTACAO,
+        )
+        if len(lote) >= tamanho_lote:
+            _gravar(lote)
+            importados += len(lote)
+            lote = {}
+    if lote:
+        _gravar(lote)
+        importados += len(lote)
+
+    _cache.limpar()
+    return importados, ignorados
+
+
+def resolver_varios(ceps):
+    """
+    Resolve vários CEPs (já normalizados) de uma vez: uma consulta à tabela local para todos os
+    que não estão em memória e o buscador externo só para os que faltarem. Se o buscador ficar
+    indisponível, os CEPs restantes não são mais consultados nesta chamada.
+    Retorna {cep: endereço ou a exceção correspondente}.
+    """
+    resultado = {}
+    faltando = set()
+    for cep in set(ceps):
+        endereco = _cache.obter(cep)
+        if endereco is None:
+            faltando.add(cep)
+        else:
+            resultado[cep] = dict(endereco)
+
+    if faltando:
+        for registro in EnderecoCEP.objects.filter(pk__in=faltando):
+            endereco = _como_dict(registro)
+            _cache.guardar(registro.cep, endereco)
+            resultado[registro.cep] = dict(endereco)
+
+    indisponivel = None
+    for cep in sorted(faltando - resultado.keys()):
+        if indisponivel is not None:
+            resultado[cep] = indisponivel
+            continue
+        try:
+            resultado[cep] = resolver(cep)
+        except CEPNaoEncontrado as exc:
+            resultado[cep] = exc
+        except CEPIndisponivel as exc:
+            resultado[cep] = indisponivel = exc
+    return resultado
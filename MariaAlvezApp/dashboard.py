@@ -0,0 +1,84 @@
+# MariaAlvezApp/dashboard.py
+#
+# Dados do painel gerencial e dos cards da página inicial do admin. Cada card sai de uma
+# única consulta: os primeiros registros, já com animal/tutor via JOIN, e o total anotado
+# por uma função de janela (COUNT(*) OVER ()). O resultado fica em cache por dia; a chave
+# inclui a versão de cada tabela usada (ver cache_pdf.versoes_modelos e signals.py), então
+# um save em qualquer uma delas faz o próximo acesso montar um snapshot novo.
+
+import hashlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Count, Window
+from django.utils import timezone
+
+from .cache_pdf import versoes_modelos
+from .models import (
+    AgendamentoConsultas, Animal, EstoqueMedicamento, Produto, RegistroVacinacao, RegistroVermifugos, Tutor
+)
+from .relatorios import inicio_do_dia, intervalo_de_dias
+
+MODELOS_DEPENDENTES = (
+    AgendamentoConsultas, Animal, Tutor, RegistroVacinacao, RegistroVermifugos, EstoqueMedicamento, Produto,
+)
+ITENS_POR_CARD = 5
+
+
+def _card(qs, item):
+    registros = list(qs.annotate(total_card=Window(Count('pk')))[:ITENS_POR_CARD])
+    return {
+        'total': registros[0].total_card if registros else 0,
+        'itens': [item(registro) for registro in registros],
+    }
+
+
+def _item_animal(registro, data=None):
+    animal = registro.animal
+    return {
+        'animal': animal.nome if animal else '',
+        'tutor': animal.tutor.nome if animal and animal.tutor else '',
+        'data': data,
+    }
+
+
+def montar_snapshot(hoje):
+    inicio_semana = hoje - timedelta(days=hoje.weekday())
+    agendamentos = AgendamentoConsultas.objects.select_related('animal__tutor').only(
+        'data_consulta', 'animal__nome', 'animal__tutor__nome'
+    ).order_by('data_consulta', 'pk')
+    vacinas = RegistroVacinacao.objects.select_related('animal__tutor').only('animal__nome', 'animal__tutor__nome')
+    vermifugos = RegistroVermifugos.objects.select_related('animal__tutor').only('animal__nome', 'animal__tutor__nome')
+
+    return {
+        'hoje': hoje,
+        'agendamentos_hoje': _card(
+            agendamentos.filter(intervalo_de_dias('data_consulta', hoje, hoje)),
+            lambda ag: _item_animal(ag, ag.data_consulta),
+        ),
+        'vacinas_hoje': _card(vacinas.filter(data_revacinacao=hoje).order_by('pk'), _item_animal),
+        'vermifugos_hoje': _card(vermifugos.filter(data_readministracao=hoje).order_by('pk'), _item_animal),
+        'medicamentos_vencer': _card(
+            EstoqueMedicamento.objects
+            .filter(data_validade__lte=hoje + timedelta(days=30))
+            .exclude(quantidade=0)
+            .select_related('produto')
+            .only('produto__nome', 'lote', 'data_validade')
+            .order_by('data_validade', 'pk'),
+            lambda med: {'medicamento': med.produto.nome, 'lote': med.lote, 'data_validade': med.data_validade},
+        ),
+        'agendamentos_semana': _card(
+            agendamentos.filter(intervalo_de_dias('data_consulta', inicio_semana, inicio_semana + timedelta(days=6))),
+            lambda ag: _item_animal(ag, ag.data_consulta),
+        ),
+    }
+
+
+def obter_snapshot():
+    hoje = timezone.localdate()
+    versoes = sorted(versoes_modelos(MODELOS_DEPENDENTES).items())
+    chave = f"dashboard:{hoje.isoformat()}:{hashlib.sha256(repr(versoes).encode()).hexdigest()}"
+    # O snapshot vale só para o dia; expira na meia-noite local
+    ate_meia_noite = int((inicio_do_dia(hoje + timedelta(days=1)) - timezone.now()).total_seconds()) + 1
+    return caches[settings.DASHBOARD_CACHE].get_or_set(chave, lambda: montar_snapshot(hoje), ate_meia_noite)
@@ -0,0 +1,341 @@
+# MariaAlvezApp/estoque.py
+#
+# Operações de saldo em conjunto. O saldo de cada lote (EstoqueMedicamento.quantidade) só muda
+# aqui: os lotes envolvidos são travados em ordem de pk (evita deadlock entre duas operações
+# com os mesmos lotes) e os deltas vão num único UPDATE com F(), sem ler-modificar-gravar em
+# memória. O total por medicamento (Produto.quantidade_total) é atualizado na mesma transação;
+# os medicamentos são travados antes dos lotes, sempre nessa ordem.
+# Exclusões em massa usam estornar_saidas() para devolver ao estoque, com uma agregação por
+# lote, o que os registros excluídos tinham consumido.
+#
+# Conciliação: o saldo de um lote pelo livro é o último SaldoConsolidado mais o efeito dos
+# movimentos posteriores a ele (índice em estoque_item, data), calculado para todos os lotes
+# numa única consulta. Os consolidados só cobrem movimentos mais antigos que
+# ESTOQUE_MARGEM_CONSOLIDACAO, para não deixar de fora uma transação ainda em andamento.
+
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import cache_pdf
+from .models import EstoqueMedicamento, MovimentoEstoqueMedicamento, Produto, SaldoConsolidado
+
+INICIO_DO_LIVRO = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def aplicar_deltas(deltas):
+    """Soma {pk do lote: delta} aos saldos e retorna {pk do lote: novo saldo}.
+
+    Levanta ValidationError, sem alterar nada, se algum lote ficaria negativo.
+    """
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas:
+        return {}
+
+    with transaction.atomic():
+        for _ in range(3):
+            produto_do_lote = dict(EstoqueMedicamento.objects.filter(pk__in=deltas).values_list('pk', 'produto_id'))
+            travar_produtos(produto_do_lote.values())
+            travados = (
+                EstoqueMedicamento.objects.select_for_update()
+                .filter(pk__in=deltas).order_by('pk')
+                .values_list('pk', 'produto_id', 'quantidade')
+            )
+            saldos = {pk: quantidade for pk, produto, quantidade in travados if produto_do_lote[pk] == produto}
+            if len(saldos) == len(deltas):
+                break
+            # Um lote mudou de medicamento antes de ser travado: trava de novo os medicamentos certos
+        else:
+            raise ValidationError("Não foi possível atualizar o estoque: lotes em alteração simultânea. Tente novamente.")
+
+        for pk, delta in deltas.items():
+            if saldos[pk] + delta < 0:
+                raise ValidationError(f"Saldo insuficiente para este lote. Disponível: {saldos[pk]}, Saída: {-delta}.")
+
+        _somar(EstoqueMedicamento, 'quantidade', deltas)
+        deltas_produto = {}
+        for pk, delta in deltas.items():
+            deltas_produto[produto_do_lote[pk]] = deltas_produto.get(produto_do_lote[pk], 0) + delta
+        _somar(Produto, 'quantidade_total', deltas_produto)
+
+        # update() não dispara post_save; os relatórios de estoque em cache dependem dos dois
+        transaction.on_commit(lambda: [cache_pdf.invalidar_modelo(modelo) for modelo in (EstoqueMedicamento, Produto)])
+
+    return {pk: saldos[pk] + delta for pk, delta in deltas.items()}
+
+
+def travar_produtos(pks):
+    """Trava os medicamentos (Produto) em ordem de pk; deve vir antes de travar os lotes deles."""
+    list(Produto.objects.select_for_update().filter(pk__in=set(pks)).order_by('pk').values_list('pk'))
+
+
+def _somar(modelo, campo, deltas):
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    if len(deltas) == 1:
+        [(pk, delta)] = deltas.items()
+        incremento = models.Value(delta)
+    else:
+        incremento = models.Case(
+            *(models.When(pk=pk, then=models.Value(delta)) for pk, delta in deltas.items()),
+            default=models.Value(0),
+        )
+    modelo.objects.filter(pk__in=deltas).update(**{campo: models.F(campo) + incremento})
+
+
+def totais_pelos_lotes(produtos=None):
+    """Medicamentos anotados com `soma_lotes`, a soma dos saldos dos seus lotes."""
+    produtos = Produto.objects.all() if produtos is None else produtos
+    soma = (
+        EstoqueMedicamento.objects.filter(produto=models.OuterRef('pk'))
+        .order_by().values('produto').annotate(total=models.Sum('quantidade')).values('total')
+    )
+    return produtos.annotate(soma_lotes=Coalesce(models.Subquery(soma), 0))
+
+
+def recalcular_totais(produtos):
+    """Refaz Produto.quantidade_total a partir dos lotes (pks de `produtos`) e retorna os divergentes corrigidos."""
+    with transaction.atomic():
+        pks = set(produtos)
+        travar_produtos(pks)
+        divergentes = list(
+            totais_pelos_lotes(Produto.objects.filter(pk__in=pks))
+            .exclude(quantidade_total=models.F('soma_lotes')).order_by('pk')
+        )
+        _somar(Produto, 'quantidade_total', {p.pk: p.soma_lotes - p.quantidade_total for p in divergentes})
+        if divergentes:
+            transaction.on_commit(lambda: cache_pdf.invalidar_modelo(Produto))
+    return divergentes
+
+
+def conciliar_totais(corrigir=False):
+    """Medicamentos cujo total registrado difere da soma dos lotes; com `corrigir`, ajusta o total."""
+    divergentes = list(totais_pelos_lotes().exclude(quantidade_total=models.F('soma_lotes')).order_by('pk'))
+    if corrigir and divergentes:
+        divergentes = recalcular_totais(p.pk for p in divergentes)
+    return divergentes
+
+
+def saldo_do_medicamento(nome):
+    """Total em estoque do medicamento, lido do total mantido em Produto (busca pelo nome indexado)."""
+    return Produto.objects.filter(nome=nome).values_list('quantidade_total', flat=True).first() or 0
+
+
+def estornar_saidas(queryset, campo_lote, quantidade, descricao):
+    """Devolve ao estoque o que os registros de `queryset` consumiram, antes de excluí-los.
+
+    `campo_lote` é o FK para EstoqueMedicamento e `quantidade` a agregação do que cada registro
+    consumiu (Count('pk') para registros de uma dose, Sum(...) para quantidades variáveis).
+    Gera uma ENTRADA por lote, com uma única consulta de agregação, e aplica todas de uma vez.
+    """
+    consumo = (
+        queryset.order_by().exclude(**{campo_lote: None})
+        .values_list(campo_lote)
+        .annotate(registros=models.Count('pk'), total=quantidade)
+    )
+    estornos = {lote: (registros, total) for lote, registros, total in consumo if total}
+    if not estornos:
+        return
+
+    with transaction.atomic():
+        MovimentoEstoqueMedicamento.objects.bulk_create(
+            MovimentoEstoqueMedicamento(
+                estoque_item_id=lote,
+                tipo=MovimentoEstoqueMedicamento.ENTRADA,
+                quantidade=total,
+                observacao=f"Estorno por exclusão em massa de {registros} {descricao}.",
+            )
+            for lote, (registros, total) in estornos.items()
+        )
+        aplicar_deltas({lote: total for lote, (_, total) in estornos.items()})
+
+
+def efeito_no_saldo():
+    """Expressão com o efeito do movimento no saldo: +quantidade na entrada, -quantidade na saída."""
+    return models.Case(
+        models.When(tipo=MovimentoEstoqueMedicamento.ENTRADA, then=models.F('quantidade')),
+        default=-models.F('quantidade'),
+        output_field=models.IntegerField(),
+    )
+
+
+def saldos_pelo_livro(lotes=None, ate=None):
+    """Lotes anotados com `saldo_livro`: último consolidado (até `ate`) + movimentos posteriores."""
+    lotes = EstoqueMedicamento.objects.all() if lotes is None else lotes
+    consolidado = SaldoConsolidado.objects.filter(estoque_item=models.OuterRef('pk'))
+    movimentos = MovimentoEstoqueMedicamento.objects.filter(
+        estoque_item=models.OuterRef('pk'), data__gte=models.OuterRef('corte'),
+    )
+    if ate is not None:
+        consolidado = consolidado.filter(ate__lte=ate)
+        movimentos = movimentos.filter(data__lt=ate)
+    consolidado = consolidado.order_by('-ate')
+    efeito = movimentos.order_by().values('estoque_item').annotate(total=models.Sum(efeito_no_saldo())).values('total')
+
+    return lotes.annotate(
+        corte=Coalesce(models.Subquery(consolidado.values('ate')[:1]), models.Value(INICIO_DO_LIVRO)),
+        saldo_consolidado=Coalesce(models.Subquery(consolidado.values('saldo')[:1]), 0),
+    ).annotate(
+        saldo_livro=models.F('saldo_consolidado') + Coalesce(models.Subquery(efeito), 0),
+    )
+
+
+@dataclass
+class Divergencia:
+    lote: EstoqueMedicamento
+    registrado: int
+    calculado: int
+
+    @property
+    def diferenca(self):
+        return self.registrado - self.calculado
+
+
+def conciliar(corrigir=False):
+    """Compara o saldo registrado de cada lote com o livro e retorna as divergências.
+
+    A comparação é uma única consulta (uma só visão do banco), então movimentos lançados durante
+    a execução não aparecem como divergência. Com `corrigir`, os lotes divergentes são travados
+    e recalculados antes de ajustar o saldo registrado para o valor do livro.
+    """
+    divergentes = saldos_pelo_livro(EstoqueMedicamento.objects.select_related('produto')).exclude(quantidade=models.F('saldo_livro')).order_by('pk')
+    divergencias = [Divergencia(lote, lote.quantidade, lote.saldo_livro) for lote in divergentes]
+    if not corrigir or not divergencias:
+        return divergencias
+
+    with transaction.atomic():
+        pks = [d.lote.pk for d in divergencias]
+        produtos = set(EstoqueMedicamento.objects.filter(pk__in=pks).values_list('produto_id', flat=True))
+        travar_produtos(produtos)
+        list(EstoqueMedicamento.objects.select_for_update().filter(pk__in=pks).order_by('pk').values_list('pk'))
+        # Com os lotes travados nenhum movimento novo entra neles; o recálculo vale até o commit
+        divergentes = saldos_pelo_livro(EstoqueMedicamento.objects.select_related('produto').filter(pk__in=pks)).exclude(quantidade=models.F('saldo_livro'))
+        divergencias = [Divergencia(lote, lote.quantidade, lote.saldo_livro) for lote in divergentes.order_by('pk')]
+        aplicar_deltas({d.lote.pk: -d.diferenca for d in divergencias})
+        # aplicar_deltas() também levou a correção ao total do medicamento; ele é refeito pela soma dos lotes
+        recalcular_totais(produtos)
+    return divergencias
+
+
+def registrar_saldos(agora=None):
+    """Grava um SaldoConsolidado para cada lote com movimentos desde o consolidado anterior.
+
+    Retorna quantos consolidados foram gravados.
+    """
+    agora = agora or timezone.now()
+    ate = agora - timedelta(seconds=settings.ESTOQUE_MARGEM_CONSOLIDACAO)
+    houve_movimento = MovimentoEstoqueMedicamento.objects.filter(
+        estoque_item=models.OuterRef('pk'), data__gte=models.OuterRef('corte'), data__lt=ate,
+    )
+    lotes = (
+        saldos_pelo_livro(ate=ate)
+        .filter(models.Exists(houve_movimento))
+        .values_list('pk', 'saldo_livro')
+    )
+    novos = SaldoConsolidado.objects.bulk_create(
+        [SaldoConsolidado(estoque_item_id=pk, ate=ate, saldo=saldo) for pk, saldo in lotes],
+        ignore_conflicts=True,
+    )
+    return len(novos)
+
+
+def descartar_consolidados(lotes, desde):
+    """Remove consolidados que incluíam movimentos (de `lotes`, a partir de `desde`) que foram excluídos."""
+    SaldoConsolidado.objects.filter(estoque_item__in=lotes, ate__gt=desde).delete()
+
+
+# --- DISPENSAÇÃO FEFO (primeiro a vencer, primeiro a sair) ---
+# Consultas, vacinações e vermífugos informam o medicamento (Produto) e a quantidade; os lotes
+# saem daqui. Os candidatos vêm do índice parcial estoque_fefo_disponivel (lotes com saldo, por
+# medicamento e validade) e só os lotes efetivamente usados são travados, depois dos seus
+# medicamentos e em ordem de pk como em aplicar_deltas(), então dispensações simultâneas não
+# entram em deadlock.
+
+@dataclass
+class Alocacao:
+    lote: EstoqueMedicamento
+    quantidade: int
+
+
+def lotes_disponiveis(lotes=None, hoje=None):
+    """Lotes com saldo e dentro da validade, na ordem em que devem ser usados."""
+    lotes = EstoqueMedicamento.objects.all() if lotes is None else lotes
+    hoje = hoje or timezone.localdate()
+    return lotes.filter(quantidade__gt=0, data_validade__gte=hoje).order_by('data_validade', 'pk')
+
+
+def disponivel_para_dispensar(produto, hoje=None):
+    """Quanto do medicamento (Produto ou pk) está em lotes com saldo e dentro da validade em `hoje`."""
+    lotes = lotes_disponiveis(EstoqueMedicamento.objects.filter(produto=produto), hoje)
+    return lotes.order_by().aggregate(total=Coalesce(models.Sum('quantidade'), 0))['total']
+
+
+def alocar_fefo(produto, quantidade, hoje=None, tentativas=3):
+    """Escolhe e trava os lotes do medicamento que atendem `quantidade`, dividindo entre lotes se preciso.
+
+    Deve ser chamada dentro de uma transação. Levanta ValidationError se os lotes dentro da
+    validade não somam a quantidade pedida.
+    """
+    lotes = EstoqueMedicamento.objects.filter(produto=produto)
+    for _ in range(tentativas):
+        escolhidos, restante = [], quantidade
+        for pk, disponivel in lotes_disponiveis(lotes, hoje).values_list('pk', 'quantidade'):
+            escolhidos.append(pk)
+            restante -= disponivel
+            if restante <= 0:
+                break
+        if restante > 0:
+            raise ValidationError(f"Estoque insuficiente em lotes dentro da validade. Disponível: {quantidade - restante}, Pedido: {quantidade}.")
+
+        travar_produtos(EstoqueMedicamento.objects.filter(pk__in=escolhidos).values_list('produto_id', flat=True))
+        travados = EstoqueMedicamento.objects.select_for_update().filter(pk__in=escolhidos).order_by('pk').in_bulk()
+        alocacoes, restante = [], quantidade
+        for pk in escolhidos:
+            usar = min(travados[pk].quantidade, restante)
+            if usar > 0:
+                alocacoes.append(Alocacao(travados[pk], usar))
+                restante -= usar
+        if restante == 0:
+            return alocacoes
+        # Outra dispensação consumiu os lotes entre a escolha e a trava: escolhe de novo
+    raise ValidationError("Não foi possível reservar os lotes: estoque em uso simultâneo. Tente novamente.")
+
+
+def dispensar(produto, quantidade, observacao, hoje=None):
+    """Dá saída de `quantidade` do medicamento (Produto ou pk) em ordem FEFO e retorna as alocações por lote."""
+    with transaction.atomic():
+        alocacoes = alocar_fefo(produto, quantidade, hoje)
+        MovimentoEstoqueMedicamento.objects.bulk_create(
+            MovimentoEstoqueMedicamento(
+                estoque_item=alocacao.lote, tipo=MovimentoEstoqueMedicamento.SAIDA,
+                quantidade=alocacao.quantidade, observacao=observacao,
+            )
+            for alocacao in alocacoes
+        )
+        saldos = aplicar_deltas({alocacao.lote.pk: -alocacao.quantidade for alocacao in alocacoes})
+        for alocacao in alocacoes:
+            alocacao.lote.quantidade = saldos[alocacao.lote.pk]
+    return alocacoes
+
+
+def redispensar(lote_anterior, quantidade_anterior, observacao_estorno, produto, quantidade, observacao, hoje=None):
+    """Devolve ao `lote_anterior` o que um registro tinha consumido e dispensa de novo em FEFO.
+
+    Usado quando um registro muda de medicamento, de quantidade ou de data. O estorno vem antes,
+    então as unidades devolvidas já podem ser escolhidas de novo. Retorna as novas alocações.
+    """
+    with transaction.atomic():
+        if lote_anterior is not None and quantidade_anterior:
+            MovimentoEstoqueMedicamento.objects.create(
+                estoque_item=lote_anterior, tipo=MovimentoEstoqueMedicamento.ENTRADA,
+                quantidade=quantidade_anterior, observacao=observacao_estorno,
+            )
+        if produto is None or not quantidade:
+            return []
+        return dispensar(produto, quantidade, observacao, hoje)
@@ -0,0 +1,71 @@
+# MariaAlvezApp/exportacao.py
+
+import csv
+import tempfile
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+
+
+class _Eco:
+    # Pseudo-buffer para o csv.writer: devolve a linha em vez de guardá-la,
+    # assim cada linha vai direto para a resposta sem acumular em memória.
+    def write(self, valor):
+        return valor
+
+
+def formatar_texto(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, bool):
+        return 'Sim' if valor else 'Não'
+    if isinstance(valor, datetime):
+        return timezone.localtime(valor).strftime('%d/%m/%Y %H:%M')
+    if isinstance(valor, date):
+        return valor.strftime('%d/%m/%Y')
+    if isinstance(valor, Decimal):
+        return str(valor).replace('.', ',')
+    return valor
+
+
+def _formatar_xlsx(valor):
+    # O openpyxl não aceita datetimes com fuso; grava no horário local
+    if isinstance(valor, datetime) and timezone.is_aware(valor):
+        return timezone.make_naive(valor)
+    return valor
+
+
+def resposta_csv(relatorio):
+    writer = csv.writer(_Eco(), delimiter=';')
+
+    def gerar():
+        # BOM para o Excel reconhecer o UTF-8 (acentos) ao abrir o arquivo
+        yield '\ufeff'
+        for linha in relatorio.linhas_exportacao():
+            yield writer.writerow([formatar_texto(valor) for valor in linha])
+
+    response = StreamingHttpResponse(gerar(), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="relatorio_{relatorio.nome}.csv"'
+    return response
+
+
+def resposta_xlsx(relatorio):
+    from openpyxl import Workbook
+
+    # write_only grava as linhas em disco conforme chegam; a memória não cresce com o relatório
+    workbook = Workbook(write_only=True)
+    planilha = workbook.create_sheet(title=relatorio.nome[:31])
+    for linha in relatorio.linhas_exportacao():
+        planilha.append([_formatar_xlsx(valor) for valor in linha])
+
+    arquivo = tempfile.TemporaryFile(suffix='.xlsx')
+    workbook.save(arquivo)
+    arquivo.seek(0)
+    return FileResponse(
+        arquivo,
+        as_attachment=True,
+        filename=f'relatorio_{relatorio.nome}.xlsx',
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    )
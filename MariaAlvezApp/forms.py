@@ -1,14 +1,55 @@
 from django import forms
-from .models import Tutor, Animal, EstoqueMedicamento, AgendamentoConsultas
+from django.core.exceptions import ValidationError
+from django.urls import reverse, reverse_lazy
+from . import agenda
+from .models import Tutor, Animal, EstoqueMedicamento, Produto, AgendamentoConsultas
 from Terceiros.models import EmpresaTerceirizada, RegistroServico #
 from django.utils import timezone
-from datetime import time, datetime, timedelta
+from datetime import time, datetime
+
+
+class SelecaoAutocomplete(forms.Select):
+    # Renderiza só a opção vazia e a opção já escolhida; as demais são buscadas pelo
+    # navegador no endpoint de autocomplete (ver autocomplete.py e js/autocomplete_filtro.js)
+    class Media:
+        js = ('js/autocomplete_filtro.js',)
+
+    def __init__(self, fonte, attrs=None):
+        super().__init__(attrs)
+        self.fonte = fonte
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['attrs']['data-autocomplete-url'] = reverse('autocomplete', args=[self.fonte])
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        field = self.choices.field
+        escolhidos = []
+        valores = [v for v in value if v]
+        if valores:
+            try:
+                escolhidos = list(self.choices.queryset.filter(pk__in=valores))
+            except (ValueError, TypeError, ValidationError):
+                escolhidos = []
+        opcoes = [('', field.empty_label)] if field.empty_label is not None else []
+        opcoes += [(obj.pk, field.label_from_instance(obj)) for obj in escolhidos]
+        return [
+            (None, [self.create_option(name, v, rotulo, str(v) in value, indice, attrs=attrs)], indice)
+            for indice, (v, rotulo) in enumerate(opcoes)
+        ]
+
+
+def campo_autocomplete(fonte, queryset, label):
+    return forms.ModelChoiceField(queryset=queryset, required=False, label=label, widget=SelecaoAutocomplete(fonte))
+
 
 class FiltroConsultaForm(forms.Form):
     data_inicio = forms.DateField(label="De", required=False, widget=forms.DateInput(attrs={'type': 'date'}))
     data_fim = forms.DateField(label="Até", required=False, widget=forms.DateInput(attrs={'type': 'date'}))
-    tutor = forms.ModelChoiceField(queryset=Tutor.objects.all(), required=False, label="Tutor")
-    animal = forms.ModelChoiceField(queryset=Animal.objects.all(), required=False, label="Animal")
+    tutor = campo_autocomplete('tutor', Tutor.objects.all(), "Tutor")
+    animal = campo_autocomplete('animal', Animal.objects.select_related('tutor'), "Animal")
+    busca = forms.CharField(required=False, label="Buscar no Diagnóstico/Observações")
 
 class FiltroEstoqueForm(forms.Form):
     medicamento = forms.CharField(label="Nome do Medicamento", required=False, max_length=255)
@@ -24,8 +65,15 @@ class FiltroEstoqueForm(forms.Form):
     ]
     status_estoque = forms.ChoiceField(choices=STATUS_CHOICES, required=False, label="Status do Estoque")
 
+class FiltroEstoqueHistoricoForm(forms.Form):
+    data = forms.DateField(label="Saldo em", required=False, help_text="Fim do dia informado. Em branco: hoje.", widget=forms.DateInput(attrs={'type': 'date'}))
+    medicamento = forms.CharField(label="Nome do Medicamento", required=False, max_length=255)
+    lote = forms.CharField(label="Lote", required=False, max_length=100)
+    tipo_medicamento = forms.ChoiceField(choices=[('', 'Todos')] + Produto.TIPOS_MEDICAMENTO, required=False, label="Tipo de Medicamento")
+    somente_com_saldo = forms.BooleanField(label="Somente lotes com saldo na data", required=False)
+
 class FiltroVacinacaoForm(forms.Form):
-    animal = forms.ModelChoiceField(queryset=Animal.objects.all(), required=False, label="Animal")
+    animal = campo_autocomplete('animal', Animal.objects.select_related('tutor'), "Animal")
     data_aplicacao_inicio = forms.DateField(label="Aplicação De", required=False, widget=forms.DateInput(attrs={'type': 'date'}))
     data_aplicacao_fim = forms.DateField(label="Aplicação Até", required=False, widget=forms.DateInput(attrs={'type': 'date'}))
     STATUS_REVACINACAO_CHOICES = [
@@ -36,14 +84,10 @@ class FiltroVacinacaoForm(forms.Form):
         ('nao_definida', 'Não Definida'),
     ]
     status_revacinacao = forms.ChoiceField(choices=STATUS_REVACINACAO_CHOICES, required=False, label="Status Revacinação")
-    medicamento = forms.ModelChoiceField(
-        queryset=EstoqueMedicamento.objects.all(),
-        required=False,
-        label="Medicamento/Lote"
-    )
+    medicamento = campo_autocomplete('medicamento', EstoqueMedicamento.objects.select_related('produto'), "Medicamento/Lote")
 
 class FiltroVermifugosForm(forms.Form):
-    animal = forms.ModelChoiceField(queryset=Animal.objects.all(), required=False, label="Animal")
+    animal = campo_autocomplete('animal', Animal.objects.select_related('tutor'), "Animal")
     data_administracao_inicio = forms.DateField(label="Administração De", required=False, widget=forms.DateInput(attrs={'type': 'date'}))
     data_administracao_fim = forms.DateField(label="Administração Até", required=False, widget=forms.DateInput(attrs={'type': 'date'}))
     STATUS_READMIN_CHOICES = [
@@ -54,26 +98,21 @@ class FiltroVermifugosForm(forms.Form):
         ('nao_definida', 'Não Definida'),
     ]
     status_readministracao = forms.ChoiceField(choices=STATUS_READMIN_CHOICES, required=False, label="Status Readministração")
-    medicamento = forms.ModelChoiceField(
-        queryset=EstoqueMedicamento.objects.all(),
-        required=False,
-        label="Medicamento/Lote"
-    )
+    medicamento = campo_autocomplete('medicamento', EstoqueMedicamento.objects.select_related('produto'), "Medicamento/Lote")
+
+class FiltroAgendaHorariosForm(forms.Form):
+    data = forms.DateField(label="Data")
+    semana = forms.BooleanField(required=False, help_text="Semana inteira (segunda a domingo) da data.")
+    veterinario = forms.IntegerField(required=False, min_value=1)
+    animal = forms.IntegerField(required=False, min_value=1)
+    castracao = forms.BooleanField(required=False)
+    excluir = forms.IntegerField(required=False, min_value=1, help_text="Agendamento em edição, ignorado na ocupação.")
 
 class EstoqueMedicamentoForm(forms.ModelForm):
     class Meta:
         model = EstoqueMedicamento
         fields = '__all__'
 
-    def clean_lote(self):
-        lote = self.cleaned_data['lote']
-        qs = EstoqueMedicamento.objects.filter(lote=lote)
-        if self.instance.pk:
-            qs = qs.exclude(pk=self.instance.pk)
-        if qs.exists():
-            raise forms.ValidationError("Este lote já está cadastrado para outro medicamento.")
-        return lote
-
 class AgendamentoConsultasForm(forms.ModelForm):
     data_consulta_date = forms.DateField(
         label="Data da Consulta",
@@ -81,26 +120,23 @@ class AgendamentoConsultasForm(forms.ModelForm):
         required=True
     )
 
-    HORA_CHOICES = []
-    # Lógica para popular HORA_CHOICES (horas de 08:00 a 18:00, a cada 15 minutos)
-    start_time = datetime.strptime("08:00", "%H:%M").time()
-    end_time = datetime.strptime("18:00", "%H:%M").time() 
-    current_time = start_time
-
-    while current_time <= end_time:
-        HORA_CHOICES.append((current_time.strftime("%H:%M"), current_time.strftime("%H:%M")))
-        current_datetime = datetime.combine(datetime.min, current_time) + timedelta(minutes=15)
-        current_time = current_datetime.time()
+    # Grade de horários da agenda (AGENDA_INICIO a AGENDA_FIM, a cada AGENDA_INTERVALO_MINUTOS)
+    HORA_CHOICES = [(hora.strftime("%H:%M"), hora.strftime("%H:%M")) for hora in agenda.grade()]
 
+    # O navegador marca como ocupados os horários sem vaga (ver js/agenda_horarios.js)
     hora_consulta = forms.ChoiceField(
         label="Hora da Consulta",
         choices=HORA_CHOICES,
         required=True,
+        widget=forms.Select(attrs={'data-horarios-url': reverse_lazy('api_agenda_horarios')}),
     )
 
     class Meta:
         model = AgendamentoConsultas
-        fields = ['animal', 'data_consulta_date', 'hora_consulta', 'is_castracao']
+        fields = ['animal', 'veterinario', 'data_consulta_date', 'hora_consulta', 'is_castracao']
+
+    class Media:
+        js = ('js/agenda_horarios.js',)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -123,6 +159,9 @@ class AgendamentoConsultasForm(forms.ModelForm):
             self.fields['hora_consulta'].initial = local_data_consulta.strftime("%H:%M")
             print(f"DEBUG FORM: Set hora_consulta initial to: {self.fields['hora_consulta'].initial}")
 
+            # A ocupação mostrada no navegador ignora o próprio agendamento
+            self.fields['hora_consulta'].widget.attrs['data-excluir'] = self.instance.pk
+
         else: # Se é um novo agendamento
             # Preenche a data com a data atual (padrão para novos formulários)
             self.fields['data_consulta_date'].initial = timezone.now().date()
@@ -175,20 +214,17 @@ class AgendamentoConsultasForm(forms.ModelForm):
             if combined_datetime < timezone.now():
                 self.add_error('data_consulta_date', "A data da consulta não pode estar no passado.")
             
-            # Validação de agendamentos duplicados para o mesmo animal no mesmo horário
-            if animal:
-                # Remove segundos e microssegundos para a comparação (para coincidir com a precisão do ChoiceField)
-                data_hora_comparacao = combined_datetime.replace(second=0, microsecond=0)
-                
-                qs = AgendamentoConsultas.objects.filter(
-                    animal=animal,
-                    data_consulta=data_hora_comparacao
-                )
-                if self.instance.pk: # Se estiver editando, exclui a própria instância da checagem
-                    qs = qs.exclude(pk=self.instance.pk)
-                
-                if qs.exists():
-                    self.add_error('hora_consulta', "Já existe uma consulta agendada para este animal nesse horário.")
+            # Conflito com a agenda do animal ou do veterinário, ou horário sem vaga (uma consulta pelo dia)
+            veterinario = cleaned_data.get('veterinario')
+            motivo = agenda.conflito(
+                combined_datetime,
+                veterinario=veterinario.pk if veterinario else None,
+                animal=animal.pk if animal else None,
+                is_castracao=cleaned_data.get('is_castracao', False),
+                excluir=self.instance.pk,
+            )
+            if motivo:
+                self.add_error('hora_consulta', motivo)
 
         # Atribui combined_datetime a cleaned_data['data_consulta']
         # Isso garante que o valor combinado seja passado para o save() do ModelForm
@@ -206,14 +242,14 @@ class AgendamentoConsultasForm(forms.ModelForm):
         return instance
     
 class FiltroRegistroServicoForm(forms.Form):
-    animal = forms.ModelChoiceField(queryset=Animal.objects.all(), required=False, label="Animal Atendido")
-    empresa = forms.ModelChoiceField(queryset=EmpresaTerceirizada.objects.all(), required=False, label="Empresa Prestadora")
+    animal = campo_autocomplete('animal', Animal.objects.select_related('tutor'), "Animal Atendido")
+    empresa = campo_autocomplete('empresa', EmpresaTerceirizada.objects.all(), "Empresa Prestadora")
     data_inicio = forms.DateField(label="Data Início", required=False, widget=forms.DateInput(attrs={'type': 'date'}))
     data_fim = forms.DateField(label="Data Fim", required=False, widget=forms.DateInput(attrs={'type': 'date'}))
     busca_texto = forms.CharField(label="Buscar em Descrição/Medicamentos", required=False, max_length=255)
 
 class FiltroFilaCastracaoForm(forms.Form):
-    animal = forms.ModelChoiceField(queryset=Animal.objects.all(), required=False, label="Animal")
-    tutor = forms.ModelChoiceField(queryset=Tutor.objects.all(), required=False, label="Tutor")
+    animal = campo_autocomplete('animal', Animal.objects.select_related('tutor'), "Animal")
+    tutor = campo_autocomplete('tutor', Tutor.objects.all(), "Tutor")
     data_inicio = forms.DateField(label="Agendamento De", required=False, widget=forms.DateInput(attrs={'type': 'date'}))
     data_fim = forms.DateField(label="Agendamento Até", required=False, widget=forms.DateInput(attrs={'type': 'date'}))
\ No newline at end of file
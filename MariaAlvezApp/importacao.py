@@ -0,0 +1,333 @@
+# MariaAlvezApp/importacao.py
+#
+# Importação em lote de tutores e animais (CSV ou XLSX), usada pelo comando `importar_cadastros`
+# e pela tela de importação do admin de tutores. Cada linha traz os dados de um tutor e,
+# opcionalmente, de um animal dele. As linhas são validadas em lotes: os CEPs do lote são
+# resolvidos uma vez cada (ver cep.resolver_varios), tutores já cadastrados são encontrados pelo
+# CPF normalizado e os registros novos entram com bulk_create, uma transação por lote. Linhas
+# inválidas são reportadas e não interrompem a importação.
+
+import csv
+import io
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+
+from . import cep as servico_cep
+from .cache_pdf import invalidar_modelo
+from .models import Animal, Tutor
+
+TAMANHO_LOTE = 2000
+
+# Coluna -> nomes aceitos no cabeçalho (sem diferenciar maiúsculas/minúsculas)
+COLUNAS = {
+    'tutor_nome': ('tutor_nome', 'nome_tutor', 'tutor'),
+    'cpf': ('cpf', 'tutor_cpf'),
+    'telefone': ('telefone', 'tutor_telefone'),
+    'tutor_data_nascimento': ('tutor_data_nascimento', 'data_nascimento_tutor'),
+    'cep': ('cep', 'tutor_cep'),
+    'animal_nome': ('animal_nome', 'nome_animal', 'animal'),
+    'especie': ('especie', 'espécie'),
+    'sexo': ('sexo',),
+    'animal_data_nascimento': ('animal_data_nascimento', 'data_nascimento_animal'),
+    'idade_anos': ('idade_anos',),
+    'idade_meses': ('idade_meses',),
+    'peso': ('peso',),
+    'castrado': ('castrado',),
+    'rfid': ('rfid',),
+}
+COLUNAS_OBRIGATORIAS = ('tutor_nome', 'cpf', 'telefone', 'tutor_data_nascimento', 'cep')
+SEXOS = {'m': 'M', 'macho': 'M', 'f': 'F', 'femea': 'F', 'fêmea': 'F'}
+VERDADEIRO = {'1', 's', 'sim', 'x', 'true', 'verdadeiro'}
+
+
+class ResultadoImportacao:
+    def __init__(self):
+        self.linhas = 0
+        self.tutores_criados = 0
+        self.tutores_existentes = 0
+        self.animais_criados = 0
+        self.animais_existentes = 0
+        self.erros = []  # (número da linha no arquivo, mensagem)
+
+    def adicionar_erro(self, linha, mensagem):
+        self.erros.append((linha, mensagem))
+
+    def __str__(self):
+        return (
+            f"{self.linhas} linha(s): {self.tutores_criados} tutor(es) criado(s) e {self.tutores_existentes} já cadastrado(s); "
+            f"{self.animais_criados} animal(is) criado(s) e {self.animais_existentes} já cadastrado(s); {len(self.erros)} linha(s) com erro."
+        )
+
+
+# --- LEITURA DO ARQUIVO ---
+
+def _linhas_csv(arquivo):
+    texto = arquivo
+    if isinstance(arquivo.read(0), bytes):
+        texto = io.TextIOWrapper(arquivo, encoding='utf-8-sig', newline='')
+    try:
+        amostra = texto.read(8192)
+        texto.seek(0)
+        try:
+            dialeto = csv.Sniffer().sniff(amostra, delimiters=',;\t|')
+        except csv.Error:
+            dialeto = csv.excel
+        yield from csv.reader(texto, dialeto)
+    finally:
+        # Não fecha o arquivo de quem chamou junto com o TextIOWrapper
+        if texto is not arquivo:
+            texto.detach()
+
+
+def _linhas_xlsx(arquivo):
+    from openpyxl import load_workbook
+
+    try:
+        planilha = load_workbook(arquivo, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, KeyError, OSError) as exc:
+        raise ValueError(f"Planilha XLSX inválida: {exc}")
+    try:
+        yield from planilha.active.iter_rows(values_only=True)
+    finally:
+        planilha.close()
+
+
+def ler_linhas(arquivo, nome_arquivo):
+    """Gera (número da linha no arquivo, {coluna: valor}) a partir de um CSV ou XLSX com cabeçalho."""
+    linhas = _linhas_xlsx(arquivo) if nome_arquivo.lower().endswith('.xlsx') else _linhas_csv(arquivo)
+    cabecalho = next(linhas, None)
+    if cabecalho is None:
+        raise ValueError("O arquivo está vazio.")
+
+    sinonimos = {nome: coluna for coluna, nomes in COLUNAS.items() for nome in nomes}
+    indices = {}
+    for indice, nome in enumerate(cabecalho):
+        coluna = sinonimos.get(str(nome or '').strip().lower())
+        if coluna and coluna not in indices:
+            indices[coluna] = indice
+    faltando = [coluna for coluna in COLUNAS_OBRIGATORIAS if coluna not in indices]
+    if faltando:
+        raise ValueError(f"Colunas obrigatórias ausentes: {', '.join(faltando)}.")
+
+    for numero, valores in enumerate(linhas, start=2):
+        if all(valor in (None, '') for valor in valores):
+            continue
+        yield numero, {coluna: valores[indice] if indice < len(valores) else None for coluna, indice in indices.items()}
+
+
+# --- CONVERSÃO E VALIDAÇÃO DE UMA LINHA ---
+
+def _texto(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    return str(valor).strip()
+
+
+def _digitos(valor, tamanho):
+    digitos = re.sub(r'\D', '', _texto(valor))
+    # Planilhas gravam CPF/CEP como número e perdem os zeros à esquerda
+    if isinstance(valor, (int, float)):
+        digitos = digitos.zfill(tamanho)
+    return digitos
+
+
+def _data(valor, campo):
+    if isinstance(valor, datetime):
+        return valor.date()
+    if isinstance(valor, date):
+        return valor
+    texto = _texto(valor)
+    if not texto:
+        return None
+    for formato in ('%d/%m/%Y', '%Y-%m-%d'):
+        try:
+            return datetime.strptime(texto, formato).date()
+        except ValueError:
+            pass
+    raise ValidationError({campo: f"Data inválida: {texto}. Use DD/MM/AAAA."})
+
+
+def _inteiro(valor, campo):
+    texto = _texto(valor)
+    if not texto:
+        return 0
+    if not texto.isdigit():
+        raise ValidationError({campo: f"Número inválido: {texto}."})
+    return int(texto)
+
+
+def _decimal(valor, campo):
+    texto = _texto(valor).replace(',', '.')
+    if not texto:
+        return Decimal(0)
+    try:
+        return Decimal(texto)
+    except InvalidOperation:
+        raise ValidationError({campo: f"Número inválido: {texto}."})
+
+
+def _mensagem(exc):
+    if hasattr(exc, 'error_dict'):
+        return "; ".join(f"{campo}: {' '.join(mensagens)}" for campo, mensagens in exc.message_dict.items())
+    return " ".join(exc.messages)
+
+
+def _preparar_tutor(dados):
+    # Mesmas regras do Tutor.clean(); o endereço é preenchido depois, com os CEPs do lote já resolvidos
+    tutor = Tutor(
+        nome=_texto(dados['tutor_nome']),
+        cpf=_digitos(dados['cpf'], 11),
+        telefone=_texto(dados['telefone']),
+        data_nascimento=_data(dados['tutor_data_nascimento'], 'data_nascimento'),
+        cep=_digitos(dados['cep'], 8),
+    )
+    tutor.validar_data_nascimento()
+    tutor.aplicar_mascaras()
+    return tutor
+
+
+def _preparar_animal(dados):
+    nome = _texto(dados.get('animal_nome'))
+    if not nome:
+        return None
+    especie = _texto(dados.get('especie'))
+    if not especie:
+        raise ValidationError({'especie': "Informe a espécie do animal."})
+    sexo = SEXOS.get(_texto(dados.get('sexo')).lower())
+    if sexo is None:
+        raise ValidationError({'sexo': "Use M (macho) ou F (fêmea)."})
+
+    animal = Animal(
+        nome=nome,
+        especie=especie,
+        sexo=sexo,
+        data_nascimento=_data(dados.get('animal_data_nascimento'), 'data_nascimento'),
+        idade_anos=_inteiro(dados.get('idade_anos'), 'idade_anos'),
+        idade_meses=_inteiro(dados.get('idade_meses'), 'idade_meses'),
+        peso=_decimal(dados.get('peso'), 'peso'),
+        castrado=_texto(dados.get('castrado')).lower() in VERDADEIRO,
+        rfid=_texto(dados.get('rfid')) or None,
+    )
+    animal.clean()
+    animal.clean_fields(exclude=['tutor'])
+    return animal
+
+
+def _cpf(tutor):
+    return re.sub(r'\D', '', tutor.cpf)
+
+
+# --- IMPORTAÇÃO ---
+
+def _processar_lote(lote, tutores_por_cpf, resultado):
+    preparados = []
+    for numero, dados in lote:
+        try:
+            preparados.append((numero, _preparar_tutor(dados), _preparar_animal(dados)))
+        except ValidationError as exc:
+            resultado.adicionar_erro(numero, _mensagem(exc))
+
+    # Tutores já cadastrados: uma consulta por lote (o CPF pode estar gravado com ou sem máscara)
+    cpfs_novos = {_cpf(tutor) for _, tutor, _ in preparados} - tutores_por_cpf.keys()
+    if cpfs_novos:
+        candidatos = [*cpfs_novos, *(f"{c[:3]}.{c[3:6]}.{c[6:9]}-{c[9:]}" for c in cpfs_novos)]
+        for pk, cpf in Tutor.objects.filter(cpf__in=candidatos).values_list('pk', 'cpf'):
+            tutores_por_cpf[re.sub(r'\D', '', cpf)] = pk
+            resultado.tutores_existentes += 1
+
+    # Só os tutores que serão criados precisam de endereço: cada CEP distinto é resolvido uma vez
+    enderecos = servico_cep.resolver_varios(
+        {re.sub(r'\D', '', tutor.cep) for _, tutor, _ in preparados if _cpf(tutor) not in tutores_por_cpf}
+    )
+
+    novos_tutores = {}
+    validos = []
+    for numero, tutor, animal in preparados:
+        cpf = _cpf(tutor)
+        if cpf not in tutores_por_cpf and cpf not in novos_tutores:
+            endereco = enderecos[re.sub(r'\D', '', tutor.cep)]
+            try:
+                if isinstance(endereco, servico_cep.CEPNaoEncontrado):
+                    raise ValidationError({'cep': "CEP não encontrado."})
+                if isinstance(endereco, Exception):
+                    raise ValidationError({'cep': "Erro ao buscar o endereço. Verifique sua conexão."})
+                tutor.preencher_endereco(endereco)
+                tutor.validar_estado()
+                tutor.clean_fields()
+            except ValidationError as exc:
+                resultado.adicionar_erro(numero, _mensagem(exc))
+                continue
+            novos_tutores[cpf] = tutor
+        validos.append((numero, cpf, animal))
+
+    # Animais já cadastrados (mesmo tutor, nome e espécie) e RFIDs em uso não são duplicados
+    ids_existentes = {tutores_por_cpf[cpf] for _, cpf, _ in validos if cpf in tutores_por_cpf}
+    animais_existentes = set(
+        Animal.objects.filter(tutor_id__in=ids_existentes).values_list('tutor_id', 'nome', 'especie')
+    )
+    rfids = {animal.rfid for _, _, animal in validos if animal and animal.rfid}
+    rfids_em_uso = set(Animal.objects.filter(rfid__in=rfids).values_list('rfid', flat=True)) if rfids else set()
+
+    try:
+        with transaction.atomic():
+            Tutor.objects.bulk_create(novos_tutores.values())
+            for cpf, tutor in novos_tutores.items():
+                tutores_por_cpf[cpf] = tutor.pk
+
+            animais = []
+            for numero, cpf, animal in validos:
+                if animal is None:
+                    continue
+                chave = (tutores_por_cpf[cpf], animal.nome, animal.especie)
+                if chave in animais_existentes:
+                    resultado.animais_existentes += 1
+                    continue
+                if animal.rfid in rfids_em_uso:
+                    resultado.adicionar_erro(numero, f"rfid: O RFID {animal.rfid} já está cadastrado.")
+                    continue
+                animais_existentes.add(chave)
+                if animal.rfid:
+                    rfids_em_uso.add(animal.rfid)
+                animal.tutor_id = tutores_por_cpf[cpf]
+                animais.append(animal)
+            Animal.objects.bulk_create(animais)
+    except IntegrityError as exc:
+        # Ex.: o mesmo CPF cadastrado por outro usuário durante a importação; o lote inteiro é descartado
+        for cpf in novos_tutores:
+            tutores_por_cpf.pop(cpf, None)
+        for numero, _, _ in validos:
+            resultado.adicionar_erro(numero, f"Lote não gravado: {exc}")
+        return
+
+    resultado.tutores_criados += len(novos_tutores)
+    resultado.animais_criados += len(animais)
+
+
+def importar(arquivo, nome_arquivo, tamanho_lote=TAMANHO_LOTE):
+    resultado = ResultadoImportacao()
+    tutores_por_cpf = {}  # CPF (só dígitos) -> pk, de tutores encontrados ou criados nesta importação
+    lote = []
+    for numero, dados in ler_linhas(arquivo, nome_arquivo):
+        resultado.linhas += 1
+        lote.append((numero, dados))
+        if len(lote) >= tamanho_lote:
+            _processar_lote(lote, tutores_por_cpf, resultado)
+            lote = []
+    if lote:
+        _processar_lote(lote, tutores_por_cpf, resultado)
+
+    resultado.erros.sort()
+
+    # bulk_create não dispara post_save: invalida os PDFs/painel que dependem desses cadastros
+    if resultado.tutores_criados:
+        invalidar_modelo(Tutor)
+    if resultado.animais_criados:
+        invalidar_modelo(Animal)
+    return resultado
@@ -0,0 +1,99 @@
+import io
+import json
+import random
+import resource
+import subprocess
+import sys
+import time
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand
+from django.template import Context, Template
+
+from MariaAlvezApp.pdf_tabular import DocumentoTabular
+
+CABECALHO = ('Animal', 'Medicamento', 'Lote', 'Data Aplicação', 'Data Revacinação', 'Dias para Revacinação')
+
+TEMPLATE_HTML = Template("""<html><head><meta charset="utf-8"></head><body>
+<h1>{{ titulo }}</h1>
+<table><thead><tr>{% for coluna in cabecalho %}<th>{{ coluna }}</th>{% endfor %}</tr></thead>
+<tbody>{% for linha in linhas %}<tr>{% for valor in linha %}<td>{{ valor }}</td>{% endfor %}</tr>{% endfor %}</tbody>
+</table><p><strong>Total de registros:</strong> {{ linhas|length }}</p></body></html>""")
+
+
+def linhas_sinteticas(quantidade, semente=42):
+    # Mesmo conjunto de linhas para os dois motores (semente fixa)
+    aleatorio = random.Random(semente)
+    inicio = date(2020, 1, 1)
+    for indice in range(quantidade):
+        aplicacao = inicio + timedelta(days=aleatorio.randrange(365 * 5))
+        revacinacao = aplicacao + timedelta(days=365)
+        yield [
+            f'Animal {indice:06d}',
+            aleatorio.choice(('V8', 'V10', 'Antirrábica', 'Gripe Canina', 'V4 Felina')),
+            f'L{aleatorio.randrange(10 ** 6):06d}',
+            aplicacao.strftime('%d/%m/%Y'),
+            revacinacao.strftime('%d/%m/%Y'),
+            str((revacinacao - date.today()).days),
+        ]
+
+
+def executar_html(quantidade):
+    from MariaAlvezApp.relatorios_pdf import html_para_pdf
+
+    html = TEMPLATE_HTML.render(Context({
+        'titulo': 'Benchmark', 'cabecalho': CABECALHO, 'linhas': list(linhas_sinteticas(quantidade)),
+    }))
+    return html_para_pdf(html, 'http://localhost/')
+
+
+def executar_tabular(quantidade):
+    saida = io.BytesIO()
+    documento = DocumentoTabular(saida, 'Benchmark', CABECALHO)
+    for linha in linhas_sinteticas(quantidade):
+        documento.adicionar_linha(linha)
+    documento.finalizar()
+    return saida.getvalue()
+
+
+MOTORES = {'html': executar_html, 'tabular': executar_tabular}
+
+
+class Command(BaseCommand):
+    help = "Compara tempo e pico de memória dos motores de PDF (WeasyPrint x tabular) com os mesmos dados sintéticos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--linhas', type=int, nargs='+', default=[1000, 10000, 50000])
+        parser.add_argument('--motor', choices=['ambos', *MOTORES], default='ambos')
+        parser.add_argument('--interno', action='store_true', help="Uso interno: mede um único motor e imprime JSON.")
+
+    def handle(self, *args, **options):
+        if options['interno']:
+            motor, quantidade = options['motor'], options['linhas'][0]
+            antes = time.perf_counter()
+            pdf = MOTORES[motor](quantidade)
+            self.stdout.write(json.dumps({
+                'segundos': time.perf_counter() - antes,
+                'pico_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                'tamanho_kb': len(pdf) / 1024,
+            }))
+            return
+
+        motores = list(MOTORES) if options['motor'] == 'ambos' else [options['motor']]
+        self.stdout.write(f"{'motor':<8} {'linhas':>8} {'tempo (s)':>10} {'pico RSS (MB)':>14} {'PDF (KB)':>10}")
+        for quantidade in options['linhas']:
+            for motor in motores:
+                # Cada medição roda num processo novo para o pico de memória não se misturar
+                resultado = subprocess.run(
+                    [sys.executable, sys.argv[0], 'benchmark_relatorios_pdf', '--interno',
+                     '--motor', motor, '--linhas', str(quantidade)],
+                    capture_output=True, text=True,
+                )
+                if resultado.returncode != 0:
+                    self.stderr.write(f"{motor} ({quantidade} linhas) falhou:\n{resultado.stderr}")
+                    continue
+                medida = json.loads(resultado.stdout.strip().splitlines()[-1])
+                self.stdout.write(
+                    f"{motor:<8} {quantidade:>8} {medida['segundos']:>10.2f} "
+                    f"{medida['pico_rss_mb']:>14.1f} {medida['tamanho_kb']:>10.1f}"
+                )
@@ -0,0 +1,46 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+
+from MariaAlvezApp import estoque
+
+
+class Command(BaseCommand):
+    help = (
+        "Confere o saldo de cada lote com o livro de movimentos e o total de cada medicamento com os "
+        "seus lotes, informa as divergências e, opcionalmente, corrige o saldo e grava saldos "
+        "consolidados para as próximas conferências."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--corrigir', action='store_true', help="Ajusta o saldo dos lotes divergentes para o valor do livro.")
+        parser.add_argument('--consolidar', action='store_true', help="Grava saldos consolidados; as próximas conferências só leem os movimentos posteriores.")
+
+    def handle(self, *args, **options):
+        try:
+            divergencias = estoque.conciliar(corrigir=options['corrigir'])
+        except ValidationError as exc:
+            raise CommandError(' '.join(exc.messages))
+
+        for divergencia in divergencias:
+            lote = divergencia.lote
+            self.stdout.write(
+                f"{lote.produto.nome} (Lote: {lote.lote}): registrado {divergencia.registrado}, "
+                f"livro {divergencia.calculado}, diferença {divergencia.diferenca:+d}"
+            )
+
+        if not divergencias:
+            self.stdout.write(self.style.SUCCESS("Nenhuma divergência entre o saldo dos lotes e o livro de movimentos."))
+        elif options['corrigir']:
+            self.stdout.write(self.style.SUCCESS(f"{len(divergencias)} lote(s) corrigido(s)."))
+        else:
+            self.stdout.write(self.style.WARNING(f"{len(divergencias)} lote(s) divergente(s). Use --corrigir para ajustar."))
+
+        # Depois dos lotes: o total de cada medicamento deve ser a soma dos saldos dos seus lotes
+        for produto in estoque.conciliar_totais(corrigir=options['corrigir']):
+            self.stdout.write(
+                f"{produto.nome}: total registrado {produto.quantidade_total}, soma dos lotes {produto.soma_lotes}"
+                + (" (corrigido)" if options['corrigir'] else "")
+            )
+
+        if options['consolidar']:
+            self.stdout.write(f"{estoque.registrar_saldos()} saldo(s) consolidado(s) gravado(s).")
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from MariaAlvezApp import importacao
+
+
+class Command(BaseCommand):
+    help = "Importa tutores e animais em lote a partir de um arquivo CSV ou XLSX."
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help="CSV ou XLSX com cabeçalho (ver COLUNAS em MariaAlvezApp/importacao.py).")
+        parser.add_argument('--lote', type=int, default=importacao.TAMANHO_LOTE, help="Linhas validadas e gravadas por transação.")
+        parser.add_argument('--max-erros', type=int, default=100, help="Quantidade máxima de erros listados na saída.")
+
+    def handle(self, *args, **options):
+        caminho = options['arquivo']
+        try:
+            with open(caminho, 'rb') as arquivo:
+                resultado = importacao.importar(arquivo, caminho, tamanho_lote=options['lote'])
+        except (OSError, UnicodeDecodeError, ValueError) as exc:
+            raise CommandError(str(exc))
+
+        for linha, mensagem in resultado.erros[:options['max_erros']]:
+            self.stderr.write(f"Linha {linha}: {mensagem}")
+        if len(resultado.erros) > options['max_erros']:
+            self.stderr.write(f"... e mais {len(resultado.erros) - options['max_erros']} erro(s).")
+        self.stdout.write(self.style.SUCCESS(str(resultado)))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from MariaAlvezApp import cep
+
+
+class Command(BaseCommand):
+    help = "Importa uma base de CEPs (CSV) para a tabela local usada no preenchimento de endereços."
+
+    def add_arguments(self, parser):
+        parser.add_argument('arquivo', help="CSV com as colunas cep, logradouro, bairro, cidade e uf.")
+        parser.add_argument('--encoding', default='utf-8-sig', help="Codificação do arquivo (padrão: utf-8-sig).")
+        parser.add_argument('--lote', type=int, default=5000, help="Registros gravados por comando INSERT.")
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['arquivo'], encoding=options['encoding'], newline='') as arquivo:
+                importados, ignorados = cep.importar(arquivo, tamanho_lote=options['lote'])
+        except (OSError, UnicodeDecodeError, ValueError) as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(self.style.SUCCESS(f"{importados} CEP(s) importado(s), {ignorados} linha(s) ignorada(s)."))
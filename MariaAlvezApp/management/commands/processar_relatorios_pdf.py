@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from MariaAlvezApp import tarefas_pdf
+
+
+class Command(BaseCommand):
+    help = "Processa a fila de relatórios PDF gerados em segundo plano."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--intervalo', type=float, default=2.0, help="Segundos de espera quando não há tarefas na fila.")
+        parser.add_argument('--intervalo-limpeza', type=int, default=600, help="Segundos entre as limpezas de tarefas antigas.")
+        parser.add_argument('--uma-vez', action='store_true', help="Processa as tarefas pendentes e encerra (útil em cron).")
+
+    def handle(self, *args, **options):
+        ultima_limpeza = 0
+        self.stdout.write("Worker de relatórios PDF iniciado.")
+
+        while True:
+            close_old_connections()
+
+            if time.monotonic() - ultima_limpeza >= options['intervalo_limpeza']:
+                travadas = tarefas_pdf.recuperar_travadas()
+                removidas = tarefas_pdf.limpar_antigas()
+                if travadas or removidas:
+                    self.stdout.write(f"Limpeza: {travadas} tarefa(s) travada(s), {removidas} tarefa(s) antiga(s) removida(s).")
+                ultima_limpeza = time.monotonic()
+
+            tarefa = tarefas_pdf.reservar_proxima()
+            if tarefa is not None:
+                tarefa = tarefas_pdf.processar(tarefa)
+                self.stdout.write(f"Tarefa {tarefa.pk} ({tarefa.relatorio}): {tarefa.get_status_display()}")
+                continue
+
+            if options['uma_vez']:
+                break
+            time.sleep(options['intervalo'])
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:34
+
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MariaAlvezApp', '0008_alter_consultaclinica_diagnostico_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TarefaRelatorioPDF',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('relatorio', models.CharField(max_length=50, verbose_name='Relatório')),
+                ('parametros', models.TextField(blank=True, default='', help_text='Query string com os filtros do relatório', verbose_name='Filtros')),
+                ('base_url', models.CharField(blank=True, default='', max_length=255, verbose_name='URL Base')),
+                ('status', models.CharField(choices=[('pendente', 'Pendente'), ('processando', 'Processando'), ('concluida', 'Concluída'), ('erro', 'Erro')], default='pendente', max_length=20, verbose_name='Status')),
+                ('arquivo', models.FileField(blank=True, null=True, upload_to='relatorios_pdf/', verbose_name='Arquivo PDF')),
+                ('erro', models.TextField(blank=True, default='', verbose_name='Erro')),
+                ('criado_em', models.DateTimeField(auto_now_add=True, verbose_name='Criada em')),
+                ('iniciado_em', models.DateTimeField(blank=True, null=True, verbose_name='Iniciada em')),
+                ('concluido_em', models.DateTimeField(blank=True, null=True, verbose_name='Concluída em')),
+            ],
+            options={
+                'verbose_name': 'Tarefa de Relatório PDF',
+                'verbose_name_plural': 'Tarefas de Relatórios PDF',
+                'indexes': [models.Index(fields=['status', 'criado_em'], name='MariaAlvezA_status_9729ed_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MariaAlvezApp', '0009_tarefarelatoriopdf'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='agendamentoconsultas',
+            index=models.Index(fields=['is_castracao', 'data_consulta'], name='MariaAlvezA_is_cast_08b25c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consultaclinica',
+            index=models.Index(fields=['data_atendimento'], name='MariaAlvezA_data_at_813efb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='consultaclinica',
+            index=models.Index(fields=['animal', 'data_atendimento'], name='MariaAlvezA_animal__dfa992_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='estoquemedicamento',
+            index=models.Index(fields=['data_validade'], name='MariaAlvezA_data_va_b2e946_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registrovacinacao',
+            index=models.Index(fields=['data_aplicacao'], name='MariaAlvezA_data_ap_6b6c30_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registrovacinacao',
+            index=models.Index(fields=['animal', 'data_aplicacao'], name='MariaAlvezA_animal__91136e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registrovacinacao',
+            index=models.Index(fields=['data_revacinacao'], name='MariaAlvezA_data_re_970841_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registrovermifugos',
+            index=models.Index(fields=['data_administracao'], name='MariaAlvezA_data_ad_788e8e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registrovermifugos',
+            index=models.Index(fields=['animal', 'data_administracao'], name='MariaAlvezA_animal__41bb03_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registrovermifugos',
+            index=models.Index(fields=['data_readministracao'], name='MariaAlvezA_data_re_529c25_idx'),
+        ),
+    ]
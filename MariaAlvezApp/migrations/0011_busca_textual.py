@@ -0,0 +1,90 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:45
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# SQL congelado aqui (gerado na época por MariaAlvezApp.busca): mudanças futuras naquele
+# módulo não alteram o que esta migração faz.
+# Extensões unaccent/pg_trgm, configuração portugues_unaccent, triggers e índices (só PostgreSQL).
+SQL_INSTALAR_CONSULTA = [
+    'CREATE EXTENSION IF NOT EXISTS unaccent',
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    '''DO $$ BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'portugues_unaccent') THEN
+            CREATE TEXT SEARCH CONFIGURATION portugues_unaccent (COPY = portuguese);
+            ALTER TEXT SEARCH CONFIGURATION portugues_unaccent
+                ALTER MAPPING FOR hword, hword_part, word WITH unaccent, portuguese_stem;
+        END IF;
+    END $$''',
+    '''CREATE OR REPLACE FUNCTION "MariaAlvezApp_consultaclinica_busca_atualizar"() RETURNS trigger AS $$
+        BEGIN
+            NEW.busca := setweight(to_tsvector('portugues_unaccent', coalesce(NEW."diagnostico", '')), 'A') || setweight(to_tsvector('portugues_unaccent', coalesce(NEW."observacoes", '')), 'B');
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql''',
+    '''CREATE TRIGGER "MariaAlvezApp_consultaclinica_busca" BEFORE INSERT OR UPDATE OF "diagnostico", "observacoes"
+        ON "MariaAlvezApp_consultaclinica" FOR EACH ROW EXECUTE FUNCTION "MariaAlvezApp_consultaclinica_busca_atualizar"()''',
+    '''UPDATE "MariaAlvezApp_consultaclinica" SET busca = setweight(to_tsvector('portugues_unaccent', coalesce("diagnostico", '')), 'A') || setweight(to_tsvector('portugues_unaccent', coalesce("observacoes", '')), 'B')''',
+    'CREATE INDEX "MariaAlvezApp_consultaclinica_busca_gin" ON "MariaAlvezApp_consultaclinica" USING gin (busca)',
+    'CREATE INDEX "MariaAlvezApp_consultaclinica_diagnostico_trgm" ON "MariaAlvezApp_consultaclinica" USING gin ("diagnostico" gin_trgm_ops)',
+    'CREATE INDEX "MariaAlvezApp_consultaclinica_observacoes_trgm" ON "MariaAlvezApp_consultaclinica" USING gin ("observacoes" gin_trgm_ops)',
+]
+SQL_REMOVER_CONSULTA = [
+    'DROP TRIGGER IF EXISTS "MariaAlvezApp_consultaclinica_busca" ON "MariaAlvezApp_consultaclinica"',
+    'DROP FUNCTION IF EXISTS "MariaAlvezApp_consultaclinica_busca_atualizar"()',
+    'DROP INDEX IF EXISTS "MariaAlvezApp_consultaclinica_busca_gin"',
+    'DROP INDEX IF EXISTS "MariaAlvezApp_consultaclinica_diagnostico_trgm"',
+    'DROP INDEX IF EXISTS "MariaAlvezApp_consultaclinica_observacoes_trgm"',
+]
+SQL_INSTALAR_EXAMES = [
+    '''CREATE OR REPLACE FUNCTION "MariaAlvezApp_exames_busca_atualizar"() RETURNS trigger AS $$
+        BEGIN
+            NEW.busca := setweight(to_tsvector('portugues_unaccent', coalesce(NEW."nome", '')), 'A') || setweight(to_tsvector('portugues_unaccent', coalesce(NEW."descricao", '')), 'B');
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql''',
+    '''CREATE TRIGGER "MariaAlvezApp_exames_busca" BEFORE INSERT OR UPDATE OF "nome", "descricao"
+        ON "MariaAlvezApp_exames" FOR EACH ROW EXECUTE FUNCTION "MariaAlvezApp_exames_busca_atualizar"()''',
+    '''UPDATE "MariaAlvezApp_exames" SET busca = setweight(to_tsvector('portugues_unaccent', coalesce("nome", '')), 'A') || setweight(to_tsvector('portugues_unaccent', coalesce("descricao", '')), 'B')''',
+    'CREATE INDEX "MariaAlvezApp_exames_busca_gin" ON "MariaAlvezApp_exames" USING gin (busca)',
+    'CREATE INDEX "MariaAlvezApp_exames_nome_trgm" ON "MariaAlvezApp_exames" USING gin ("nome" gin_trgm_ops)',
+    'CREATE INDEX "MariaAlvezApp_exames_descricao_trgm" ON "MariaAlvezApp_exames" USING gin ("descricao" gin_trgm_ops)',
+]
+SQL_REMOVER_EXAMES = [
+    'DROP TRIGGER IF EXISTS "MariaAlvezApp_exames_busca" ON "MariaAlvezApp_exames"',
+    'DROP FUNCTION IF EXISTS "MariaAlvezApp_exames_busca_atualizar"()',
+    'DROP INDEX IF EXISTS "MariaAlvezApp_exames_busca_gin"',
+    'DROP INDEX IF EXISTS "MariaAlvezApp_exames_nome_trgm"',
+    'DROP INDEX IF EXISTS "MariaAlvezApp_exames_descricao_trgm"',
+]
+
+
+def _somente_postgresql(comandos):
+    def aplicar(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for sql in comandos:
+            schema_editor.execute(sql)
+    return aplicar
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MariaAlvezApp', '0010_indices_relatorios'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='consultaclinica',
+            name='busca',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='exames',
+            name='busca',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(_somente_postgresql(SQL_INSTALAR_CONSULTA), _somente_postgresql(SQL_REMOVER_CONSULTA)),
+        migrations.RunPython(_somente_postgresql(SQL_INSTALAR_EXAMES), _somente_postgresql(SQL_REMOVER_EXAMES)),
+    ]
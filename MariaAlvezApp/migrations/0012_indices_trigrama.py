@@ -0,0 +1,53 @@
+from django.db import migrations
+
+# SQL congelado aqui (gerado na época por MariaAlvezApp.busca): mudanças futuras naquele
+# módulo não alteram o que esta migração faz.
+# Índices de trigramas do autocomplete dos filtros dos relatórios (só PostgreSQL).
+SQL_INSTALAR_TUTOR = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS "MariaAlvezApp_tutor_nome_trgm" ON "MariaAlvezApp_tutor" USING gin ("nome" gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS "MariaAlvezApp_tutor_cpf_trgm" ON "MariaAlvezApp_tutor" USING gin ("cpf" gin_trgm_ops)',
+]
+SQL_REMOVER_TUTOR = [
+    'DROP INDEX IF EXISTS "MariaAlvezApp_tutor_nome_trgm"',
+    'DROP INDEX IF EXISTS "MariaAlvezApp_tutor_cpf_trgm"',
+]
+SQL_INSTALAR_ANIMAL = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS "MariaAlvezApp_animal_nome_trgm" ON "MariaAlvezApp_animal" USING gin ("nome" gin_trgm_ops)',
+]
+SQL_REMOVER_ANIMAL = [
+    'DROP INDEX IF EXISTS "MariaAlvezApp_animal_nome_trgm"',
+]
+SQL_INSTALAR_ESTOQUE = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS "MariaAlvezApp_estoquemedicamento_medicamento_trgm" ON "MariaAlvezApp_estoquemedicamento" USING gin ("medicamento" gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS "MariaAlvezApp_estoquemedicamento_lote_trgm" ON "MariaAlvezApp_estoquemedicamento" USING gin ("lote" gin_trgm_ops)',
+]
+SQL_REMOVER_ESTOQUE = [
+    'DROP INDEX IF EXISTS "MariaAlvezApp_estoquemedicamento_medicamento_trgm"',
+    'DROP INDEX IF EXISTS "MariaAlvezApp_estoquemedicamento_lote_trgm"',
+]
+
+
+def _somente_postgresql(comandos):
+    def aplicar(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for sql in comandos:
+            schema_editor.execute(sql)
+    return aplicar
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MariaAlvezApp', '0011_busca_textual'),
+    ]
+
+    operations = [
+        # Autocomplete dos filtros dos relatórios (só PostgreSQL)
+        migrations.RunPython(_somente_postgresql(SQL_INSTALAR_TUTOR), _somente_postgresql(SQL_REMOVER_TUTOR)),
+        migrations.RunPython(_somente_postgresql(SQL_INSTALAR_ANIMAL), _somente_postgresql(SQL_REMOVER_ANIMAL)),
+        migrations.RunPython(_somente_postgresql(SQL_INSTALAR_ESTOQUE), _somente_postgresql(SQL_REMOVER_ESTOQUE)),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MariaAlvezApp', '0012_indices_trigrama'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EnderecoCEP',
+            fields=[
+                ('cep', models.CharField(help_text='Somente os 8 dígitos', max_length=8, primary_key=True, serialize=False, verbose_name='CEP')),
+                ('logradouro', models.CharField(blank=True, default='', max_length=255, verbose_name='Logradouro')),
+                ('bairro', models.CharField(blank=True, default='', max_length=100, verbose_name='Bairro')),
+                ('cidade', models.CharField(max_length=100, verbose_name='Cidade')),
+                ('uf', models.CharField(max_length=2, verbose_name='UF')),
+                ('origem', models.CharField(choices=[('importacao', 'Importação'), ('consulta', 'Consulta externa')], default='consulta', max_length=20, verbose_name='Origem')),
+                ('atualizado_em', models.DateTimeField(auto_now=True, verbose_name='Atualizado em')),
+            ],
+            options={
+                'verbose_name': 'Endereço por CEP',
+                'verbose_name_plural': 'Endereços por CEP',
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MariaAlvezApp', '0013_endereco_cep'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='estoquemedicamento',
+            constraint=models.CheckConstraint(condition=models.Q(('quantidade__gte', 0)), name='estoque_quantidade_nao_negativa'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MariaAlvezApp', '0014_estoque_quantidade_nao_negativa'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaldoConsolidado',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ate', models.DateTimeField(help_text='O saldo considera os movimentos anteriores a este instante.', verbose_name='Movimentos até')),
+                ('saldo', models.IntegerField(verbose_name='Saldo')),
+                ('criado_em', models.DateTimeField(auto_now_add=True, verbose_name='Registrado em')),
+            ],
+            options={
+                'verbose_name': 'Saldo Consolidado',
+                'verbose_name_plural': 'Saldos Consolidados',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='movimentoestoquemedicamento',
+            index=models.Index(fields=['estoque_item', 'data'], name='MariaAlvezA_estoque_006a3f_idx'),
+        ),
+        migrations.AddField(
+            model_name='saldoconsolidado',
+            name='estoque_item',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='saldos_consolidados', to='MariaAlvezApp.estoquemedicamento', verbose_name='Lote de Medicamento'),
+        ),
+        migrations.AddConstraint(
+            model_name='saldoconsolidado',
+            constraint=models.UniqueConstraint(fields=('estoque_item', 'ate'), name='saldo_consolidado_lote_ate'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MariaAlvezApp', '0015_saldo_consolidado'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='estoquemedicamento',
+            index=models.Index(condition=models.Q(('quantidade__gt', 0)), fields=['medicamento', 'data_validade'], name='estoque_fefo_disponivel'),
+        ),
+    ]
@@ -0,0 +1,134 @@
+# Separa o cadastro de medicamentos (Produto) dos lotes (EstoqueMedicamento).
+# Cada nome de medicamento existente vira um Produto, com o total dos saldos dos seus lotes.
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def criar_produtos(apps, schema_editor):
+    Produto = apps.get_model('MariaAlvezApp', 'Produto')
+    EstoqueMedicamento = apps.get_model('MariaAlvezApp', 'EstoqueMedicamento')
+
+    lotes = EstoqueMedicamento.objects.order_by('medicamento', 'pk')
+    produtos = {}
+    for nome, tipo in lotes.values_list('medicamento', 'tipo_medicamento').distinct():
+        produtos.setdefault(nome, Produto(nome=nome, tipo_medicamento=tipo))
+    totais = dict(lotes.order_by().values_list('medicamento').annotate(total=Sum('quantidade')))
+    for nome, produto in produtos.items():
+        produto.quantidade_total = totais.get(nome) or 0
+    Produto.objects.bulk_create(produtos.values())
+
+    for produto in Produto.objects.all():
+        EstoqueMedicamento.objects.filter(medicamento=produto.nome).update(produto=produto)
+
+
+def restaurar_nomes(apps, schema_editor):
+    Produto = apps.get_model('MariaAlvezApp', 'Produto')
+    EstoqueMedicamento = apps.get_model('MariaAlvezApp', 'EstoqueMedicamento')
+
+    for produto in Produto.objects.all():
+        lotes = EstoqueMedicamento.objects.filter(produto=produto).order_by('pk')
+        lotes.update(medicamento=produto.nome, tipo_medicamento=produto.tipo_medicamento)
+        # O nome voltava a ser único por lote: lotes extras do mesmo medicamento ganham o lote no nome
+        for lote in lotes[1:]:
+            EstoqueMedicamento.objects.filter(pk=lote.pk).update(medicamento=f"{produto.nome} {lote.lote}")
+
+
+# Índice de trigramas do autocomplete de medicamentos (0012): sai com a coluna
+# EstoqueMedicamento.medicamento e passa para Produto.nome (só PostgreSQL)
+SQL_INDICE_LOTE = 'CREATE INDEX IF NOT EXISTS "MariaAlvezApp_estoquemedicamento_medicamento_trgm" ON "MariaAlvezApp_estoquemedicamento" USING gin ("medicamento" gin_trgm_ops)'
+SQL_REMOVER_INDICE_LOTE = 'DROP INDEX IF EXISTS "MariaAlvezApp_estoquemedicamento_medicamento_trgm"'
+SQL_INDICE_PRODUTO = 'CREATE INDEX IF NOT EXISTS "MariaAlvezApp_produto_nome_trgm" ON "MariaAlvezApp_produto" USING gin ("nome" gin_trgm_ops)'
+SQL_REMOVER_INDICE_PRODUTO = 'DROP INDEX IF EXISTS "MariaAlvezApp_produto_nome_trgm"'
+
+
+def _somente_postgresql(*comandos):
+    def aplicar(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for sql in comandos:
+            schema_editor.execute(sql)
+    return aplicar
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MariaAlvezApp', '0016_estoque_fefo_disponivel'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Produto',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('nome', models.CharField(max_length=255, unique=True, verbose_name='Medicamento')),
+                ('tipo_medicamento', models.CharField(choices=[('vacina', 'Vacina'), ('vermifugo', 'Vermífugo'), ('medicamento', 'Medicamento')], default='medicamento', help_text='Classifique o tipo do medicamento', max_length=20, verbose_name='Tipo de Medicamento')),
+                ('quantidade_total', models.PositiveIntegerField(default=0, editable=False, verbose_name='Quantidade em Estoque')),
+            ],
+            options={
+                'verbose_name': 'Medicamento',
+                'verbose_name_plural': 'Medicamentos',
+                'ordering': ['nome'],
+                'constraints': [models.CheckConstraint(condition=models.Q(('quantidade_total__gte', 0)), name='produto_quantidade_nao_negativa')],
+            },
+        ),
+        migrations.AddField(
+            model_name='estoquemedicamento',
+            name='produto',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='lotes', to='MariaAlvezApp.produto', verbose_name='Medicamento'),
+        ),
+        migrations.RemoveIndex(
+            model_name='estoquemedicamento',
+            name='estoque_fefo_disponivel',
+        ),
+        # Sem unique/com default, para a migração poder ser desfeita com mais de um lote por medicamento
+        migrations.AlterField(
+            model_name='estoquemedicamento',
+            name='medicamento',
+            field=models.CharField(default='', max_length=255, verbose_name='Medicamento'),
+        ),
+        migrations.RunPython(criar_produtos, restaurar_nomes),
+        migrations.AlterField(
+            model_name='estoquemedicamento',
+            name='produto',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='lotes', to='MariaAlvezApp.produto', verbose_name='Medicamento'),
+        ),
+        migrations.RunPython(_somente_postgresql(SQL_REMOVER_INDICE_LOTE), _somente_postgresql(SQL_INDICE_LOTE)),
+        migrations.RemoveField(
+            model_name='estoquemedicamento',
+            name='medicamento',
+        ),
+        migrations.RemoveField(
+            model_name='estoquemedicamento',
+            name='tipo_medicamento',
+        ),
+        migrations.AlterField(
+            model_name='estoquemedicamento',
+            name='lote',
+            field=models.CharField(max_length=100, verbose_name='Lote'),
+        ),
+        migrations.AddConstraint(
+            model_name='estoquemedicamento',
+            constraint=models.UniqueConstraint(fields=('produto', 'lote'), name='estoque_lote_unico_por_produto', violation_error_message='Este lote já está cadastrado para este medicamento.'),
+        ),
+        migrations.AddIndex(
+            model_name='estoquemedicamento',
+            index=models.Index(condition=models.Q(('quantidade__gt', 0)), fields=['produto', 'data_validade'], name='estoque_fefo_disponivel'),
+        ),
+        migrations.RunPython(
+            _somente_postgresql("CREATE EXTENSION IF NOT EXISTS pg_trgm", SQL_INDICE_PRODUTO),
+            _somente_postgresql(SQL_REMOVER_INDICE_PRODUTO),
+        ),
+        migrations.AlterField(
+            model_name='registrovacinacao',
+            name='medicamento_aplicado',
+            field=models.ForeignKey(help_text='Selecione a vacina (lote) aplicada. Apenas vacinas serão listadas.', limit_choices_to={'produto__tipo_medicamento': 'vacina'}, null=True, on_delete=django.db.models.deletion.SET_NULL, to='MariaAlvezApp.estoquemedicamento', verbose_name='Vacina/Lote Aplicado'),
+        ),
+        migrations.AlterField(
+            model_name='registrovermifugos',
+            name='medicamento_administrado',
+            field=models.ForeignKey(limit_choices_to={'produto__tipo_medicamento': 'vermifugo'}, null=True, on_delete=django.db.models.deletion.SET_NULL, to='MariaAlvezApp.estoquemedicamento', verbose_name='Vermífugo/Lote Administrado'),
+        ),
+    ]
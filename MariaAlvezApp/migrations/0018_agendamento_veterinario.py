@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MariaAlvezApp', '0017_produto_lote'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agendamentoconsultas',
+            name='veterinario',
+            field=models.ForeignKey(blank=True, help_text='Veterinário que fará o atendimento. Em branco: qualquer veterinário com vaga.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='agendamentos', to='MariaAlvezApp.veterinario', verbose_name='Veterinário'),
+        ),
+        migrations.AddIndex(
+            model_name='agendamentoconsultas',
+            index=models.Index(fields=['veterinario', 'data_consulta'], name='MariaAlvezA_veterin_bfda14_idx'),
+        ),
+    ]
@@ -0,0 +1,74 @@
+# Impede no banco dois agendamentos sobrepostos do mesmo animal ou do mesmo veterinário.
+# data_fim (data_consulta + duração) é preenchido nos agendamentos existentes e, no PostgreSQL,
+# restrições de exclusão (btree_gist) comparam tstzrange(data_consulta, data_fim). Em outros
+# bancos (ex.: SQLite nos testes) fica só a verificação do formulário (ver agenda.py).
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+
+TABELA = '"MariaAlvezApp_agendamentoconsultas"'
+
+SQL_INSTALAR = [
+    "CREATE EXTENSION IF NOT EXISTS btree_gist",
+    f"""ALTER TABLE {TABELA} ADD CONSTRAINT agendamento_animal_sem_sobreposicao
+        EXCLUDE USING gist (animal_id WITH =, tstzrange(data_consulta, data_fim) WITH &&)
+        WHERE (data_consulta IS NOT NULL AND data_fim IS NOT NULL)""",
+    f"""ALTER TABLE {TABELA} ADD CONSTRAINT agendamento_veterinario_sem_sobreposicao
+        EXCLUDE USING gist (veterinario_id WITH =, tstzrange(data_consulta, data_fim) WITH &&)
+        WHERE (veterinario_id IS NOT NULL AND data_consulta IS NOT NULL AND data_fim IS NOT NULL)""",
+]
+
+SQL_REMOVER = [
+    f"ALTER TABLE {TABELA} DROP CONSTRAINT IF EXISTS agendamento_veterinario_sem_sobreposicao",
+    f"ALTER TABLE {TABELA} DROP CONSTRAINT IF EXISTS agendamento_animal_sem_sobreposicao",
+]
+
+
+def preencher_data_fim(apps, schema_editor):
+    AgendamentoConsultas = apps.get_model('MariaAlvezApp', 'AgendamentoConsultas')
+
+    # Agendamentos antigos que já se sobrepõem ficam sem data_fim (fora das restrições), senão
+    # a criação delas falharia; os demais recebem o término pela duração configurada
+    fim_por_animal, fim_por_veterinario, preenchidos = {}, {}, []
+    agendamentos = AgendamentoConsultas.objects.filter(data_consulta__isnull=False).order_by('data_consulta', 'pk')
+    for agendamento in agendamentos.only('data_consulta', 'animal_id', 'veterinario_id', 'is_castracao').iterator():
+        inicio = agendamento.data_consulta
+        minutos = settings.AGENDA_DURACAO_CASTRACAO_MINUTOS if agendamento.is_castracao else settings.AGENDA_DURACAO_CONSULTA_MINUTOS
+        if fim_por_animal.get(agendamento.animal_id, inicio) > inicio:
+            continue
+        if agendamento.veterinario_id and fim_por_veterinario.get(agendamento.veterinario_id, inicio) > inicio:
+            continue
+        agendamento.data_fim = inicio + timedelta(minutes=minutos)
+        fim_por_animal[agendamento.animal_id] = agendamento.data_fim
+        if agendamento.veterinario_id:
+            fim_por_veterinario[agendamento.veterinario_id] = agendamento.data_fim
+        preenchidos.append(agendamento)
+    AgendamentoConsultas.objects.bulk_update(preenchidos, ['data_fim'], batch_size=1000)
+
+
+def _somente_postgresql(comandos):
+    def aplicar(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for sql in comandos:
+            schema_editor.execute(sql)
+    return aplicar
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MariaAlvezApp', '0018_agendamento_veterinario'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agendamentoconsultas',
+            name='data_fim',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Término Previsto'),
+        ),
+        migrations.RunPython(preencher_data_fim, migrations.RunPython.noop),
+        migrations.RunPython(_somente_postgresql(SQL_INSTALAR), _somente_postgresql(SQL_REMOVER)),
+    ]
@@ -0,0 +1,60 @@
+# Consultas, vacinações e vermífugos passam a informar o medicamento (Produto); o lote é escolhido
+# em ordem FEFO por estoque.dispensar(). Os registros existentes recebem o medicamento do lote que
+# já usavam. Sem unique_together (consulta, lote): uma quantidade dividida entre lotes vira várias
+# linhas, e uma nova dispensação pode cair num lote que outra linha da consulta já usa.
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def preencher_produtos(apps, schema_editor):
+    EstoqueMedicamento = apps.get_model('MariaAlvezApp', 'EstoqueMedicamento')
+    for modelo, campo_lote in (('MedicamentoConsulta', 'medicamento_estoque'), ('RegistroVacinacao', 'medicamento_aplicado'), ('RegistroVermifugos', 'medicamento_administrado')):
+        produto_do_lote = EstoqueMedicamento.objects.filter(pk=OuterRef(campo_lote)).values('produto')[:1]
+        apps.get_model('MariaAlvezApp', modelo).objects.filter(**{f'{campo_lote}__isnull': False}).update(produto=Subquery(produto_do_lote))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MariaAlvezApp', '0019_agendamento_sem_sobreposicao'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='medicamentoconsulta',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='medicamentoconsulta',
+            name='produto',
+            field=models.ForeignKey(help_text='O lote sai do estoque em ordem FEFO (o que vence primeiro).', null=True, on_delete=django.db.models.deletion.PROTECT, to='MariaAlvezApp.produto', verbose_name='Medicamento'),
+        ),
+        migrations.AddField(
+            model_name='registrovacinacao',
+            name='produto',
+            field=models.ForeignKey(help_text='Selecione a vacina aplicada. O lote sai do estoque em ordem FEFO (o que vence primeiro).', limit_choices_to={'tipo_medicamento': 'vacina'}, null=True, on_delete=django.db.models.deletion.PROTECT, to='MariaAlvezApp.produto', verbose_name='Vacina'),
+        ),
+        migrations.AddField(
+            model_name='registrovermifugos',
+            name='produto',
+            field=models.ForeignKey(help_text='O lote sai do estoque em ordem FEFO (o que vence primeiro).', limit_choices_to={'tipo_medicamento': 'vermifugo'}, null=True, on_delete=django.db.models.deletion.PROTECT, to='MariaAlvezApp.produto', verbose_name='Vermífugo'),
+        ),
+        migrations.AlterField(
+            model_name='medicamentoconsulta',
+            name='medicamento_estoque',
+            field=models.ForeignKey(editable=False, on_delete=django.db.models.deletion.RESTRICT, to='MariaAlvezApp.estoquemedicamento', verbose_name='Lote'),
+        ),
+        migrations.AlterField(
+            model_name='registrovacinacao',
+            name='medicamento_aplicado',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='MariaAlvezApp.estoquemedicamento', verbose_name='Lote Aplicado'),
+        ),
+        migrations.AlterField(
+            model_name='registrovermifugos',
+            name='medicamento_administrado',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='MariaAlvezApp.estoquemedicamento', verbose_name='Lote Administrado'),
+        ),
+        migrations.RunPython(preencher_produtos, migrations.RunPython.noop),
+    ]
@@ -1,12 +1,13 @@
 from django.core.exceptions import ValidationError
 from django.utils.html import format_html
 from datetime import timedelta, datetime, date
-from django.db import models, transaction
+from django.db import IntegrityError, models, transaction
+from django.contrib.postgres.search import SearchVectorField
 from django.utils.translation import gettext_lazy as _
 import re
+import uuid
 from django.utils import timezone
 from django.utils.timezone import localtime
-import requests
 from django.core.validators import RegexValidator
 
 class Veterinario(models.Model):
@@ -58,22 +59,43 @@ validador_cep = RegexValidator(
 )
     
 def buscar_endereco_por_cep(cep):
-    cep = re.sub(r'\D', '', cep)
-    if len(cep) != 8:
-        raise ValidationError({'cep': _('CEP inválido. Deve conter 8 dígitos.')})
+    # Tabela local de CEPs + cache em memória; a API externa só é consultada quando o CEP não está na base (ver cep.py)
+    from . import cep as servico_cep
 
-    url = f'https://viacep.com.br/ws/{cep}/json/'
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-        if 'erro' in data:
-            raise ValidationError({'cep': _('CEP não encontrado.')})
-        return data
-    except requests.RequestException:
+        return servico_cep.resolver(cep)
+    except servico_cep.CEPInvalido:
+        raise ValidationError({'cep': _('CEP inválido. Deve conter 8 dígitos.')})
+    except servico_cep.CEPNaoEncontrado:
+        raise ValidationError({'cep': _('CEP não encontrado.')})
+    except servico_cep.CEPIndisponivel:
         raise ValidationError({'cep': _('Erro ao buscar o endereço. Verifique sua conexão.')})
     
 
+class EnderecoCEP(models.Model):
+    IMPORTACAO = 'importacao'
+    CONSULTA = 'consulta'
+    ORIGEM_CHOICES = [
+        (IMPORTACAO, 'Importação'),
+        (CONSULTA, 'Consulta externa'),
+    ]
+
+    cep = models.CharField("CEP", max_length=8, primary_key=True, help_text="Somente os 8 dígitos")
+    logradouro = models.CharField("Logradouro", max_length=255, blank=True, default="")
+    bairro = models.CharField("Bairro", max_length=100, blank=True, default="")
+    cidade = models.CharField("Cidade", max_length=100)
+    uf = models.CharField("UF", max_length=2)
+    origem = models.CharField("Origem", max_length=20, choices=ORIGEM_CHOICES, default=CONSULTA)
+    atualizado_em = models.DateTimeField("Atualizado em", auto_now=True)
+
+    class Meta:
+        verbose_name = "Endereço por CEP"
+        verbose_name_plural = "Endereços por CEP"
+
+    def __str__(self):
+        return f"{self.cep[:5]}-{self.cep[5:]} - {self.cidade}/{self.uf}"
+
+
 class Tutor(models.Model):
     nome = models.CharField(max_length=100, verbose_name="Nome", help_text="Nome Completo do tutor!")
     cpf = models.CharField(max_length=14, unique=True, validators=[validar_cpf], verbose_name="CPF", help_text="CPF do Tutor")
@@ -128,10 +150,12 @@ class Tutor(models.Model):
         self.estado = self.estado.upper()
 
     def buscar_e_preencher_endereco(self):
-        dados = buscar_endereco_por_cep(self.cep)
-        self.endereco = f"{dados.get('logradouro', '')}, {dados.get('bairro', '')}".strip(', ')
-        self.cidade = dados.get('localidade', '')
-        self.estado = dados.get('uf', '')
+        self.preencher_endereco(buscar_endereco_por_cep(self.cep))
+
+    def preencher_endereco(self, dados):
+        self.endereco = f"{dados['logradouro']}, {dados['bairro']}".strip(', ')
+        self.cidade = dados['cidade']
+        self.estado = dados['uf']
 
     def __str__(self):
         return f"{self.nome} ({self.cpf})"
@@ -236,7 +260,7 @@ class Animal(models.Model):
         verbose_name_plural = "Animais"
         # Adicione ordering se ainda não tiver, ex: ordering = ['nome']
 
-class EstoqueMedicamento(models.Model):
+class Produto(models.Model):
     VACINA = 'vacina'
     VERMIFUGO = 'vermifugo'
     MEDICAMENTO = 'medicamento'
@@ -247,7 +271,7 @@ class EstoqueMedicamento(models.Model):
         (MEDICAMENTO, 'Medicamento'),
     ]
 
-    medicamento = models.CharField("Medicamento", max_length=255, unique=True)
+    nome = models.CharField("Medicamento", max_length=255, unique=True)
     tipo_medicamento = models.CharField(
         "Tipo de Medicamento",
         max_length=20,
@@ -255,7 +279,33 @@ class EstoqueMedicamento(models.Model):
         default=MEDICAMENTO,
         help_text="Classifique o tipo do medicamento"
     )
-    lote = models.CharField("Lote", max_length=100, unique=True)
+    # Soma dos saldos dos lotes, mantida junto com eles por estoque.aplicar_deltas()
+    quantidade_total = models.PositiveIntegerField("Quantidade em Estoque", default=0, editable=False)
+
+    class Meta:
+        verbose_name = 'Medicamento'
+        verbose_name_plural = 'Medicamentos'
+        ordering = ['nome']
+        constraints = [
+            models.CheckConstraint(condition=models.Q(quantidade_total__gte=0), name='produto_quantidade_nao_negativa'),
+        ]
+
+    def __str__(self):
+        return self.nome
+
+    def save(self, *args, **kwargs):
+        # Como o saldo do lote: o total só muda junto com os lotes, nunca pelo formulário
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != 'quantidade_total'
+            ]
+        super().save(*args, **kwargs)
+
+
+class EstoqueMedicamento(models.Model):
+    produto = models.ForeignKey(Produto, on_delete=models.PROTECT, related_name='lotes', verbose_name="Medicamento")
+    lote = models.CharField("Lote", max_length=100)
     data_validade = models.DateField("Data de Validade")
     quantidade = models.PositiveIntegerField("Quantidade em Estoque", default=0, editable=False)
     data_cadastro = models.DateField("Data de Entrada", default=timezone.now, editable=False)
@@ -263,10 +313,22 @@ class EstoqueMedicamento(models.Model):
     class Meta:
         verbose_name = 'Lote de Medicamento'
         verbose_name_plural = 'Estoque de Medicamentos'
+        indexes = [
+            models.Index(fields=['data_validade']),
+            # Candidatos da dispensação FEFO (estoque.lotes_disponiveis): só lotes com saldo
+            models.Index(fields=['produto', 'data_validade'], condition=models.Q(quantidade__gt=0), name='estoque_fefo_disponivel'),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=models.Q(quantidade__gte=0), name='estoque_quantidade_nao_negativa'),
+            models.UniqueConstraint(
+                fields=['produto', 'lote'], name='estoque_lote_unico_por_produto',
+                violation_error_message="Este lote já está cadastrado para este medicamento.",
+            ),
+        ]
 
     def __str__(self):
         validade = self.data_validade.strftime('%d/%m/%Y')
-        return f"{self.medicamento} - Lote: {self.lote} (Val: {validade}) | {self.quantidade} un."
+        return f"{self.produto.nome} - Lote: {self.lote} (Val: {validade}) | {self.quantidade} un."
 
     def clean(self):
         super().clean()
@@ -275,12 +337,27 @@ class EstoqueMedicamento(models.Model):
             raise ValidationError({
                 'data_validade': "Não é possível cadastrar um medicamento com data de validade vencida."
             })
-        if EstoqueMedicamento.objects.filter(
-            medicamento=self.medicamento
-        ).exclude(pk=self.pk).exists():
-            raise ValidationError({
-                'medicamento': "Já existe um medicamento cadastrado com esse nome."
-            })
+
+    def save(self, *args, **kwargs):
+        # O saldo só muda pelos movimentos (F() sob lock); regravar o valor em memória
+        # ao editar o lote desfaria saídas feitas enquanto o formulário estava aberto.
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != 'quantidade'
+            ]
+        if self._state.adding or 'produto' not in kwargs.get('update_fields', ()):
+            super().save(*args, **kwargs)
+            return
+
+        # Lote trocado de medicamento: o saldo dele passa de um total para o outro
+        from . import estoque
+        with transaction.atomic():
+            anterior = EstoqueMedicamento.objects.values_list('produto_id', flat=True).get(pk=self.pk)
+            estoque.travar_produtos([anterior, self.produto_id])
+            super().save(*args, **kwargs)
+            if anterior != self.produto_id:
+                estoque.recalcular_totais([anterior, self.produto_id])
 
     def destaque_validade(self):
         if not self.data_validade:
@@ -296,6 +373,21 @@ class EstoqueMedicamento(models.Model):
 
     destaque_validade.short_description = "Status da Validade"
 
+class MovimentoEstoqueQuerySet(models.QuerySet):
+    def delete(self):
+        # Excluir movimentos desfaz o efeito deles no saldo, como MovimentoEstoqueMedicamento.delete()
+        from . import estoque
+        with transaction.atomic():
+            efeitos = list(
+                self.order_by().exclude(estoque_item=None).values_list('estoque_item')
+                .annotate(efeito=models.Sum(estoque.efeito_no_saldo()), primeiro=models.Min('data'))
+            )
+            estoque.aplicar_deltas({lote: -efeito for lote, efeito, _ in efeitos})
+            if efeitos:
+                estoque.descartar_consolidados([lote for lote, _, _ in efeitos], min(primeiro for _, _, primeiro in efeitos))
+            return super().delete()
+
+
 class MovimentoEstoqueMedicamento(models.Model):
     ENTRADA = 'entrada'
     SAIDA = 'saida'
@@ -306,56 +398,114 @@ class MovimentoEstoqueMedicamento(models.Model):
     data = models.DateTimeField("Data do Movimento", auto_now_add=True, help_text="Data de Hoje")
     observacao = models.TextField("Observação", blank=True, null=True)
 
+    objects = MovimentoEstoqueQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Movimento de Estoque"
         verbose_name_plural = "Movimentos de Estoque"
+        indexes = [
+            models.Index(fields=['estoque_item', 'data']),  # Saldo do lote a partir do último consolidado
+        ]
 
     def __str__(self):
-        return f"{self.get_tipo_display()} de {self.quantidade} un. de {self.estoque_item.medicamento} (Lote: {self.estoque_item.lote})"
+        return f"{self.get_tipo_display()} de {self.quantidade} un. de {self.estoque_item.produto.nome} (Lote: {self.estoque_item.lote})"
 
     def clean(self):
         super().clean()
         if self.quantidade <= 0:
             raise ValidationError({'quantidade': "A quantidade movimentada deve ser maior que zero."})
-        if self.tipo == self.SAIDA:
-            if self.estoque_item and self.quantidade > self.estoque_item.quantidade:
-                raise ValidationError(f"Saldo insuficiente para este lote. Disponível: {self.estoque_item.quantidade}, Saída: {self.quantidade}.")
+        if self.tipo == self.SAIDA and self.estoque_item_id:
+            # Saldo lido do banco: a instância em memória pode estar desatualizada
+            disponivel = EstoqueMedicamento.objects.values_list('quantidade', flat=True).get(pk=self.estoque_item_id)
+            if self.quantidade > disponivel:
+                raise ValidationError(f"Saldo insuficiente para este lote. Disponível: {disponivel}, Saída: {self.quantidade}.")
+
+    def _delta(self):
+        return self.quantidade if self.tipo == self.ENTRADA else -self.quantidade
+
+    def _aplicar_no_saldo(self, delta):
+        # Lote travado e delta aplicado com F() no banco (ver estoque.py): duas saídas
+        # simultâneas no mesmo lote (dia de campanha) não sobrescrevem o saldo uma da outra.
+        from . import estoque
+        saldos = estoque.aplicar_deltas({self.estoque_item_id: delta})
+        self.estoque_item.quantidade = saldos[self.estoque_item_id]
 
     def save(self, *args, **kwargs):
+        is_new = self._state.adding
         with transaction.atomic():
+            # Movimento é lançamento de livro: só a inclusão mexe no saldo
+            if is_new and self.estoque_item_id:
+                self._aplicar_no_saldo(self._delta())
             super().save(*args, **kwargs)
-            if self.tipo == self.ENTRADA:
-                self.estoque_item.quantidade += self.quantidade
-            elif self.tipo == self.SAIDA:
-                self.estoque_item.quantidade -= self.quantidade
-            self.estoque_item.save()
 
     def delete(self, *args, **kwargs):
+        from . import estoque
         with transaction.atomic():
-            if self.tipo == self.ENTRADA:
-                self.estoque_item.quantidade -= self.quantidade
-            elif self.tipo == self.SAIDA:
-                self.estoque_item.quantidade += self.quantidade
-            self.estoque_item.save()
+            if self.estoque_item_id:
+                self._aplicar_no_saldo(-self._delta())
+                estoque.descartar_consolidados([self.estoque_item_id], self.data)
             super().delete(*args, **kwargs)
 
+class SaldoConsolidado(models.Model):
+    # Saldo do lote calculado pelo livro de movimentos até `ate`. A conciliação (conciliar_estoque)
+    # parte do último consolidado e só soma os movimentos posteriores a ele.
+    estoque_item = models.ForeignKey(EstoqueMedicamento, on_delete=models.CASCADE, related_name='saldos_consolidados', verbose_name="Lote de Medicamento")
+    ate = models.DateTimeField("Movimentos até", help_text="O saldo considera os movimentos anteriores a este instante.")
+    saldo = models.IntegerField("Saldo")
+    criado_em = models.DateTimeField("Registrado em", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Saldo Consolidado"
+        verbose_name_plural = "Saldos Consolidados"
+        constraints = [
+            models.UniqueConstraint(fields=['estoque_item', 'ate'], name='saldo_consolidado_lote_ate'),
+        ]
+
+    def __str__(self):
+        return f"{self.estoque_item.produto.nome} (Lote: {self.estoque_item.lote}): {self.saldo} un. até {localtime(self.ate).strftime('%d/%m/%Y %H:%M')}"
+
+
+class AgendamentoConsultasQuerySet(models.QuerySet):
+    def delete(self):
+        # Como AgendamentoConsultas.delete(): a consulta gerada vai junto (e estorna seus medicamentos)
+        with transaction.atomic():
+            ConsultaClinica.objects.filter(agendamento_origem__in=self.order_by().values('pk')).delete()
+            return super().delete()
+
+
 class AgendamentoConsultas(models.Model):
     data_consulta = models.DateTimeField(verbose_name="Data da Consulta", default=timezone.now, blank=True, null=True, help_text="Escolha a data da consulta!")
     animal = models.ForeignKey('Animal', on_delete=models.CASCADE, related_name='agendamentos_consultas', verbose_name="Animal", help_text="Selecione o Animal para agendamento!")
     is_castracao = models.BooleanField(default=False, verbose_name="Agendamento para Castração?", help_text="Marque se este agendamento for para um procedimento de castração.") 
+    veterinario = models.ForeignKey(Veterinario, on_delete=models.SET_NULL, related_name='agendamentos', verbose_name="Veterinário", blank=True, null=True, help_text="Veterinário que fará o atendimento. Em branco: qualquer veterinário com vaga.")
+    # Fim do horário ocupado (data_consulta + duração), calculado no save(); base das restrições de exclusão
+    data_fim = models.DateTimeField(verbose_name="Término Previsto", blank=True, null=True, editable=False)
+
+    objects = AgendamentoConsultasQuerySet.as_manager()
 
     def clean(self): 
         super().clean()
         pass 
 
     def save(self, *args, **kwargs):
+        from . import agenda
         is_new = self._state.adding
-        super().save(*args, **kwargs)
+        self.data_fim = self.data_consulta + timedelta(minutes=agenda.duracao(self.is_castracao)) if self.data_consulta else None
+        try:
+            # Savepoint: no PostgreSQL a violação da restrição de exclusão aborta a transação
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+        except IntegrityError as exc:
+            motivo = agenda.motivo_da_violacao(exc)
+            if motivo is None:
+                raise
+            raise agenda.HorarioOcupado({'data_consulta': motivo}) from exc
 
         if is_new:
             if not hasattr(self, 'consulta_gerada') or self.consulta_gerada is None:
                 ConsultaClinica.objects.create(
                     animal=self.animal,
+                    veterinario=self.veterinario,
                     data_atendimento=self.data_consulta,
                     agendamento_origem=self
                 )
@@ -368,7 +518,13 @@ class AgendamentoConsultas(models.Model):
     class Meta:
         verbose_name = "Agendamento de Consulta"
         verbose_name_plural = "Agendamentos de Consultas"
-        indexes = [models.Index(fields=['data_consulta'])]
+        indexes = [
+            models.Index(fields=['data_consulta']),
+            models.Index(fields=['is_castracao', 'data_consulta']),  # Fila de castração
+            models.Index(fields=['veterinario', 'data_consulta']),
+        ]
+        # Sem sobreposição por animal e por veterinário: restrições de exclusão criadas só no
+        # PostgreSQL pela migração 0019 (ver agenda.RESTRICOES)
 
     def __str__(self):
         tutor_nome = self.animal.tutor.nome if self.animal and self.animal.tutor else 'N/A'
@@ -378,6 +534,14 @@ class AgendamentoConsultas(models.Model):
         return "Agendamento sem dados completos"
     
 
+class ConsultaClinicaQuerySet(models.QuerySet):
+    def delete(self):
+        # A cascata do ORM removeria os MedicamentoConsulta sem devolver o estoque
+        with transaction.atomic():
+            MedicamentoConsulta.objects.filter(consulta__in=self.order_by().values('pk')).delete()
+            return super().delete()
+
+
 class ConsultaClinica(models.Model):
     data_atendimento = models.DateTimeField(default=timezone.now, help_text="Data e hora da consulta")
     
@@ -408,6 +572,7 @@ class ConsultaClinica(models.Model):
     peso = models.DecimalField(max_digits=5, decimal_places=2, blank=True, null=True, help_text="Peso do animal em quilogramas (Kg) ") 
     avaliacao_mucosa = models.CharField(max_length=100, blank=True, null=True, help_text="Avaliação da mucosa (ex: Rósea, Pálida, Ictérica)")
     tempo_preenchimento_capilar = models.CharField(max_length=50, blank=True, null=True, help_text="Tempo de preenchimento capilar (ex: < 2 segundos, 3 segundos)")
+    busca = SearchVectorField(null=True, editable=False)  # Diagnóstico + observações; mantido por trigger (ver busca.py)
     agendamento_origem = models.OneToOneField(
         'AgendamentoConsultas',
         on_delete=models.SET_NULL,
@@ -418,10 +583,16 @@ class ConsultaClinica(models.Model):
         help_text="Agendamento que originou esta consulta (se houver)."
     )
 
+    objects = ConsultaClinicaQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Consulta Clínica"
         verbose_name_plural = "Consultas Clínicas"
         ordering = ['-data_atendimento']
+        indexes = [
+            models.Index(fields=['data_atendimento']),
+            models.Index(fields=['animal', 'data_atendimento']),
+        ]
 
     def save(self, *args, **kwargs):
         super().save(*args, **kwargs)
@@ -435,6 +606,11 @@ class ConsultaClinica(models.Model):
                 animal_para_atualizar.peso = self.peso
                 animal_para_atualizar.save(update_fields=['peso'])
 
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            MedicamentoConsulta.objects.filter(consulta=self).delete()
+            return super().delete(*args, **kwargs)
+
     def __str__(self):
         animal_info = self.animal.nome if self.animal else 'N/A'
         vet_info = self.veterinario.nome if self.veterinario else 'N/A'
@@ -454,45 +630,82 @@ class ConsultaClinica(models.Model):
         if self.peso is None or self.peso <= 0:
             raise ValidationError({'peso': 'O peso do animal na consulta deve ser maior que zero.'})
 
+class MedicamentoConsultaQuerySet(models.QuerySet):
+    def delete(self):
+        from . import estoque
+        with transaction.atomic():
+            estoque.estornar_saidas(self, 'medicamento_estoque', models.Sum('quantidade_aplicada'), "medicamento(s) de consulta")
+            return super().delete()
+
+
 class MedicamentoConsulta(models.Model):
     consulta = models.ForeignKey(ConsultaClinica, on_delete=models.CASCADE, verbose_name="Consulta Clínica")
-    medicamento_estoque = models.ForeignKey(EstoqueMedicamento, on_delete=models.RESTRICT, verbose_name="Medicamento (Lote)")
+    produto = models.ForeignKey(Produto, on_delete=models.PROTECT, blank=False, null=True, verbose_name="Medicamento", help_text="O lote sai do estoque em ordem FEFO (o que vence primeiro).")
+    # Escolhido por estoque.dispensar(); quantidades que não cabem num lote viram outras linhas da consulta
+    medicamento_estoque = models.ForeignKey(EstoqueMedicamento, on_delete=models.RESTRICT, editable=False, verbose_name="Lote")
     quantidade_aplicada = models.PositiveIntegerField(verbose_name="Quantidade Aplicada")
 
+    objects = MedicamentoConsultaQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Medicamento na Consulta"
         verbose_name_plural = "Medicamentos na Consulta"
-        unique_together = ('consulta', 'medicamento_estoque')
 
     def __str__(self):
-        return f"{self.quantidade_aplicada} de {self.medicamento_estoque.medicamento} (Lote: {self.medicamento_estoque.lote})"
+        return f"{self.quantidade_aplicada} de {self.medicamento_estoque.produto.nome} (Lote: {self.medicamento_estoque.lote})"
+
+    def data_dispensacao(self):
+        if self.consulta_id and self.consulta.data_atendimento:
+            return localtime(self.consulta.data_atendimento).date()
+        return timezone.localdate()
+
+    def _anterior(self):
+        if self._state.adding:
+            return None
+        return MedicamentoConsulta.objects.select_related('medicamento_estoque').filter(pk=self.pk).first()
+
+    def _precisa_dispensar(self, anterior):
+        # Registro novo, outro medicamento ou quantidade, ou um lote que já venceu na data da consulta
+        if anterior is None or (anterior.produto_id, anterior.quantidade_aplicada) != (self.produto_id, self.quantidade_aplicada):
+            return True
+        return anterior.medicamento_estoque.data_validade < self.data_dispensacao()
 
     def clean(self):
         super().clean()
         if self.quantidade_aplicada <= 0:
             raise ValidationError({'quantidade_aplicada': "A quantidade aplicada deve ser maior que zero."})
-        if self.medicamento_estoque and self.medicamento_estoque.quantidade < self.quantidade_aplicada:
-            raise ValidationError({'quantidade_aplicada': f"Estoque insuficiente. Disponível: {self.medicamento_estoque.quantidade}."})
-    
+        anterior = self._anterior()
+        if self.produto_id and self._precisa_dispensar(anterior):
+            from . import estoque
+            data = self.data_dispensacao()
+            disponivel = estoque.disponivel_para_dispensar(self.produto_id, data)
+            if anterior and anterior.produto_id == self.produto_id and anterior.medicamento_estoque.data_validade >= data:
+                # Na edição, o que já foi aplicado neste registro volta para o saldo
+                disponivel += anterior.quantidade_aplicada
+            if disponivel < self.quantidade_aplicada:
+                raise ValidationError({'quantidade_aplicada': f"Estoque insuficiente em lotes dentro da validade. Disponível: {disponivel}."})
+
     def save(self, *args, **kwargs):
-        is_new = self._state.adding 
-        old_quantidade_aplicada = 0
-        if not is_new:
-            try:
-                old_mc = MedicamentoConsulta.objects.get(pk=self.pk)
-                old_quantidade_aplicada = old_mc.quantidade_aplicada
-            except MedicamentoConsulta.DoesNotExist:
-                pass 
+        from . import estoque
+        if not self.produto_id:
+            raise ValidationError({'produto': "Informe o medicamento aplicado."})
+        anterior = self._anterior()
         with transaction.atomic():
+            if not self._precisa_dispensar(anterior):
+                return super().save(*args, **kwargs)
+            primeira, *demais = estoque.redispensar(
+                anterior.medicamento_estoque if anterior else None,
+                anterior.quantidade_aplicada if anterior else 0,
+                f"Estorno de saída devido a alteração de medicamento na Consulta Clínica #{self.consulta.pk}.",
+                self.produto_id, self.quantidade_aplicada, f"Saída em Consulta Clínica #{self.consulta.pk}.",
+                hoje=self.data_dispensacao(),
+            )
+            self.medicamento_estoque, self.quantidade_aplicada = primeira.lote, primeira.quantidade
             super().save(*args, **kwargs)
-            if self.medicamento_estoque:
-                if is_new:
-                    MovimentoEstoqueMedicamento.objects.create(estoque_item=self.medicamento_estoque, tipo=MovimentoEstoqueMedicamento.SAIDA, quantidade=self.quantidade_aplicada, observacao=f"Saída em Consulta Clínica #{self.consulta.pk}.")
-                elif self.quantidade_aplicada != old_quantidade_aplicada:
-                    delta = self.quantidade_aplicada - old_quantidade_aplicada
-                    tipo_mov = MovimentoEstoqueMedicamento.SAIDA if delta > 0 else MovimentoEstoqueMedicamento.ENTRADA
-                    obs = "Aumento" if delta > 0 else "Redução"
-                    MovimentoEstoqueMedicamento.objects.create(estoque_item=self.medicamento_estoque, tipo=tipo_mov, quantidade=abs(delta), observacao=f"Ajuste de saída ({obs}) em Consulta Clínica #{self.consulta.pk}.")
+            MedicamentoConsulta.objects.bulk_create(
+                MedicamentoConsulta(consulta=self.consulta, produto_id=self.produto_id, medicamento_estoque=alocacao.lote, quantidade_aplicada=alocacao.quantidade)
+                for alocacao in demais
+            )
 
     def delete(self, *args, **kwargs):
         with transaction.atomic():
@@ -500,6 +713,14 @@ class MedicamentoConsulta(models.Model):
                 MovimentoEstoqueMedicamento.objects.create(estoque_item=self.medicamento_estoque, tipo=MovimentoEstoqueMedicamento.ENTRADA, quantidade=self.quantidade_aplicada, observacao=f"Estorno de saída devido à remoção de medicamento da Consulta Clínica #{self.consulta.pk}.")
             super().delete(*args, **kwargs)
 
+class RegistroVacinacaoQuerySet(models.QuerySet):
+    def delete(self):
+        from . import estoque
+        with transaction.atomic():
+            estoque.estornar_saidas(self, 'medicamento_aplicado', models.Count('pk'), "registro(s) de vacinação")
+            return super().delete()
+
+
 class RegistroVacinacao(models.Model):
     animal = models.ForeignKey(
         Animal, 
@@ -507,13 +728,19 @@ class RegistroVacinacao(models.Model):
         verbose_name="Animal",
         help_text="Selecione o animal vacinado." # Adicionei help_text para clareza
     )
+    produto = models.ForeignKey(
+        Produto,
+        on_delete=models.PROTECT,
+        blank=False, null=True,
+        verbose_name="Vacina",
+        limit_choices_to={'tipo_medicamento': Produto.VACINA},
+        help_text="Selecione a vacina aplicada. O lote sai do estoque em ordem FEFO (o que vence primeiro)."
+    )
     medicamento_aplicado = models.ForeignKey(
         'EstoqueMedicamento',
-        on_delete=models.SET_NULL, # SET_NULL é mantido, mas o campo se torna obrigatório a nível de formulário/modelo
-        blank=False, null=True,
-        verbose_name="Vacina/Lote Aplicado",
-        limit_choices_to={'tipo_medicamento': EstoqueMedicamento.VACINA},
-        help_text="Selecione a vacina (lote) aplicada. Apenas vacinas serão listadas." # Adicionei help_text
+        on_delete=models.SET_NULL,
+        null=True, editable=False,  # Escolhido por estoque.dispensar() a partir da vacina
+        verbose_name="Lote Aplicado",
     )
     data_aplicacao = models.DateField(
         verbose_name="Data de Aplicação", 
@@ -527,10 +754,17 @@ class RegistroVacinacao(models.Model):
         null=False, 
         help_text="Informe a data da próxima revacinação." # Adicionei help_text
     )
+
+    objects = RegistroVacinacaoQuerySet.as_manager()
     
     class Meta:
         verbose_name = "Registro de Vacinação"
         verbose_name_plural = "Registros de Vacinação"
+        indexes = [
+            models.Index(fields=['data_aplicacao']),
+            models.Index(fields=['animal', 'data_aplicacao']),
+            models.Index(fields=['data_revacinacao']),  # Status de revacinação e painel
+        ]
 
     
     def clean(self):
@@ -561,27 +795,38 @@ class RegistroVacinacao(models.Model):
             raise ValidationError({'data_revacinacao': 'Este campo é obrigatório.'})
         if not self.animal: # Validação explícita para ForeignKey
              raise ValidationError({'animal': 'O animal vacinado é obrigatório.'})
-        if not self.medicamento_aplicado: # Validação explícita para ForeignKey
-             raise ValidationError({'medicamento_aplicado': 'O medicamento aplicado é obrigatório.'})
-    
+        if not self.produto_id: # Validação explícita para ForeignKey
+             raise ValidationError({'produto': 'A vacina aplicada é obrigatória.'})
+        if self._precisa_dispensar(self._anterior()):
+            from . import estoque
+            if not estoque.disponivel_para_dispensar(self.produto_id, self.data_aplicacao):
+                raise ValidationError({'produto': 'Nenhum lote desta vacina com saldo e dentro da validade na data da aplicação.'})
+
+    def _anterior(self):
+        if self._state.adding:
+            return None
+        return RegistroVacinacao.objects.select_related('medicamento_aplicado').filter(pk=self.pk).first()
+
+    def _precisa_dispensar(self, anterior):
+        # Registro novo, outra vacina ou um lote que já venceu na data da aplicação
+        if anterior is None or anterior.produto_id != self.produto_id or anterior.medicamento_aplicado is None:
+            return True
+        return anterior.medicamento_aplicado.data_validade < (self.data_aplicacao or timezone.localdate())
+
     def save(self, *args, **kwargs):
-        is_new = self._state.adding
-        original_medicamento_aplicado = None
-        if not is_new:
-            try:
-                original_registro = RegistroVacinacao.objects.get(pk=self.pk)
-                original_medicamento_aplicado = original_registro.medicamento_aplicado
-            except RegistroVacinacao.DoesNotExist:
-                pass
+        from . import estoque
+        anterior = self._anterior()
         with transaction.atomic():
             super().save(*args, **kwargs)
-            if self.medicamento_aplicado:
-                if is_new or (not is_new and original_medicamento_aplicado != self.medicamento_aplicado):
-                    if not is_new and original_medicamento_aplicado:
-                        MovimentoEstoqueMedicamento.objects.create(estoque_item=original_medicamento_aplicado, tipo=MovimentoEstoqueMedicamento.ENTRADA, quantidade=1, observacao=f"Estorno de saída (vacinação) devido a alteração do registro #{self.pk}.")
-                    MovimentoEstoqueMedicamento.objects.create(estoque_item=self.medicamento_aplicado, tipo=MovimentoEstoqueMedicamento.SAIDA, quantidade=1, observacao=f"Aplicação em vacinação do animal {self.animal.nome if self.animal else 'N/A'} (Registro #{self.pk})")
-                elif not is_new and original_medicamento_aplicado:
-                    MovimentoEstoqueMedicamento.objects.create(estoque_item=original_medicamento_aplicado, tipo=MovimentoEstoqueMedicamento.ENTRADA, quantidade=1, observacao=f"Estorno de saída (vacinação) devido à remoção do medicamento do registro #{self.pk}")
+            if self._precisa_dispensar(anterior):
+                alocacoes = estoque.redispensar(
+                    anterior.medicamento_aplicado if anterior else None, 1,
+                    f"Estorno de saída (vacinação) devido a alteração do registro #{self.pk}.",
+                    self.produto_id, 1, f"Aplicação em vacinação do animal {self.animal.nome if self.animal else 'N/A'} (Registro #{self.pk})",
+                    hoje=self.data_aplicacao,
+                )
+                self.medicamento_aplicado = alocacoes[0].lote if alocacoes else None
+                RegistroVacinacao.objects.filter(pk=self.pk).update(medicamento_aplicado=self.medicamento_aplicado)
     
     def delete(self, *args, **kwargs):
         with transaction.atomic():
@@ -594,22 +839,45 @@ class RegistroVacinacao(models.Model):
         data_app = self.data_aplicacao.strftime('%d/%m/%Y') if self.data_aplicacao else "Data Não Informada"
         return f"Vacinação de {animal_name} em {data_app}"
 
+class RegistroVermifugosQuerySet(models.QuerySet):
+    def delete(self):
+        from . import estoque
+        with transaction.atomic():
+            estoque.estornar_saidas(self, 'medicamento_administrado', models.Count('pk'), "registro(s) de vermífugo")
+            return super().delete()
+
+
 class RegistroVermifugos(models.Model):
     animal = models.ForeignKey(Animal, on_delete=models.CASCADE, blank=False, null=True, verbose_name="Animal")
+    produto = models.ForeignKey(
+        Produto,
+        on_delete=models.PROTECT,
+        blank=False,
+        null=True,
+        verbose_name="Vermífugo",
+        limit_choices_to={'tipo_medicamento': Produto.VERMIFUGO},
+        help_text="O lote sai do estoque em ordem FEFO (o que vence primeiro)."
+    )
     medicamento_administrado = models.ForeignKey(
         'EstoqueMedicamento',
         on_delete=models.SET_NULL,
-        blank=False,
         null=True,
-        verbose_name="Vermífugo/Lote Administrado",
-        limit_choices_to={'tipo_medicamento': EstoqueMedicamento.VERMIFUGO}
+        editable=False,  # Escolhido por estoque.dispensar() a partir do vermífugo
+        verbose_name="Lote Administrado",
     )
     data_administracao = models.DateField(verbose_name="Data de Administração", blank=False, null=True)
     data_readministracao = models.DateField(verbose_name="Data Readministração", blank=False, null=True)
+
+    objects = RegistroVermifugosQuerySet.as_manager()
     
     class Meta:
         verbose_name = "Registro de Vermífugo"
         verbose_name_plural = "Registros de Vermífugos"
+        indexes = [
+            models.Index(fields=['data_administracao']),
+            models.Index(fields=['animal', 'data_administracao']),
+            models.Index(fields=['data_readministracao']),  # Status de readministração e painel
+        ]
     
     def clean(self):
         super().clean()
@@ -619,25 +887,36 @@ class RegistroVermifugos(models.Model):
             raise ValidationError({'data_administracao': 'A data de administração não pode ser anterior a 15 dias.'})
         if self.data_readministracao and self.data_readministracao < limite:
             raise ValidationError({'data_readministracao': 'A data de readministração não pode ser anterior a 15 dias.'})
-    
+        if self.produto_id and self._precisa_dispensar(self._anterior()):
+            from . import estoque
+            if not estoque.disponivel_para_dispensar(self.produto_id, self.data_administracao):
+                raise ValidationError({'produto': 'Nenhum lote deste vermífugo com saldo e dentro da validade na data da administração.'})
+
+    def _anterior(self):
+        if self._state.adding:
+            return None
+        return RegistroVermifugos.objects.select_related('medicamento_administrado').filter(pk=self.pk).first()
+
+    def _precisa_dispensar(self, anterior):
+        # Registro novo, outro vermífugo ou um lote que já venceu na data da administração
+        if anterior is None or anterior.produto_id != self.produto_id or anterior.medicamento_administrado is None:
+            return True
+        return anterior.medicamento_administrado.data_validade < (self.data_administracao or timezone.localdate())
+
     def save(self, *args, **kwargs):
-        is_new = self._state.adding
-        original_medicamento_administrado = None
-        if not is_new:
-            try:
-                original_registro = RegistroVermifugos.objects.get(pk=self.pk)
-                original_medicamento_administrado = original_registro.medicamento_administrado
-            except RegistroVermifugos.DoesNotExist:
-                pass
+        from . import estoque
+        anterior = self._anterior()
         with transaction.atomic():
             super().save(*args, **kwargs)
-            if self.medicamento_administrado:
-                if is_new or (not is_new and original_medicamento_administrado != self.medicamento_administrado):
-                    if not is_new and original_medicamento_administrado:
-                        MovimentoEstoqueMedicamento.objects.create(estoque_item=original_medicamento_administrado, tipo=MovimentoEstoqueMedicamento.ENTRADA, quantidade=1, observacao=f"Estorno de saída (vermífugo) devido a alteração do registro #{self.pk}.")
-                    MovimentoEstoqueMedicamento.objects.create(estoque_item=self.medicamento_administrado, tipo=MovimentoEstoqueMedicamento.SAIDA, quantidade=1, observacao=f"Administração de vermífugo em {self.animal.nome if self.animal else 'N/A'} (Registro #{self.pk})")
-            elif not is_new and original_medicamento_administrado:
-                MovimentoEstoqueMedicamento.objects.create(estoque_item=original_medicamento_administrado, tipo=MovimentoEstoqueMedicamento.ENTRADA, quantidade=1, observacao=f"Estorno de saída (vermífugo) devido à remoção do medicamento do registro #{self.pk}")
+            if self._precisa_dispensar(anterior):
+                alocacoes = estoque.redispensar(
+                    anterior.medicamento_administrado if anterior else None, 1,
+                    f"Estorno de saída (vermífugo) devido a alteração do registro #{self.pk}.",
+                    self.produto_id, 1, f"Administração de vermífugo em {self.animal.nome if self.animal else 'N/A'} (Registro #{self.pk})",
+                    hoje=self.data_administracao,
+                )
+                self.medicamento_administrado = alocacoes[0].lote if alocacoes else None
+                RegistroVermifugos.objects.filter(pk=self.pk).update(medicamento_administrado=self.medicamento_administrado)
     
     def delete(self, *args, **kwargs):
         with transaction.atomic():
@@ -675,6 +954,7 @@ class Exames(models.Model):
     tipo = models.CharField(max_length=50, choices=[('Imagem', 'Imagem'), ('Laboratorial', 'Laboratorial'), ('Clínico', 'Clínico')], verbose_name="Tipo de Exame", blank=True, null=True)
     anexo = models.FileField(upload_to='exames/', blank=True, null=True, verbose_name="Anexo do Exame")
     data_exame = models.DateField(verbose_name="Data de Realização do Exame", default=timezone.now)
+    busca = SearchVectorField(null=True, editable=False)  # Nome + descrição; mantido por trigger (ver busca.py)
 
     class Meta:
         verbose_name = "Exame"
@@ -697,4 +977,40 @@ class RelatoriosGerais(models.Model):
         managed = False
         verbose_name = "Relatório Geral"
         verbose_name_plural = "Relatórios Gerais"
-        permissions = [("can_view_reports", "Can view general reports")]
\ No newline at end of file
+        permissions = [("can_view_reports", "Can view general reports")]
+
+
+class TarefaRelatorioPDF(models.Model):
+    PENDENTE = 'pendente'
+    PROCESSANDO = 'processando'
+    CONCLUIDA = 'concluida'
+    ERRO = 'erro'
+    STATUS_CHOICES = [
+        (PENDENTE, 'Pendente'),
+        (PROCESSANDO, 'Processando'),
+        (CONCLUIDA, 'Concluída'),
+        (ERRO, 'Erro'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    relatorio = models.CharField("Relatório", max_length=50)
+    parametros = models.TextField("Filtros", blank=True, default="", help_text="Query string com os filtros do relatório")
+    base_url = models.CharField("URL Base", max_length=255, blank=True, default="")
+    status = models.CharField("Status", max_length=20, choices=STATUS_CHOICES, default=PENDENTE)
+    arquivo = models.FileField("Arquivo PDF", upload_to='relatorios_pdf/', blank=True, null=True)
+    erro = models.TextField("Erro", blank=True, default="")
+    criado_em = models.DateTimeField("Criada em", auto_now_add=True)
+    iniciado_em = models.DateTimeField("Iniciada em", blank=True, null=True)
+    concluido_em = models.DateTimeField("Concluída em", blank=True, null=True)
+
+    class Meta:
+        verbose_name = "Tarefa de Relatório PDF"
+        verbose_name_plural = "Tarefas de Relatórios PDF"
+        indexes = [models.Index(fields=['status', 'criado_em'])]
+
+    def __str__(self):
+        return f"PDF {self.relatorio} ({self.get_status_display()}) - {localtime(self.criado_em).strftime('%d/%m/%Y %H:%M')}"
+
+    @property
+    def finalizada(self):
+        return self.status in (self.CONCLUIDA, self.ERRO)
@@ -0,0 +1,164 @@
+# MariaAlvezApp/pdf_tabular.py
+#
+# Gerador de PDF tabular em fluxo, alternativo ao WeasyPrint para relatórios muito grandes.
+# Cada página é escrita na saída assim que fica cheia; em memória ficam só a página atual
+# e os deslocamentos dos objetos já gravados (para a tabela xref), então o consumo não
+# cresce com o número de linhas. Usa as fontes padrão do PDF (Helvetica), sem embutir fontes.
+
+import unicodedata
+import zlib
+
+LARGURA_PAGINA, ALTURA_PAGINA = 595.28, 841.89  # A4 em pontos
+MARGEM = 28.35                                  # 1cm, igual ao @page dos PDFs em HTML
+TAMANHO_FONTE = 7.5
+TAMANHO_TITULO = 13
+ALTURA_LINHA = 11
+PREENCHIMENTO = 3
+
+# Larguras da Helvetica (em 1/1000 do tamanho da fonte) para os caracteres 32..126
+_LARGURAS_HELVETICA = (
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+)
+
+
+def largura_texto(texto, tamanho, negrito=False):
+    total = 0
+    for caractere in texto:
+        # Letras acentuadas têm a largura da letra base
+        base = unicodedata.normalize('NFD', caractere)[0]
+        codigo = ord(base)
+        total += _LARGURAS_HELVETICA[codigo - 32] if 32 <= codigo <= 126 else 556
+    return total * tamanho / 1000 * (1.05 if negrito else 1)
+
+
+def ajustar_texto(texto, largura, tamanho, negrito=False):
+    if largura_texto(texto, tamanho, negrito) <= largura:
+        return texto
+    while texto and largura_texto(texto + '…', tamanho, negrito) > largura:
+        texto = texto[:-1]
+    return texto + '…'
+
+
+def _literal(texto):
+    # Fontes padrão com WinAnsiEncoding: cp1252 cobre os acentos do português
+    dados = texto.encode('cp1252', errors='replace')
+    return b'(' + dados.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+class DocumentoTabular:
+    """
+    Escreve um PDF com título, cabeçalho da tabela repetido em cada página e rodapé de totais.
+    Uso: adicionar_linha() para cada linha e finalizar() no fim; `saida` é um arquivo binário.
+    """
+    # Objetos fixos; as páginas recebem números a partir de 5
+    CATALOGO, PAGINAS, FONTE, FONTE_NEGRITO = 1, 2, 3, 4
+
+    def __init__(self, saida, titulo, cabecalho, subtitulo=''):
+        self.saida = saida
+        self.titulo = titulo
+        self.subtitulo = subtitulo
+        self.cabecalho = [str(coluna) for coluna in cabecalho]
+        largura_util = LARGURA_PAGINA - 2 * MARGEM
+        self.largura_coluna = largura_util / len(self.cabecalho)
+        self.deslocamentos = {}
+        self.paginas = []
+        self.proximo_objeto = 5
+        self.total_linhas = 0
+        self.posicao = 0
+        self.comandos = None
+        self.y = None
+
+        self._escrever(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        for numero, fonte in ((self.FONTE, b'Helvetica'), (self.FONTE_NEGRITO, b'Helvetica-Bold')):
+            self._objeto(numero, b'<< /Type /Font /Subtype /Type1 /BaseFont /' + fonte + b' /Encoding /WinAnsiEncoding >>')
+
+    def _escrever(self, dados):
+        self.saida.write(dados)
+        self.posicao += len(dados)
+
+    def _objeto(self, numero, conteudo):
+        self.deslocamentos[numero] = self.posicao
+        self._escrever(b'%d 0 obj\n' % numero + conteudo + b'\nendobj\n')
+
+    def _reservar(self):
+        numero = self.proximo_objeto
+        self.proximo_objeto += 1
+        return numero
+
+    def _texto(self, x, y, texto, tamanho=TAMANHO_FONTE, negrito=False):
+        fonte = b'/F2' if negrito else b'/F1'
+        self.comandos.append(
+            b'BT %s %.2f Tf %.2f %.2f Td %s Tj ET' % (fonte, tamanho, x, y, _literal(texto))
+        )
+
+    def _linha_horizontal(self, y):
+        self.comandos.append(b'%.2f %.2f m %.2f %.2f l S' % (MARGEM, y, LARGURA_PAGINA - MARGEM, y))
+
+    def _linha_tabela(self, valores, negrito=False):
+        self.y -= ALTURA_LINHA
+        for indice, valor in enumerate(valores):
+            texto = ajustar_texto(valor, self.largura_coluna - 2 * PREENCHIMENTO, TAMANHO_FONTE, negrito)
+            self._texto(MARGEM + indice * self.largura_coluna + PREENCHIMENTO, self.y + 3, texto, negrito=negrito)
+        self._linha_horizontal(self.y)
+
+    def _nova_pagina(self):
+        self.comandos = [b'0.5 w 0.6 G']
+        self.y = ALTURA_PAGINA - MARGEM
+        if not self.paginas:
+            self.y -= TAMANHO_TITULO
+            self._texto(MARGEM, self.y, self.titulo, TAMANHO_TITULO, negrito=True)
+            if self.subtitulo:
+                self.y -= ALTURA_LINHA + 2
+                self._texto(MARGEM, self.y, self.subtitulo)
+            self.y -= 6
+        self._texto(LARGURA_PAGINA - MARGEM - 40, MARGEM / 2, f'Página {len(self.paginas) + 1}')
+        self._linha_tabela(self.cabecalho, negrito=True)
+
+    def _fechar_pagina(self):
+        conteudo = zlib.compress(b'\n'.join(self.comandos))
+        numero_conteudo, numero_pagina = self._reservar(), self._reservar()
+        self._objeto(
+            numero_conteudo,
+            b'<< /Length %d /Filter /FlateDecode >>\nstream\n' % len(conteudo) + conteudo + b'\nendstream',
+        )
+        self._objeto(numero_pagina, (
+            b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.2f %.2f] /Contents %d 0 R '
+            b'/Resources << /Font << /F1 %d 0 R /F2 %d 0 R >> >> >>'
+        ) % (self.PAGINAS, LARGURA_PAGINA, ALTURA_PAGINA, numero_conteudo, self.FONTE, self.FONTE_NEGRITO))
+        self.paginas.append(numero_pagina)
+        self.comandos = None
+
+    def adicionar_linha(self, valores):
+        if self.comandos is None:
+            self._nova_pagina()
+        elif self.y - ALTURA_LINHA < MARGEM:
+            self._fechar_pagina()
+            self._nova_pagina()
+        self._linha_tabela(['' if valor is None else str(valor) for valor in valores])
+        self.total_linhas += 1
+
+    def finalizar(self, rodape=None):
+        if self.comandos is None or self.y - 2 * ALTURA_LINHA < MARGEM:
+            if self.comandos is not None:
+                self._fechar_pagina()
+            self._nova_pagina()
+        self.y -= ALTURA_LINHA + 4
+        self._texto(MARGEM, self.y, rodape or f'Total de registros: {self.total_linhas}', negrito=True)
+        self._fechar_pagina()
+
+        kids = b' '.join(b'%d 0 R' % numero for numero in self.paginas)
+        self._objeto(self.PAGINAS, b'<< /Type /Pages /Kids [' + kids + b'] /Count %d >>' % len(self.paginas))
+        self._objeto(self.CATALOGO, b'<< /Type /Catalog /Pages %d 0 R >>' % self.PAGINAS)
+
+        inicio_xref = self.posicao
+        total_objetos = self.proximo_objeto
+        self._escrever(b'xref\n0 %d\n0000000000 65535 f \n' % total_objetos)
+        for numero in range(1, total_objetos):
+            self._escrever(b'%010d 00000 n \n' % self.deslocamentos[numero])
+        self._escrever(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (total_objetos, self.CATALOGO, inicio_xref))
+        return self.total_linhas
@@ -0,0 +1,167 @@
+# MariaAlvezApp/previsao.py
+#
+# Previsão de consumo e sugestão de reposição do estoque. Uma única consulta agrupada traz,
+# para todos os lotes, o saldo e as saídas da janela (ESTOQUE_PREVISAO_JANELA_DIAS); o consumo
+# diário de cada medicamento é a soma das saídas dos seus lotes dividida pela janela. Os lotes
+# são então "consumidos" em ordem FEFO nessa taxa para prever quando o estoque acaba e quanto
+# vence antes de ser usado. O resultado fica em cache até o próximo movimento (a chave inclui a
+# versão das tabelas de estoque, ver cache_pdf.versoes_modelos) ou até a meia-noite.
+
+import hashlib
+import math
+from dataclasses import dataclass, field
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from .cache_pdf import versoes_modelos
+from .models import EstoqueMedicamento, MovimentoEstoqueMedicamento, Produto
+from .relatorios import inicio_do_dia
+
+MODELOS_DEPENDENTES = (Produto, EstoqueMedicamento, MovimentoEstoqueMedicamento)
+
+
+@dataclass
+class PrevisaoLote:
+    lote: str
+    data_validade: object
+    quantidade: int
+    consumo_previsto: int = 0   # Unidades usadas antes de vencer
+    perda_prevista: int = 0     # Unidades que vencem antes de serem usadas
+
+
+@dataclass
+class PrevisaoMedicamento:
+    medicamento: str
+    tipo_medicamento: str
+    estoque: int                # Saldo em lotes dentro da validade
+    vencido: int                # Saldo em lotes já vencidos
+    consumo_diario: float
+    dias_de_cobertura: float | None
+    ruptura_em: object          # Data prevista em que o estoque utilizável acaba (None sem consumo)
+    perda_prevista: int
+    sugestao_pedido: int
+    lotes: list = field(default_factory=list)
+
+
+def carregar_lotes(hoje, janela_dias):
+    """(medicamento, tipo, lote, validade, saldo, saídas na janela) de todos os lotes, em ordem FEFO."""
+    saidas_na_janela = Q(
+        movimentoestoquemedicamento__tipo=MovimentoEstoqueMedicamento.SAIDA,
+        movimentoestoquemedicamento__data__gte=inicio_do_dia(hoje - timedelta(days=janela_dias)),
+    )
+    return list(
+        EstoqueMedicamento.objects
+        .annotate(saidas=Sum('movimentoestoquemedicamento__quantidade', filter=saidas_na_janela))
+        .order_by('produto__nome', 'data_validade', 'pk')
+        .values_list('produto__nome', 'produto__tipo_medicamento', 'lote', 'data_validade', 'quantidade', 'saidas')
+    )
+
+
+def projetar(linhas, hoje, janela_dias, prazo_dias, cobertura_dias):
+    """Previsão por medicamento a partir das linhas de carregar_lotes()."""
+    tipos = dict(Produto.TIPOS_MEDICAMENTO)
+    previsoes = []
+    for (medicamento, tipo), lotes in groupby(linhas, key=lambda linha: (linha[0], linha[1])):
+        lotes = list(lotes)
+        consumo_diario = sum(saidas or 0 for *_, saidas in lotes) / janela_dias
+
+        # `cursor`: dias a partir de hoje em que o próximo lote começa a ser usado
+        cursor, previstos, vencido = 0.0, [], 0
+        for _, _, lote, validade, quantidade, _ in lotes:
+            if quantidade <= 0:
+                continue
+            if validade < hoje:
+                vencido += quantidade
+                continue
+            previsto = PrevisaoLote(lote, validade, quantidade)
+            vida = (validade - hoje).days + 1  # Utilizável até o fim do dia da validade
+            if consumo_diario <= 0 or cursor >= vida:
+                previsto.perda_prevista = quantidade
+            elif cursor + quantidade / consumo_diario <= vida:
+                previsto.consumo_previsto = quantidade
+                cursor += quantidade / consumo_diario
+            else:
+                previsto.consumo_previsto = min(quantidade, round(consumo_diario * (vida - cursor)))
+                previsto.perda_prevista = quantidade - previsto.consumo_previsto
+                cursor = vida
+            previstos.append(previsto)
+
+        horizonte = prazo_dias + cobertura_dias
+        previsoes.append(PrevisaoMedicamento(
+            medicamento=medicamento,
+            tipo_medicamento=tipos.get(tipo, tipo),
+            estoque=sum(p.quantidade for p in previstos),
+            vencido=vencido,
+            consumo_diario=round(consumo_diario, 2),
+            dias_de_cobertura=round(cursor, 1) if consumo_diario > 0 else None,
+            ruptura_em=hoje + timedelta(days=math.floor(cursor)) if consumo_diario > 0 else None,
+            perda_prevista=sum(p.perda_prevista for p in previstos),
+            sugestao_pedido=math.ceil(consumo_diario * (horizonte - cursor)) if consumo_diario > 0 and cursor < horizonte else 0,
+            lotes=previstos,
+        ))
+    return previsoes
+
+
+def calcular(hoje=None):
+    hoje = hoje or timezone.localdate()
+    return projetar(
+        carregar_lotes(hoje, settings.ESTOQUE_PREVISAO_JANELA_DIAS), hoje,
+        settings.ESTOQUE_PREVISAO_JANELA_DIAS, settings.ESTOQUE_PRAZO_REPOSICAO_DIAS, settings.ESTOQUE_COBERTURA_DIAS,
+    )
+
+
+def obter_previsao():
+    hoje = timezone.localdate()
+    versoes = sorted(versoes_modelos(MODELOS_DEPENDENTES).items())
+    chave = f"previsao_estoque:{hoje.isoformat()}:{hashlib.sha256(repr(versoes).encode()).hexdigest()}"
+    ate_meia_noite = int((inicio_do_dia(hoje + timedelta(days=1)) - timezone.now()).total_seconds()) + 1
+    return caches[settings.DASHBOARD_CACHE].get_or_set(chave, lambda: calcular(hoje), ate_meia_noite)
+
+
+class RelatorioReposicao:
+    """Sugestão de reposição no formato usado pela exportação CSV/XLSX (ver exportacao.py)."""
+    nome = 'reposicao'
+    template_name = 'relatorios/relatorio_reposicao.html'
+    titulo = 'Sugestão de Reposição de Estoque'
+    colunas = (
+        ('Medicamento', 'medicamento'),
+        ('Tipo', 'tipo_medicamento'),
+        ('Estoque Utilizável', 'estoque'),
+        ('Consumo Diário', 'consumo_diario'),
+        ('Dias de Cobertura', 'dias_de_cobertura'),
+        ('Ruptura Prevista', 'ruptura_em'),
+        ('Perda Prevista (vencimento)', 'perda_prevista'),
+        ('Já Vencido', 'vencido'),
+        ('Sugestão de Pedido', 'sugestao_pedido'),
+    )
+
+    def __init__(self, dados=None):
+        self.dados = dados if dados is not None else {}
+        self.somente_pedidos = not self.dados.get('todos')
+
+    @property
+    def previsoes(self):
+        previsoes = obter_previsao()
+        if self.somente_pedidos:
+            previsoes = [p for p in previsoes if p.sugestao_pedido or p.perda_prevista]
+        return sorted(previsoes, key=lambda p: (p.ruptura_em is None, p.ruptura_em, p.medicamento))
+
+    def get_context(self):
+        return {
+            'previsoes': self.previsoes,
+            'somente_pedidos': self.somente_pedidos,
+            'janela_dias': settings.ESTOQUE_PREVISAO_JANELA_DIAS,
+            'prazo_dias': settings.ESTOQUE_PRAZO_REPOSICAO_DIAS,
+            'cobertura_dias': settings.ESTOQUE_COBERTURA_DIAS,
+            'querystring_filtros': self.dados.urlencode() if hasattr(self.dados, 'urlencode') else '',
+        }
+
+    def linhas_exportacao(self):
+        yield [titulo for titulo, _ in self.colunas]
+        for previsao in self.previsoes:
+            yield [getattr(previsao, atributo) for _, atributo in self.colunas]
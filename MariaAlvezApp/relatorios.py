@@ -0,0 +1,667 @@
+# MariaAlvezApp/relatorios.py
+
+import base64
+from datetime import datetime, time, timedelta
+
+from django.core.exceptions import ValidationError
+from django.db.models import Case, Count, DateField, F, Func, IntegerField, JSONField, Q, Subquery, Value, When
+from django.db.models.functions import JSONObject
+from django.http import QueryDict
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .models import (
+    AgendamentoConsultas, ConsultaClinica, EstoqueMedicamento, MovimentoEstoqueMedicamento, Produto,
+    RegistroVacinacao, RegistroVermifugos, SaldoConsolidado
+)
+from . import busca, estoque
+from .forms import (
+    FiltroConsultaForm, FiltroEstoqueForm, FiltroEstoqueHistoricoForm, FiltroVacinacaoForm,
+    FiltroVermifugosForm, FiltroRegistroServicoForm, FiltroFilaCastracaoForm
+)
+from Terceiros.models import RegistroServico
+
+
+def inicio_do_dia(data):
+    """Meia-noite de `data` no fuso local, como datetime com fuso."""
+    return timezone.make_aware(datetime.combine(data, time.min))
+
+
+def intervalo_de_dias(campo, inicio=None, fim=None):
+    """
+    Filtro de datas locais sobre um DateTimeField como intervalo semiaberto
+    [início 00:00, dia seguinte ao fim 00:00). Ao contrário de `__date`, a coluna é
+    comparada diretamente (sem converter o fuso linha a linha) e o índice é usado.
+    """
+    condicao = Q()
+    if inicio:
+        condicao &= Q(**{f'{campo}__gte': inicio_do_dia(inicio)})
+    if fim:
+        condicao &= Q(**{f'{campo}__lt': inicio_do_dia(fim + timedelta(days=1))})
+    return condicao
+
+
+class DiasEntre(Func):
+    """Número inteiro de dias de `inicio` até `fim` (fim - início), calculado no banco."""
+    arg_joiner = ' - '
+    template = '(%(expressions)s)'  # No PostgreSQL, date - date já é um inteiro em dias
+    output_field = IntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template='CAST(julianday(%(expressions)s) AS INTEGER)', arg_joiner=') - julianday(',
+            **extra_context
+        )
+
+
+class Relatorio:
+    """
+    Definição declarativa de um relatório: formulário de filtro + especificação da queryset.
+    As views HTML e PDF usam a mesma definição, então os filtros e o carregamento
+    antecipado (select_related/only) das relações usadas nos templates ficam num só lugar.
+    """
+    nome = None                 # Usado nos templates e no nome do arquivo exportado
+    form_class = None
+    model = None
+    filtro_base = {}            # Filtro fixo aplicado antes dos filtros do formulário
+    campo_ordenacao = None      # Coluna de ordenação (pode seguir FKs: 'produto__nome'); o pk é usado como desempate
+    ordem_decrescente = False
+    itens_por_pagina = 50
+    select_related = ()
+    only = ()
+    context_object_name = None  # Nome da lista de registros no contexto do template
+    total_context_name = 'total_registros'
+    colunas = ()                # (título, atributo) das colunas exportadas em CSV/XLSX/PDF tabular
+    tamanho_lote_exportacao = 2000
+    titulo = None
+    motor_pdf = 'html'          # 'html' (template_pdf_name + WeasyPrint) ou 'tabular' (pdf_tabular, sem template)
+
+    def __init__(self, dados=None):
+        self.dados = dados if dados is not None else {}
+        self.form = self.form_class(dados)
+        self.hoje = timezone.now().date()
+
+    @classmethod
+    def modelos_dependentes(cls):
+        # Tabelas lidas pelo relatório: o modelo principal e os relacionados via select_related.
+        # Alterações em qualquer uma delas invalidam o PDF em cache (ver cache_pdf.py).
+        modelos = {cls.model}
+        for caminho in cls.select_related:
+            modelo = cls.model
+            for parte in caminho.split('__'):
+                modelo = modelo._meta.get_field(parte).related_model
+                modelos.add(modelo)
+        return modelos
+
+    @property
+    def template_name(self):
+        return f'relatorios/relatorio_{self.nome}.html'
+
+    @property
+    def template_pdf_name(self):
+        return f'relatorios/relatorio_{self.nome}_pdf.html'
+
+    def get_queryset_base(self):
+        qs = self.model.objects.filter(**self.filtro_base)
+        if self.select_related:
+            qs = qs.select_related(*self.select_related)
+        if self.only:
+            qs = qs.only(*self.only)
+        return qs.order_by(*self.get_ordering())
+
+    def get_ordering(self):
+        campo = F(self.campo_ordenacao)
+        if self.ordem_decrescente:
+            return (campo.desc(nulls_last=True), '-pk')
+        return (campo.asc(nulls_last=True), 'pk')
+
+    def filtrar(self, qs, dados):
+        # Cada relatório aplica aqui os filtros do seu formulário
+        return qs
+
+    @cached_property
+    def queryset(self):
+        qs = self.get_queryset_base()
+        if self.form.is_valid():
+            qs = self.filtrar(qs, self.form.cleaned_data)
+        return qs
+
+    def preparar_registro(self, registro):
+        # Gancho para anexar valores calculados em Python a cada registro
+        pass
+
+    @cached_property
+    def registros(self):
+        # Avalia a queryset uma única vez; o cache dela também atende ao .count() dos templates
+        qs = self.queryset
+        for registro in qs:
+            self.preparar_registro(registro)
+        return qs
+
+    # --- PAGINAÇÃO POR CURSOR (KEYSET) ---
+    # Em vez de OFFSET, cada página continua a partir do último (valor de ordenação, pk)
+    # da página anterior, então a página N custa o mesmo que a primeira.
+
+    def codificar_cursor(self, registro):
+        valor = registro
+        for parte in self.campo_ordenacao.split('__'):
+            valor = getattr(valor, parte)
+        # Nulo vira texto vazio; qualquer outro valor ganha o prefixo '=' (inclusive a string vazia)
+        if valor is None:
+            texto = ''
+        else:
+            texto = '=' + (valor.isoformat() if hasattr(valor, 'isoformat') else str(valor))
+        return base64.urlsafe_b64encode(f"{texto}|{registro.pk}".encode()).decode()
+
+    def decodificar_cursor(self, cursor):
+        try:
+            valor, pk = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit('|', 1)
+            modelo = self.model
+            for parte in self.campo_ordenacao.split('__'):
+                campo = modelo._meta.get_field(parte)
+                modelo = campo.related_model
+            if valor and not valor.startswith('='):
+                return None
+            return (campo.to_python(valor[1:]) if valor else None), int(pk)
+        except (ValueError, ValidationError):
+            return None
+
+    def filtro_apos_cursor(self, valor, pk):
+        campo = self.campo_ordenacao
+        comparacao = 'lt' if self.ordem_decrescente else 'gt'
+        if valor is None:
+            # Nulos ficam no fim; depois de um nulo só resta desempatar pelo pk
+            return Q(**{f'{campo}__isnull': True, f'pk__{comparacao}': pk})
+        return (
+            Q(**{f'{campo}__{comparacao}': valor}) |
+            Q(**{campo: valor, f'pk__{comparacao}': pk}) |
+            Q(**{f'{campo}__isnull': True})
+        )
+
+    @cached_property
+    def pagina(self):
+        qs = self.queryset
+        cursor = self.decodificar_cursor(self.dados.get('cursor') or '')
+        if cursor:
+            qs = qs.filter(self.filtro_apos_cursor(*cursor))
+
+        registros = list(qs[:self.itens_por_pagina + 1])
+        tem_proxima = len(registros) > self.itens_por_pagina
+        registros = registros[:self.itens_por_pagina]
+        for registro in registros:
+            self.preparar_registro(registro)
+
+        proximo_cursor = self.codificar_cursor(registros[-1]) if tem_proxima else None
+        return registros, proximo_cursor
+
+    def _querystring(self, cursor=None, **substituir):
+        params = QueryDict(mutable=True)
+        params.update(self.dados)
+        params.pop('cursor', None)
+        for campo, valor in substituir.items():
+            params.pop(campo, None)
+            if valor:
+                params[campo] = valor
+        if cursor:
+            params['cursor'] = cursor
+        return params.urlencode()
+
+    def get_context(self):
+        registros, proximo_cursor = self.pagina
+        return {
+            self.context_object_name: registros,
+            'form': self.form,
+            'hoje': self.hoje,
+            'pagina_inicial': not self.dados.get('cursor'),
+            'querystring_filtros': self._querystring(),
+            'querystring_proxima_pagina': self._querystring(proximo_cursor) if proximo_cursor else None,
+        }
+
+    # --- EXPORTAÇÃO (CSV/XLSX) ---
+    # Percorre a queryset com .iterator(): no PostgreSQL isso usa um cursor no servidor,
+    # então só um lote de registros fica em memória por vez.
+
+    def iterar_registros(self):
+        for registro in self.queryset.iterator(chunk_size=self.tamanho_lote_exportacao):
+            self.preparar_registro(registro)
+            yield registro
+
+    def valor_coluna(self, registro, atributo):
+        valor = registro
+        for parte in atributo.split('.'):
+            valor = getattr(valor, parte, None)
+            if valor is None:
+                return None
+        return valor() if callable(valor) else valor
+
+    def rodape_pdf(self):
+        # Texto do rodapé no PDF tabular; None usa o total de linhas escritas
+        return None
+
+    def linhas_exportacao(self):
+        yield [titulo for titulo, _ in self.colunas]
+        for registro in self.iterar_registros():
+            yield [self.valor_coluna(registro, atributo) for _, atributo in self.colunas]
+
+    def get_context_pdf(self):
+        registros = self.registros
+        return {
+            self.context_object_name: registros,
+            self.total_context_name: registros.count(),
+            'hoje': self.hoje,
+        }
+
+
+class RelatorioConsultas(Relatorio):
+    nome = 'consultas'
+    titulo = 'Relatório de Consultas'
+    form_class = FiltroConsultaForm
+    model = ConsultaClinica
+    campo_ordenacao = 'data_atendimento'
+    ordem_decrescente = True
+    select_related = ('animal', 'veterinario')
+    only = ('data_atendimento', 'tipo_atendimento', 'diagnostico', 'animal__nome', 'veterinario__nome')
+    context_object_name = 'consultas'
+    colunas = (
+        ('Data/Hora', 'data_atendimento'),
+        ('Veterinário', 'veterinario.nome'),
+        ('Animal', 'animal.nome'),
+        ('Tipo de Atendimento', 'get_tipo_atendimento_display'),
+        ('Diagnóstico', 'diagnostico'),
+    )
+    total_context_name = 'total_consultas'
+
+    def filtrar(self, qs, dados):
+        qs = qs.filter(intervalo_de_dias('data_atendimento', dados.get('data_inicio'), dados.get('data_fim')))
+        if dados.get('tutor'):
+            qs = qs.filter(animal__tutor=dados['tutor'])
+        if dados.get('animal'):
+            qs = qs.filter(animal=dados['animal'])
+        if dados.get('busca'):
+            qs = qs.filter(busca.condicao(dados['busca'], ('diagnostico', 'observacoes')))
+        return qs
+
+
+class RelatorioEstoque(Relatorio):
+    nome = 'estoque'
+    titulo = 'Relatório de Estoque de Medicamentos'
+    motor_pdf = 'tabular'
+    form_class = FiltroEstoqueForm
+    model = EstoqueMedicamento
+    campo_ordenacao = 'data_validade'
+    select_related = ('produto',)
+    only = ('produto__nome', 'lote', 'data_validade', 'quantidade')
+    context_object_name = 'estoque'
+    colunas = (
+        ('Medicamento', 'produto.nome'),
+        ('Lote', 'lote'),
+        ('Data de Validade', 'data_validade'),
+        ('Quantidade', 'quantidade'),
+    )
+    total_context_name = 'total_lotes'
+
+    def filtrar(self, qs, dados):
+        if dados.get('medicamento'):
+            qs = qs.filter(produto__nome__icontains=dados['medicamento'])
+        if dados.get('lote'):
+            qs = qs.filter(lote__icontains=dados['lote'])
+        if dados.get('data_validade_inicio'):
+            qs = qs.filter(data_validade__gte=dados['data_validade_inicio'])
+        if dados.get('data_validade_fim'):
+            qs = qs.filter(data_validade__lte=dados['data_validade_fim'])
+
+        status_estoque = dados.get('status_estoque')
+        if status_estoque == 'com_estoque':
+            qs = qs.filter(quantidade__gt=0)
+        elif status_estoque == 'sem_estoque':
+            qs = qs.filter(quantidade=0)
+        elif status_estoque == 'vencidos':
+            qs = qs.filter(data_validade__lt=self.hoje)
+        elif status_estoque == 'vencendo':
+            qs = qs.filter(data_validade__range=(self.hoje, self.hoje + timedelta(days=30)))
+        return qs
+
+    def get_context(self):
+        context = super().get_context()
+        # Total de cada medicamento da página, lido de Produto.quantidade_total (sem somar lotes)
+        produtos = {lote.produto_id for lote in context[self.context_object_name]}
+        context['totais_por_medicamento'] = Produto.objects.filter(pk__in=produtos).values('nome', 'quantidade_total')
+        return context
+
+
+class RelatorioEstoqueHistorico(Relatorio):
+    """
+    Saldo de cada lote no fim de um dia passado, pelo livro de movimentos: último saldo
+    consolidado até a data + movimentos entre ele e a data (ver estoque.saldos_pelo_livro).
+    Com os consolidados periódicos, qualquer data custa o mesmo que a de hoje.
+    """
+    nome = 'estoque_historico'
+    titulo = 'Relatório de Estoque em Data Passada'
+    motor_pdf = 'tabular'
+    form_class = FiltroEstoqueHistoricoForm
+    model = EstoqueMedicamento
+    campo_ordenacao = 'produto__nome'
+    select_related = ('produto',)
+    only = ('produto__nome', 'produto__tipo_medicamento', 'lote', 'data_validade')
+    context_object_name = 'estoque'
+    colunas = (
+        ('Medicamento', 'produto.nome'),
+        ('Lote', 'lote'),
+        ('Tipo', 'produto.get_tipo_medicamento_display'),
+        ('Data de Validade', 'data_validade'),
+        ('Saldo na Data', 'saldo_livro'),
+    )
+    total_context_name = 'total_lotes'
+
+    @classmethod
+    def modelos_dependentes(cls):
+        return {Produto, EstoqueMedicamento, MovimentoEstoqueMedicamento, SaldoConsolidado}
+
+    @cached_property
+    def data_referencia(self):
+        data = self.form.cleaned_data.get('data') if self.form.is_valid() else None
+        return data or self.hoje
+
+    def get_queryset_base(self):
+        # Lotes cadastrados depois da data não existiam nela
+        qs = super().get_queryset_base().filter(data_cadastro__lte=self.data_referencia)
+        return estoque.saldos_pelo_livro(qs, ate=inicio_do_dia(self.data_referencia + timedelta(days=1)))
+
+    def filtrar(self, qs, dados):
+        if dados.get('medicamento'):
+            qs = qs.filter(produto__nome__icontains=dados['medicamento'])
+        if dados.get('lote'):
+            qs = qs.filter(lote__icontains=dados['lote'])
+        if dados.get('tipo_medicamento'):
+            qs = qs.filter(produto__tipo_medicamento=dados['tipo_medicamento'])
+        if dados.get('somente_com_saldo'):
+            qs = qs.filter(saldo_livro__gt=0)
+        return qs
+
+    @cached_property
+    def saldos_por_lote(self):
+        return list(self.queryset.values_list('pk', 'produto__nome', 'lote', 'produto__tipo_medicamento', 'saldo_livro'))
+
+    def saldos_agrupados(self, agrupamento):
+        """Saldos na data por 'lote', 'medicamento' ou 'tipo' (uma consulta, somada aqui)."""
+        rotulos_tipo = dict(Produto.TIPOS_MEDICAMENTO)
+        if agrupamento == 'lote':
+            return [
+                {'id': pk, 'medicamento': medicamento, 'lote': lote, 'tipo': tipo, 'saldo': saldo}
+                for pk, medicamento, lote, tipo, saldo in self.saldos_por_lote
+            ]
+
+        totais = {}
+        for _, medicamento, _, tipo, saldo in self.saldos_por_lote:
+            chave = (medicamento, tipo) if agrupamento == 'medicamento' else (tipo,)
+            totais[chave] = totais.get(chave, 0) + saldo
+        if agrupamento == 'medicamento':
+            return [{'medicamento': m, 'tipo': t, 'saldo': saldo} for (m, t), saldo in sorted(totais.items())]
+        return [{'tipo': t, 'rotulo': rotulos_tipo.get(t, t), 'saldo': saldo} for (t,), saldo in sorted(totais.items())]
+
+    def get_context(self):
+        context = super().get_context()
+        context['data_referencia'] = self.data_referencia
+        context['saldos_por_tipo'] = self.saldos_agrupados('tipo')
+        context['saldos_por_medicamento'] = self.saldos_agrupados('medicamento')
+        return context
+
+    def rodape_pdf(self):
+        partes = [f"{item['rotulo']}: {item['saldo']}" for item in self.saldos_agrupados('tipo')]
+        return f"Saldo em {self.data_referencia.strftime('%d/%m/%Y')}  ({' | '.join(partes)})"
+
+
+class RelatorioComStatus(Relatorio):
+    """
+    Relatório com data de vencimento (revacinação/readministração). A diferença em dias
+    (`days_diff`) e a faixa de status são anotadas no banco, e as contagens por status vêm
+    na mesma consulta das linhas: uma subconsulta de agregação sem correlação (o banco a
+    executa uma vez) anotada em cada registro. Só sem nenhuma linha carregada (ex.: página
+    vazia) as contagens custam uma consulta própria.
+    """
+    campo_vencimento = None
+    campo_filtro_status = None  # Campo do formulário com o status escolhido
+    dias_alerta = 30
+    STATUS = (
+        ('atrasada', 'Atrasadas'),
+        ('vencendo', 'Vencendo'),
+        ('ok', 'Em dia'),
+        ('nao_definida', 'Não definidas'),
+    )
+
+    def condicoes_status(self):
+        campo, hoje = self.campo_vencimento, self.hoje
+        limite = hoje + timedelta(days=self.dias_alerta)
+        return {
+            'atrasada': Q(**{f'{campo}__lt': hoje}),
+            'vencendo': Q(**{f'{campo}__range': (hoje, limite)}),
+            'ok': Q(**{f'{campo}__gt': limite}),
+            'nao_definida': Q(**{f'{campo}__isnull': True}),
+        }
+
+    def queryset_com_status(self):
+        condicoes = self.condicoes_status()
+        return super().get_queryset_base().annotate(
+            days_diff=DiasEntre(self.campo_vencimento, Value(self.hoje, output_field=DateField())),
+            status_vencimento=Case(
+                *[When(condicoes[status], then=Value(status)) for status, _ in self.STATUS if status != 'nao_definida'],
+                default=Value('nao_definida'),
+            ),
+        )
+
+    def get_queryset_base(self):
+        return self.queryset_com_status().annotate(
+            contagem_status_linha=Subquery(self.consulta_contagem(), output_field=JSONField()),
+        )
+
+    def filtrar_campos(self, qs, dados):
+        # Filtros do formulário, exceto o de status (as contagens ignoram o status escolhido)
+        return qs
+
+    def filtrar(self, qs, dados):
+        qs = self.filtrar_campos(qs, dados)
+        status = dados.get(self.campo_filtro_status)
+        if status:
+            # Filtra pelas datas (usa o índice) em vez da expressão anotada
+            qs = qs.filter(self.condicoes_status()[status])
+        return qs
+
+    def consulta_contagem(self):
+        # Contagens de todos os status (ignora o status escolhido), numa linha só em JSON
+        qs = self.queryset_com_status().order_by()
+        if self.form.is_valid():
+            qs = self.filtrar_campos(qs, self.form.cleaned_data)
+        condicoes = self.condicoes_status()
+        resumo = JSONObject(
+            total=Count('pk'),
+            **{status: Count('pk', filter=condicoes[status]) for status, _ in self.STATUS}
+        )
+        return qs.annotate(grupo=Value(1)).values('grupo').annotate(resumo=resumo).values('resumo')[:1]
+
+    def preparar_registro(self, registro):
+        super().preparar_registro(registro)
+        self.__dict__.setdefault('contagem_status', registro.contagem_status_linha)
+
+    @cached_property
+    def contagem_status(self):
+        # Normalmente já preenchida por preparar_registro() com o que veio junto das linhas
+        resumo = next(iter(self.consulta_contagem()), None)
+        return resumo['resumo'] if resumo else dict.fromkeys(['total', *(status for status, _ in self.STATUS)], 0)
+
+    def resumo_status(self):
+        contagem = self.contagem_status
+        return [
+            {
+                'status': status,
+                'rotulo': rotulo,
+                'quantidade': contagem[status],
+                'querystring': self._querystring(**{self.campo_filtro_status: status}),
+            }
+            for status, rotulo in self.STATUS
+        ]
+
+    def get_context(self):
+        context = super().get_context()
+        context['resumo_status'] = self.resumo_status()
+        context['total_geral'] = self.contagem_status['total']
+        context['querystring_todos_status'] = self._querystring(**{self.campo_filtro_status: None})
+        return context
+
+    def get_context_pdf(self):
+        context = super().get_context_pdf()
+        context['resumo_status'] = self.resumo_status()
+        return context
+
+    def rodape_pdf(self):
+        contagem = self.contagem_status
+        partes = [f"{rotulo}: {contagem[status]}" for status, rotulo in self.STATUS]
+        return f"Total de registros: {contagem['total']}  ({' | '.join(partes)})"
+
+
+class RelatorioVacinacao(RelatorioComStatus):
+    nome = 'vacinacao'
+    titulo = 'Relatório de Vacinação'
+    motor_pdf = 'tabular'
+    form_class = FiltroVacinacaoForm
+    model = RegistroVacinacao
+    campo_ordenacao = 'data_aplicacao'
+    campo_vencimento = 'data_revacinacao'
+    campo_filtro_status = 'status_revacinacao'
+    ordem_decrescente = True
+    select_related = ('animal', 'medicamento_aplicado__produto')
+    only = (
+        'data_aplicacao', 'data_revacinacao', 'animal__nome',
+        'medicamento_aplicado__produto__nome', 'medicamento_aplicado__lote',
+    )
+    context_object_name = 'vacinacoes'
+    colunas = (
+        ('Animal', 'animal.nome'),
+        ('Medicamento', 'medicamento_aplicado.produto.nome'),
+        ('Lote', 'medicamento_aplicado.lote'),
+        ('Data Aplicação', 'data_aplicacao'),
+        ('Data Revacinação', 'data_revacinacao'),
+        ('Dias para Revacinação', 'days_diff'),
+    )
+
+    def filtrar_campos(self, qs, dados):
+        if dados.get('animal'):
+            qs = qs.filter(animal=dados['animal'])
+        if dados.get('data_aplicacao_inicio'):
+            qs = qs.filter(data_aplicacao__gte=dados['data_aplicacao_inicio'])
+        if dados.get('data_aplicacao_fim'):
+            qs = qs.filter(data_aplicacao__lte=dados['data_aplicacao_fim'])
+        if dados.get('medicamento'):
+            qs = qs.filter(medicamento_aplicado=dados['medicamento'])
+        return qs
+
+
+class RelatorioVermifugos(RelatorioComStatus):
+    nome = 'vermifugos'
+    titulo = 'Relatório de Vermífugos'
+    form_class = FiltroVermifugosForm
+    model = RegistroVermifugos
+    campo_ordenacao = 'data_administracao'
+    campo_vencimento = 'data_readministracao'
+    campo_filtro_status = 'status_readministracao'
+    ordem_decrescente = True
+    select_related = ('animal', 'medicamento_administrado__produto')
+    only = (
+        'data_administracao', 'data_readministracao', 'animal__nome',
+        'medicamento_administrado__produto__nome', 'medicamento_administrado__lote',
+    )
+    context_object_name = 'vermifugos'
+    colunas = (
+        ('Animal', 'animal.nome'),
+        ('Medicamento', 'medicamento_administrado.produto.nome'),
+        ('Lote', 'medicamento_administrado.lote'),
+        ('Data Administração', 'data_administracao'),
+        ('Data Readministração', 'data_readministracao'),
+        ('Dias para Readministração', 'days_diff'),
+    )
+
+    def filtrar_campos(self, qs, dados):
+        if dados.get('animal'):
+            qs = qs.filter(animal=dados['animal'])
+        if dados.get('data_administracao_inicio'):
+            qs = qs.filter(data_administracao__gte=dados['data_administracao_inicio'])
+        if dados.get('data_administracao_fim'):
+            qs = qs.filter(data_administracao__lte=dados['data_administracao_fim'])
+        if dados.get('medicamento'):
+            qs = qs.filter(medicamento_administrado=dados['medicamento'])
+        return qs
+
+
+class RelatorioServicos(Relatorio):
+    nome = 'servicos'
+    titulo = 'Relatório de Serviços'
+    form_class = FiltroRegistroServicoForm
+    model = RegistroServico
+    campo_ordenacao = 'data_hora_procedimento'
+    ordem_decrescente = True
+    select_related = ('animal', 'empresa')
+    only = (
+        'data_hora_procedimento', 'valor_servico', 'medicamentos_aplicados',
+        'outros_procedimentos', 'animal__nome', 'empresa__razao_social',
+    )
+    context_object_name = 'servicos'
+    colunas = (
+        ('Animal', 'animal.nome'),
+        ('Empresa', 'empresa.razao_social'),
+        ('Data/Hora', 'data_hora_procedimento'),
+        ('Valor (R$)', 'valor_servico'),
+        ('Medicamentos Aplicados', 'medicamentos_aplicados'),
+        ('Outros Procedimentos', 'outros_procedimentos'),
+    )
+
+    def filtrar(self, qs, dados):
+        if dados.get('animal'):
+            qs = qs.filter(animal=dados['animal'])
+        if dados.get('empresa'):
+            qs = qs.filter(empresa=dados['empresa'])
+        qs = qs.filter(intervalo_de_dias('data_hora_procedimento', dados.get('data_inicio'), dados.get('data_fim')))
+
+        if dados.get('busca_texto'):
+            qs = qs.filter(busca.condicao(dados['busca_texto'], ('medicamentos_aplicados', 'outros_procedimentos')))
+        return qs
+
+
+class RelatorioFilaCastracao(Relatorio):
+    nome = 'fila_castracao'
+    titulo = 'Relatório de Fila de Castração'
+    form_class = FiltroFilaCastracaoForm
+    model = AgendamentoConsultas
+    filtro_base = {'is_castracao': True}
+    campo_ordenacao = 'data_consulta'
+    select_related = ('animal__tutor',)
+    only = (
+        'data_consulta', 'animal__nome', 'animal__especie', 'animal__sexo',
+        'animal__castrado', 'animal__tutor__nome',
+    )
+    context_object_name = 'fila_castracao'
+    colunas = (
+        ('Data/Hora', 'data_consulta'),
+        ('Animal', 'animal.nome'),
+        ('Tutor', 'animal.tutor.nome'),
+        ('Espécie', 'animal.especie'),
+        ('Sexo', 'animal.get_sexo_display'),
+        ('Castrado', 'animal.castrado'),
+    )
+
+    def filtrar(self, qs, dados):
+        if dados.get('animal'):
+            qs = qs.filter(animal=dados['animal'])
+        if dados.get('tutor'):
+            qs = qs.filter(animal__tutor=dados['tutor'])
+        qs = qs.filter(intervalo_de_dias('data_consulta', dados.get('data_inicio'), dados.get('data_fim')))
+        return qs
+
+
+# Relatórios disponíveis por nome (usado pelas tarefas de PDF em segundo plano)
+RELATORIOS = {
+    relatorio.nome: relatorio
+    for relatorio in (
+        RelatorioConsultas, RelatorioEstoque, RelatorioEstoqueHistorico, RelatorioVacinacao,
+        RelatorioVermifugos, RelatorioServicos, RelatorioFilaCastracao,
+    )
+}
@@ -0,0 +1,207 @@
+# MariaAlvezApp/relatorios_pdf.py
+#
+# O HTML do relatório é montado no processo web (consultas ao banco) e a conversão
+# HTML -> PDF roda num pool de processos "aquecidos": cada processo do pool importa o
+# WeasyPrint e carrega fontes e folhas de estilo uma única vez. O processo web nunca
+# importa o WeasyPrint.
+
+import io
+import mimetypes
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FuturesTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from functools import lru_cache
+from multiprocessing import get_context
+from urllib.parse import unquote, urlsplit
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.exceptions import SuspiciousFileOperation
+from django.template.loader import get_template
+from django.utils import timezone
+from django.utils._os import safe_join
+
+from .exportacao import formatar_texto
+from .pdf_tabular import DocumentoTabular
+
+FOLHAS_DE_ESTILO = (
+    'admin/css/base.css',
+    'admin/css/forms.css',
+    'admin/css/changelists.css',
+)
+
+
+class RenderizadorOcupado(Exception):
+    """Fila do pool de renderização cheia, tempo limite excedido ou processo interrompido."""
+
+
+def localizar_estatico(relativo):
+    try:
+        if settings.STATIC_ROOT:
+            # Estáticos já coletados (collectstatic) têm prioridade, como no servidor em produção
+            coletado = safe_join(settings.STATIC_ROOT, relativo)
+            if os.path.isfile(coletado):
+                return coletado
+        return finders.find(relativo)
+    except SuspiciousFileOperation:
+        return None
+
+
+def caminho_estatico(url):
+    """Caminho no disco do arquivo estático referenciado pela URL, ou None se não for um estático."""
+    caminho_url = urlsplit(url).path
+    prefixo = urlsplit(settings.STATIC_URL).path
+    if not caminho_url.startswith(prefixo):
+        return None
+    return localizar_estatico(unquote(caminho_url[len(prefixo):]))
+
+
+@lru_cache(maxsize=64)
+def _ler_estatico(caminho):
+    with open(caminho, 'rb') as arquivo:
+        return arquivo.read()
+
+
+# Os objetos abaixo são caros de criar (import do WeasyPrint, fontconfig, parsing de CSS)
+# e são reaproveitados por todas as renderizações do processo.
+
+@lru_cache(maxsize=None)
+def _url_fetcher():
+    from weasyprint.urls import URLFetcher, URLFetcherResponse
+
+    class StaticURLFetcher(URLFetcher):
+        # Lê os arquivos estáticos direto do disco (STATIC_ROOT/STATICFILES_DIRS/apps) em vez de
+        # fazer uma requisição HTTP de volta ao próprio servidor a cada renderização.
+        def fetch(self, url, headers=None):
+            caminho = caminho_estatico(url)
+            if caminho is None:
+                return super().fetch(url, headers)
+            tipo, _ = mimetypes.guess_type(caminho)
+            return URLFetcherResponse(
+                url, body=_ler_estatico(caminho), headers={'Content-Type': tipo or 'application/octet-stream'}
+            )
+
+    return StaticURLFetcher()
+
+
+@lru_cache(maxsize=None)
+def _font_config():
+    from weasyprint.text.fonts import FontConfiguration
+    return FontConfiguration()
+
+
+@lru_cache(maxsize=None)
+def _folhas_de_estilo():
+    from weasyprint import CSS
+
+    url_fetcher, font_config = _url_fetcher(), _font_config()
+    folhas = [CSS(string='@page { size: A4; margin: 1cm; }', font_config=font_config)]
+    for folha in FOLHAS_DE_ESTILO:
+        caminho = localizar_estatico(folha)
+        folhas.append(CSS(string=_ler_estatico(caminho).decode('utf-8'), base_url=caminho, url_fetcher=url_fetcher, font_config=font_config))
+    return tuple(folhas)
+
+
+def html_para_pdf(html, base_url):
+    from weasyprint import HTML
+
+    return HTML(string=html, base_url=base_url, url_fetcher=_url_fetcher()).write_pdf(
+        stylesheets=list(_folhas_de_estilo()),
+        font_config=_font_config(),
+    )
+
+
+# --- POOL DE RENDERIZAÇÃO ---
+
+def _inicializar_processo():
+    # Processo novo (spawn, sem herdar conexões/threads do servidor): configura o Django
+    # e já deixa WeasyPrint, fontes e CSS carregados antes do primeiro pedido
+    import django
+    django.setup()
+    _folhas_de_estilo()
+
+
+_pool = None
+_vagas = None
+_pool_lock = threading.Lock()
+
+
+def _obter_pool():
+    global _pool, _vagas
+    with _pool_lock:
+        if _pool is None:
+            processos = settings.RELATORIOS_PDF_POOL_PROCESSOS
+            _pool = ProcessPoolExecutor(
+                max_workers=processos,
+                mp_context=get_context('spawn'),
+                initializer=_inicializar_processo,
+            )
+            # Fila limitada: PDFs renderizando + aguardando nunca passam desse total
+            _vagas = threading.BoundedSemaphore(processos + settings.RELATORIOS_PDF_POOL_FILA)
+        return _pool, _vagas
+
+
+def _descartar_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _converter_no_pool(html, base_url):
+    pool, vagas = _obter_pool()
+    timeout = settings.RELATORIOS_PDF_POOL_TIMEOUT
+    if not vagas.acquire(timeout=timeout):
+        raise RenderizadorOcupado("Fila de renderização de PDF cheia.")
+    try:
+        futuro = pool.submit(html_para_pdf, html, base_url)
+    except BaseException:
+        vagas.release()
+        raise
+    # A vaga só volta quando o processo termina (ou o pedido é cancelado), mesmo que esta
+    # requisição desista antes: senão PDFs lentos somariam mais renderizações que o limite
+    futuro.add_done_callback(lambda _: vagas.release())
+    try:
+        return futuro.result(timeout=timeout)
+    except FuturesTimeoutError:
+        raise RenderizadorOcupado("A renderização do PDF excedeu o tempo limite.")
+    except BrokenProcessPool:
+        # Um processo do pool morreu (ex.: falta de memória); o próximo pedido cria um pool novo
+        _descartar_pool(pool)
+        raise RenderizadorOcupado("O processo de renderização de PDF foi interrompido.")
+
+
+def renderizar_html(relatorio):
+    template = get_template(relatorio.template_pdf_name)
+    return template.render(relatorio.get_context_pdf())
+
+
+def gerar_pdf_tabular(relatorio):
+    # Lê os registros em lotes (mesmas colunas do CSV/XLSX) e escreve página por página num
+    # arquivo temporário, que só fica em memória enquanto couber no limite do cache
+    linhas = relatorio.linhas_exportacao()
+    saida = tempfile.SpooledTemporaryFile(max_size=settings.RELATORIOS_PDF_CACHE_TAMANHO_MAXIMO)
+    documento = DocumentoTabular(
+        saida, relatorio.titulo, next(linhas),
+        subtitulo=f"Gerado em {timezone.localtime().strftime('%d/%m/%Y %H:%M')}",
+    )
+    for linha in linhas:
+        documento.adicionar_linha([formatar_texto(valor) for valor in linha])
+    documento.finalizar(relatorio.rodape_pdf())
+    saida.seek(0)
+    return saida
+
+
+def gerar_pdf(relatorio, base_url, usar_pool=True):
+    # Devolve o PDF como arquivo binário posicionado no início. Relatórios tabulares não
+    # passam pelo WeasyPrint. Nos demais, as views síncronas usam o pool; o worker de
+    # tarefas em segundo plano já roda em um processo separado e converte direto (usar_pool=False)
+    if relatorio.motor_pdf == 'tabular':
+        return gerar_pdf_tabular(relatorio)
+    html = renderizar_html(relatorio)
+    if usar_pool and settings.RELATORIOS_PDF_POOL_PROCESSOS > 0:
+        return io.BytesIO(_converter_no_pool(html, base_url))
+    return io.BytesIO(html_para_pdf(html, base_url))
@@ -0,0 +1,38 @@
+# MariaAlvezApp/signals.py
+
+import threading
+
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete
+
+from .cache_pdf import invalidar_modelo
+from .dashboard import MODELOS_DEPENDENTES as MODELOS_DASHBOARD
+from .relatorios import RELATORIOS
+
+
+_local = threading.local()
+
+
+def _invalidar_versao(sender, origin=None, **kwargs):
+    # Exclusão em massa dispara post_delete por objeto, todos com o mesmo queryset de origem;
+    # uma invalidação por exclusão basta. A referência guardada impede o reuso do id().
+    if isinstance(origin, QuerySet):
+        ultima = getattr(_local, 'ultima_exclusao', None)
+        if ultima is not None and ultima[0] is sender and ultima[1] is origin:
+            return
+        _local.ultima_exclusao = (sender, origin)
+
+    # Só após o commit: antes disso um PDF renderizado com os dados antigos ganharia a versão nova
+    transaction.on_commit(lambda: invalidar_modelo(sender))
+
+
+def conectar_sinais():
+    modelos = set(MODELOS_DASHBOARD)
+    for relatorio in RELATORIOS.values():
+        modelos |= relatorio.modelos_dependentes()
+
+    for modelo in modelos:
+        uid = f"relatorios_versao_{modelo._meta.label_lower}"
+        post_save.connect(_invalidar_versao, sender=modelo, dispatch_uid=f"{uid}_save")
+        post_delete.connect(_invalidar_versao, sender=modelo, dispatch_uid=f"{uid}_delete")
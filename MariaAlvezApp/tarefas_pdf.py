@@ -0,0 +1,113 @@
+# MariaAlvezApp/tarefas_pdf.py
+#
+# Fila de geração de PDFs baseada no próprio banco de dados (sem broker externo).
+# As views só enfileiram a tarefa; o comando `processar_relatorios_pdf` roda em um
+# processo separado, reserva as tarefas pendentes e grava o PDF pronto em MEDIA_ROOT.
+
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import File
+from django.db import connection, transaction
+from django.db.models import Q
+from django.http import QueryDict
+from django.utils import timezone
+
+from .models import TarefaRelatorioPDF
+from .relatorios import RELATORIOS
+
+logger = logging.getLogger(__name__)
+
+# Chave do advisory lock que serializa a reserva de tarefas entre os workers (PostgreSQL)
+CHAVE_LOCK_RESERVA = 48151623
+
+
+def enfileirar(nome_relatorio, parametros, base_url):
+    if nome_relatorio not in RELATORIOS:
+        raise ValueError(f"Relatório desconhecido: {nome_relatorio}")
+    return TarefaRelatorioPDF.objects.create(relatorio=nome_relatorio, parametros=parametros, base_url=base_url)
+
+
+def reservar_proxima(limite=None):
+    """Marca a próxima tarefa pendente como em processamento, respeitando o limite global de concorrência."""
+    limite = limite or settings.RELATORIOS_PDF_CONCORRENCIA
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s)", [CHAVE_LOCK_RESERVA])
+
+        em_andamento = TarefaRelatorioPDF.objects.filter(status=TarefaRelatorioPDF.PROCESSANDO).count()
+        if em_andamento >= limite:
+            return None
+
+        tarefa = (
+            TarefaRelatorioPDF.objects
+            .select_for_update(skip_locked=True)
+            .filter(status=TarefaRelatorioPDF.PENDENTE)
+            .order_by('criado_em')
+            .first()
+        )
+        if tarefa is None:
+            return None
+
+        tarefa.status = TarefaRelatorioPDF.PROCESSANDO
+        tarefa.iniciado_em = timezone.now()
+        tarefa.save(update_fields=['status', 'iniciado_em'])
+        return tarefa
+
+
+def _finalizar(tarefa, **campos):
+    # Só grava se a tarefa ainda estiver em processamento: recuperar_travadas() pode tê-la dado
+    # como perdida (ERRO) enquanto este worker ainda renderizava
+    campos['concluido_em'] = timezone.now()
+    atualizadas = TarefaRelatorioPDF.objects.filter(pk=tarefa.pk, status=TarefaRelatorioPDF.PROCESSANDO).update(**campos)
+    if atualizadas:
+        for campo, valor in campos.items():
+            setattr(tarefa, campo, valor)
+    return bool(atualizadas)
+
+
+def processar(tarefa):
+    from .relatorios_pdf import gerar_pdf
+
+    try:
+        relatorio = RELATORIOS[tarefa.relatorio](QueryDict(tarefa.parametros))
+        pdf = gerar_pdf(relatorio, tarefa.base_url, usar_pool=False)
+    except Exception as exc:
+        logger.exception("Falha ao gerar PDF da tarefa %s", tarefa.pk)
+        if not _finalizar(tarefa, status=TarefaRelatorioPDF.ERRO, erro=str(exc)):
+            tarefa.refresh_from_db()
+        return tarefa
+
+    with pdf:
+        tarefa.arquivo.save(f"relatorio_{tarefa.relatorio}_{tarefa.pk}.pdf", File(pdf), save=False)
+    if not _finalizar(tarefa, status=TarefaRelatorioPDF.CONCLUIDA, arquivo=tarefa.arquivo.name):
+        # Tarefa já encerrada por tempo limite: o arquivo não fica órfão no MEDIA_ROOT
+        tarefa.arquivo.delete(save=False)
+        tarefa.refresh_from_db()
+    return tarefa
+
+
+def recuperar_travadas():
+    # Um worker que morreu no meio da renderização deixaria a tarefa ocupando uma vaga para sempre
+    limite = timezone.now() - timedelta(minutes=settings.RELATORIOS_PDF_TIMEOUT_MINUTOS)
+    return TarefaRelatorioPDF.objects.filter(
+        status=TarefaRelatorioPDF.PROCESSANDO, iniciado_em__lt=limite
+    ).update(status=TarefaRelatorioPDF.ERRO, erro="Tempo limite de processamento excedido.", concluido_em=timezone.now())
+
+
+def limpar_antigas():
+    limite = timezone.now() - timedelta(hours=settings.RELATORIOS_PDF_RETENCAO_HORAS)
+    # Pendentes antigas foram abandonadas (ex.: nenhum worker rodando): quem pediu já desistiu
+    antigas = TarefaRelatorioPDF.objects.filter(
+        Q(status__in=[TarefaRelatorioPDF.CONCLUIDA, TarefaRelatorioPDF.ERRO], concluido_em__lt=limite) |
+        Q(status=TarefaRelatorioPDF.PENDENTE, criado_em__lt=limite)
+    )
+    removidas = 0
+    for tarefa in antigas.iterator():
+        if tarefa.arquivo:
+            tarefa.arquivo.delete(save=False)
+        tarefa.delete()
+        removidas += 1
+    return removidas
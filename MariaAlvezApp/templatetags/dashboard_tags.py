@@ -0,0 +1,10 @@
+from django import template
+
+from MariaAlvezApp.dashboard import obter_snapshot
+
+register = template.Library()
+
+
+@register.inclusion_tag('admin/dashboard_cards.html')
+def dashboard_cards():
+    return obter_snapshot()
@@ -1 +1,1378 @@
-from django.test import TestCase
\ No newline at end of file
+import csv
+import io
+import threading
+from concurrent.futures import Future
+from datetime import date, datetime, time, timedelta
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection, connections, IntegrityError, models, transaction
+from django.http import FileResponse, QueryDict
+from django.template.loader import get_template
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import (
+    Tutor, Animal, Veterinario, Produto, EstoqueMedicamento, MovimentoEstoqueMedicamento,
+    AgendamentoConsultas, ConsultaClinica, RegistroVacinacao, RegistroVermifugos, TarefaRelatorioPDF,
+    Exames, MedicamentoConsulta, EnderecoCEP, SaldoConsolidado
+)
+from . import agenda, busca, cache_pdf, cep, dashboard, importacao, previsao, relatorios_pdf, tarefas_pdf
+from . import estoque as servico_estoque
+from .exportacao import resposta_csv, resposta_xlsx
+from .forms import AgendamentoConsultasForm
+from .pdf_tabular import DocumentoTabular
+from .relatorios import (
+    RelatorioConsultas, RelatorioEstoque, RelatorioEstoqueHistorico, RelatorioVacinacao,
+    RelatorioVermifugos, RelatorioServicos, RelatorioFilaCastracao
+)
+from Terceiros.models import EmpresaTerceirizada, RegistroServico
+
+
+def criar_lote(medicamento, tipo, quantidade=10000, lote=None):
+    produto, _ = Produto.objects.get_or_create(nome=medicamento, defaults={'tipo_medicamento': tipo})
+    estoque = EstoqueMedicamento.objects.create(
+        produto=produto,
+        lote=lote or f"L-{medicamento}",
+        data_validade=date.today() + timedelta(days=365),
+    )
+    MovimentoEstoqueMedicamento.objects.create(estoque_item=estoque, tipo=MovimentoEstoqueMedicamento.ENTRADA, quantidade=quantidade)
+    estoque.refresh_from_db()
+    return estoque
+
+
+def popular_registros(quantidade):
+    """Cria `quantidade` registros de cada tipo usado pelos relatórios."""
+    # O SQLite testa o suporte a JSON na primeira consulta que o usa (uma vez por conexão);
+    # feito aqui, o teste não entra no orçamento de queries dos relatórios
+    connection.features.supports_json_field
+    hoje = timezone.localdate()
+    veterinario = Veterinario.objects.create(nome="Vet", crmv=f"CRMV-{quantidade}", telefone="49999999999")
+    empresa = EmpresaTerceirizada.objects.create(razao_social=f"Empresa {quantidade}", cnpj=f"{quantidade:018d}")
+    vacina = criar_lote(f"V10-{quantidade}", Produto.VACINA)
+    vermifugo = criar_lote(f"Verm-{quantidade}", Produto.VERMIFUGO)
+
+    for i in range(quantidade):
+        tutor = Tutor.objects.create(
+            nome=f"Tutor {i}", cpf=f"{quantidade:03d}{i:08d}", telefone="49999999999",
+            data_nascimento=date(1990, 1, 1), cep="89500-000", endereco="Rua A", cidade="Caçador", estado="SC",
+        )
+        animal = Animal.objects.create(nome=f"Animal {i}", especie="Cachorro", sexo='M', peso=10, rfid=None, tutor=tutor)
+        agendamento = AgendamentoConsultas.objects.create(animal=animal, is_castracao=True)
+        agendamento.consulta_gerada.veterinario = veterinario
+        agendamento.consulta_gerada.save()
+        RegistroVacinacao.objects.create(animal=animal, produto=vacina.produto, data_aplicacao=hoje, data_revacinacao=hoje + timedelta(days=i))
+        RegistroVermifugos.objects.create(animal=animal, produto=vermifugo.produto, data_administracao=hoje, data_readministracao=hoje + timedelta(days=i))
+        RegistroServico.objects.create(empresa=empresa, animal=animal, medicamentos_aplicados="Dipirona")
+
+
+class RelatorioQueryBudgetTests(TestCase):
+    # Relatórios com PDF em HTML (os tabulares são cobertos em PDFTabularTests)
+    RELATORIOS = [RelatorioConsultas, RelatorioVermifugos, RelatorioServicos, RelatorioFilaCastracao]
+
+    @classmethod
+    def setUpTestData(cls):
+        popular_registros(30)
+
+    def test_pdf_renderiza_com_numero_constante_de_queries(self):
+        # Uma query por relatório (as contagens por status vêm junto), independente da quantidade de linhas
+        for relatorio_class in self.RELATORIOS:
+            with self.subTest(relatorio=relatorio_class.nome):
+                relatorio = relatorio_class({})
+                template = get_template(relatorio.template_pdf_name)
+                with self.assertNumQueries(1):
+                    contexto = relatorio.get_context_pdf()
+                    template.render(contexto)
+                self.assertGreater(contexto[relatorio.total_context_name], 0)
+
+    def test_filtros_compartilhados_entre_html_e_pdf(self):
+        animal = Animal.objects.order_by('pk').first()
+        relatorio = RelatorioVacinacao({'animal': animal.pk})
+        self.assertEqual(len(relatorio.get_context()['vacinacoes']), 1)
+        self.assertEqual(relatorio.get_context_pdf()['total_registros'], 1)
+
+
+class RelatorioStatusTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Revacinação/readministração de hoje até hoje + 39 dias
+        popular_registros(40)
+        animal = Animal.objects.order_by('pk').first()
+        RegistroVermifugos.objects.create(animal=animal, data_administracao=timezone.localdate())
+        RegistroVermifugos.objects.create(
+            animal=animal, data_administracao=timezone.localdate(), data_readministracao=timezone.localdate() - timedelta(days=3)
+        )
+
+    def test_contagens_por_status_em_uma_query(self):
+        relatorio = RelatorioVermifugos({})
+        with self.assertNumQueries(1):
+            contagem = relatorio.contagem_status
+        self.assertEqual(contagem, {'total': 42, 'atrasada': 1, 'vencendo': 31, 'ok': 9, 'nao_definida': 1})
+
+    def test_days_diff_e_status_anotados_no_banco(self):
+        registros = {r.days_diff: r.status_vencimento for r in RelatorioVermifugos({}).queryset}
+        self.assertEqual(registros[-3], 'atrasada')
+        self.assertEqual(registros[0], 'vencendo')
+        self.assertEqual(registros[30], 'vencendo')
+        self.assertEqual(registros[31], 'ok')
+        self.assertEqual(registros[None], 'nao_definida')
+
+    def test_filtro_de_status_nao_altera_o_resumo(self):
+        relatorio = RelatorioVermifugos(QueryDict('status_readministracao=ok'))
+        contexto = relatorio.get_context()
+        self.assertEqual(len(contexto['vermifugos']), 9)
+        self.assertEqual(contexto['total_geral'], 42)
+        resumo = {item['status']: item for item in contexto['resumo_status']}
+        self.assertEqual(resumo['vencendo']['quantidade'], 31)
+        self.assertEqual(QueryDict(resumo['vencendo']['querystring'])['status_readministracao'], 'vencendo')
+
+
+class RelatorioPlanoDeConsultaTests(TestCase):
+    """Falha se algum relatório voltar a ler a tabela inteira (ex.: filtro com __date ou índice removido)."""
+    QUANTIDADE = 3000
+
+    @classmethod
+    def setUpTestData(cls):
+        popular_registros(1)
+        animal = Animal.objects.get()
+        empresa = EmpresaTerceirizada.objects.get()
+        inicio = timezone.now() - timedelta(days=cls.QUANTIDADE)
+        dias = [timedelta(days=i) for i in range(cls.QUANTIDADE)]
+
+        ConsultaClinica.objects.bulk_create(ConsultaClinica(animal=animal, data_atendimento=inicio + d) for d in dias)
+        AgendamentoConsultas.objects.bulk_create(
+            AgendamentoConsultas(animal=animal, data_consulta=inicio + d, is_castracao=i % 10 == 0) for i, d in enumerate(dias)
+        )
+        RegistroVacinacao.objects.bulk_create(
+            RegistroVacinacao(animal=animal, data_aplicacao=(inicio + d).date(), data_revacinacao=(inicio + d).date()) for d in dias
+        )
+        RegistroVermifugos.objects.bulk_create(
+            RegistroVermifugos(animal=animal, data_administracao=(inicio + d).date(), data_readministracao=(inicio + d).date()) for d in dias
+        )
+        RegistroServico.objects.bulk_create(RegistroServico(empresa=empresa, animal=animal, data_hora_procedimento=inicio + d) for d in dias)
+        produtos = Produto.objects.bulk_create(Produto(nome=f"Med {i}") for i in range(len(dias)))
+        EstoqueMedicamento.objects.bulk_create(
+            EstoqueMedicamento(produto=produto, lote=f"LT{i}", data_validade=(inicio + d).date())
+            for i, (produto, d) in enumerate(zip(produtos, dias))
+        )
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def plano(self, qs):
+        sql, params = qs.query.sql_with_params()
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(f"EXPLAIN {sql}", params)
+                return "\n".join(linha[0] for linha in cursor.fetchall())
+            cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+            return "\n".join(linha[-1] for linha in cursor.fetchall())
+
+    def assertSemLeituraSequencial(self, relatorio):
+        tabela = relatorio.model._meta.db_table
+        plano = self.plano(relatorio.queryset[:relatorio.itens_por_pagina])
+        if connection.vendor == 'postgresql':
+            self.assertNotIn(f'Seq Scan on "{tabela}"', plano, plano)
+            self.assertNotIn(f'Seq Scan on {tabela}', plano, plano)
+        else:
+            # No SQLite, "SCAN tabela" sem "USING INDEX" é a leitura completa da tabela
+            for linha in plano.splitlines():
+                self.assertFalse(linha.strip() == f'SCAN {tabela}', plano)
+
+    def test_filtros_de_periodo_e_relacionamento_usam_indices(self):
+        hoje = timezone.localdate()
+        inicio = (hoje - timedelta(days=40)).isoformat()
+        fim = (hoje - timedelta(days=30)).isoformat()
+        animal = Animal.objects.get().pk
+        empresa = EmpresaTerceirizada.objects.get().pk
+        casos = [
+            RelatorioConsultas({'data_inicio': inicio, 'data_fim': fim}),
+            RelatorioFilaCastracao({'data_inicio': inicio, 'data_fim': fim}),
+            RelatorioServicos({'data_inicio': inicio, 'data_fim': fim, 'empresa': empresa}),
+            RelatorioVacinacao({'animal': animal, 'data_aplicacao_inicio': inicio, 'data_aplicacao_fim': fim}),
+            RelatorioVermifugos({'status_readministracao': 'vencendo'}),
+            RelatorioEstoque({'data_validade_inicio': inicio, 'data_validade_fim': fim}),
+        ]
+        for relatorio in casos:
+            with self.subTest(relatorio=relatorio.nome):
+                self.assertTrue(relatorio.form.is_valid(), relatorio.form.errors)
+                self.assertSemLeituraSequencial(relatorio)
+
+    def test_periodo_local_e_semiaberto(self):
+        dia = timezone.localdate() - timedelta(days=35)
+        relatorio = RelatorioConsultas({'data_inicio': dia.isoformat(), 'data_fim': dia.isoformat()})
+        self.assertNotIn('django_datetime_cast_date', str(relatorio.queryset.query))
+        for consulta in relatorio.queryset:
+            self.assertEqual(timezone.localtime(consulta.data_atendimento).date(), dia)
+        self.assertEqual(relatorio.queryset.count(), 1)
+
+
+class RelatorioPaginacaoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        popular_registros(25)
+
+    def percorrer_paginas(self, relatorio_class, consultas=None, **filtros):
+        vistos, dados, paginas = [], QueryDict(mutable=True), 0
+        dados.update(filtros)
+        while True:
+            relatorio = relatorio_class(dados)
+            relatorio.itens_por_pagina = 10
+            # A página em si é uma query (relatórios com status trazem as contagens junto)
+            with self.assertNumQueries(consultas or 1):
+                contexto = relatorio.get_context()
+            vistos.extend(registro.pk for registro in contexto[relatorio.context_object_name])
+            paginas += 1
+            if not contexto['querystring_proxima_pagina']:
+                return vistos, paginas
+            dados = QueryDict(contexto['querystring_proxima_pagina'], mutable=True)
+
+    def test_cursor_percorre_todos_os_registros_sem_repetir(self):
+        # Todas as vacinações têm a mesma data_aplicacao: o desempate pelo pk precisa ser estável
+        vistos, paginas = self.percorrer_paginas(RelatorioVacinacao)
+        self.assertEqual(paginas, 3)
+        self.assertEqual(vistos, list(RelatorioVacinacao({}).queryset.values_list('pk', flat=True)))
+        self.assertEqual(len(set(vistos)), 25)
+
+    def test_cursor_preserva_filtros(self):
+        vistos, _ = self.percorrer_paginas(RelatorioVacinacao, status_revacinacao='vencendo')
+        self.assertEqual(len(vistos), 25)
+        # Página vazia: sem linha para trazer as contagens, o resumo custa uma consulta própria
+        vistos, _ = self.percorrer_paginas(RelatorioVacinacao, consultas=2, status_revacinacao='atrasada')
+        self.assertEqual(vistos, [])
+
+    def test_cursor_com_ordenacao_por_texto(self):
+        # Estoque em data passada ordena pelo nome do medicamento: o cursor guarda uma string
+        for i in range(23):
+            criar_lote(f"Med {i:02d}", Produto.MEDICAMENTO, quantidade=1)
+        vistos, paginas = self.percorrer_paginas(RelatorioEstoqueHistorico, consultas=2)  # + saldos agrupados
+        self.assertEqual(paginas, 3)
+        self.assertEqual(vistos, list(RelatorioEstoqueHistorico({}).queryset.values_list('pk', flat=True)))
+        self.assertEqual(len(set(vistos)), 25)
+
+    def test_cursor_por_campo_relacionado_com_empates(self):
+        # Vários lotes por produto (mesmo produto__nome) e um produto de nome vazio, que não é nulo
+        for i in range(18):
+            criar_lote("" if i < 4 else f"Med {i % 3}", Produto.MEDICAMENTO, quantidade=1, lote=f"L{i}")
+        vistos, paginas = self.percorrer_paginas(RelatorioEstoqueHistorico, consultas=2)
+        self.assertEqual(paginas, 2)
+        self.assertEqual(vistos, list(RelatorioEstoqueHistorico({}).queryset.values_list('pk', flat=True)))
+        self.assertEqual(len(set(vistos)), 20)
+
+        relatorio = RelatorioEstoqueHistorico({})
+        vazio = EstoqueMedicamento.objects.filter(produto__nome="").first()
+        self.assertEqual(relatorio.decodificar_cursor(relatorio.codificar_cursor(vazio)), ("", vazio.pk))
+
+    def test_cursor_invalido_volta_para_primeira_pagina(self):
+        relatorio = RelatorioFilaCastracao({'cursor': 'invalido'})
+        self.assertEqual(len(relatorio.get_context()['fila_castracao']), 25)
+
+
+class RelatorioExportacaoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        popular_registros(20)
+
+    def test_csv_streaming_com_os_mesmos_filtros(self):
+        response = resposta_csv(RelatorioVacinacao({'status_revacinacao': 'vencendo'}))
+        self.assertTrue(response.streaming)
+        with self.assertNumQueries(1):
+            conteudo = b''.join(response.streaming_content).decode('utf-8-sig')
+        linhas = list(csv.reader(io.StringIO(conteudo), delimiter=';'))
+        self.assertEqual(linhas[0][0], 'Animal')
+        self.assertEqual(len(linhas), 21)
+
+    def test_xlsx_contem_todas_as_linhas(self):
+        from openpyxl import load_workbook
+
+        response = resposta_xlsx(RelatorioFilaCastracao({}))
+        planilha = load_workbook(io.BytesIO(b''.join(response.streaming_content))).active
+        self.assertEqual(planilha.max_row, 21)
+        self.assertEqual(planilha.cell(row=1, column=3).value, 'Tutor')
+
+
+class TarefaRelatorioPDFTests(TestCase):
+    def test_reserva_respeita_limite_de_concorrencia(self):
+        for _ in range(3):
+            tarefas_pdf.enfileirar('estoque', '', 'http://testserver/')
+
+        primeira = tarefas_pdf.reservar_proxima(limite=2)
+        segunda = tarefas_pdf.reservar_proxima(limite=2)
+        self.assertNotEqual(primeira.pk, segunda.pk)
+        self.assertIsNone(tarefas_pdf.reservar_proxima(limite=2))
+        self.assertEqual(TarefaRelatorioPDF.objects.filter(status=TarefaRelatorioPDF.PENDENTE).count(), 1)
+
+    def test_enfileirar_relatorio_desconhecido(self):
+        with self.assertRaises(ValueError):
+            tarefas_pdf.enfileirar('inexistente', '', 'http://testserver/')
+
+    def test_limpeza_remove_tarefas_antigas_e_travadas(self):
+        antiga = tarefas_pdf.enfileirar('estoque', '', 'http://testserver/')
+        travada = tarefas_pdf.enfileirar('estoque', '', 'http://testserver/')
+        recente = tarefas_pdf.enfileirar('estoque', '', 'http://testserver/')
+        agora = timezone.now()
+        TarefaRelatorioPDF.objects.filter(pk=antiga.pk).update(status=TarefaRelatorioPDF.CONCLUIDA, concluido_em=agora - timedelta(days=2))
+        TarefaRelatorioPDF.objects.filter(pk=travada.pk).update(status=TarefaRelatorioPDF.PROCESSANDO, iniciado_em=agora - timedelta(hours=1))
+        TarefaRelatorioPDF.objects.filter(pk=recente.pk).update(status=TarefaRelatorioPDF.CONCLUIDA, concluido_em=agora)
+
+        abandonada = tarefas_pdf.enfileirar('estoque', '', 'http://testserver/')
+        TarefaRelatorioPDF.objects.filter(pk=abandonada.pk).update(criado_em=agora - timedelta(days=2))
+
+        self.assertEqual(tarefas_pdf.recuperar_travadas(), 1)
+        self.assertEqual(tarefas_pdf.limpar_antigas(), 2)
+        self.assertEqual(
+            set(TarefaRelatorioPDF.objects.values_list('pk', 'status')),
+            {(travada.pk, TarefaRelatorioPDF.ERRO), (recente.pk, TarefaRelatorioPDF.CONCLUIDA)},
+        )
+
+    def test_tarefa_recuperada_nao_e_sobrescrita_pelo_worker(self):
+        tarefas_pdf.enfileirar('estoque', '', 'http://testserver/')
+        tarefa = tarefas_pdf.reservar_proxima()
+        # O worker ainda renderiza quando a tarefa é dada como travada
+        TarefaRelatorioPDF.objects.filter(pk=tarefa.pk).update(iniciado_em=timezone.now() - timedelta(hours=1))
+        tarefas_pdf.recuperar_travadas()
+
+        with mock.patch('MariaAlvezApp.relatorios_pdf.gerar_pdf', return_value=io.BytesIO(b'%PDF')), \
+                mock.patch('django.core.files.storage.FileSystemStorage.save', return_value='relatorios_pdf/x.pdf'), \
+                mock.patch('django.core.files.storage.FileSystemStorage.delete') as apagar:
+            tarefa = tarefas_pdf.processar(tarefa)
+        self.assertEqual(tarefa.status, TarefaRelatorioPDF.ERRO)
+        self.assertFalse(tarefa.arquivo)
+        apagar.assert_called_once()
+
+
+class CachePDFTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        popular_registros(3)
+
+    def test_chave_ignora_ordem_cursor_e_filtros_vazios(self):
+        a = QueryDict('status_estoque=com_estoque&lote=&medicamento=V10')
+        b = QueryDict('medicamento=V10&status_estoque=com_estoque&cursor=abc')
+        self.assertEqual(cache_pdf.assinatura(RelatorioEstoque(a))[0], cache_pdf.assinatura(RelatorioEstoque(b))[0])
+        self.assertNotEqual(
+            cache_pdf.assinatura(RelatorioEstoque(a))[0],
+            cache_pdf.assinatura(RelatorioEstoque(QueryDict('medicamento=V8')))[0],
+        )
+
+    def test_alteracao_em_tabela_dependente_invalida_a_chave(self):
+        chave_vacinacao = cache_pdf.assinatura(RelatorioVacinacao({}))[0]
+        chave_servicos = cache_pdf.assinatura(RelatorioServicos({}))[0]
+
+        lote = EstoqueMedicamento.objects.filter(produto__tipo_medicamento=Produto.VACINA).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            lote.save()
+
+        self.assertNotEqual(cache_pdf.assinatura(RelatorioVacinacao({}))[0], chave_vacinacao)
+        self.assertEqual(cache_pdf.assinatura(RelatorioServicos({}))[0], chave_servicos)
+
+    def test_obter_ou_gerar_renderiza_uma_vez(self):
+        chave = cache_pdf.assinatura(RelatorioEstoque({}))[0]
+        renderizacoes = []
+
+        def gerar():
+            renderizacoes.append(1)
+            return io.BytesIO(b'%PDF-1.7')
+
+        self.assertEqual(cache_pdf.obter_ou_gerar(chave, gerar).read(), b'%PDF-1.7')
+        self.assertEqual(cache_pdf.obter_ou_gerar(chave, gerar).read(), b'%PDF-1.7')
+        self.assertEqual(len(renderizacoes), 1)
+
+    def test_pdf_grande_nao_vai_para_o_cache(self):
+        chave = cache_pdf.assinatura(RelatorioEstoque({}))[0]
+        with override_settings(RELATORIOS_PDF_CACHE_TAMANHO_MAXIMO=4):
+            arquivo = cache_pdf.obter_ou_gerar(chave, lambda: io.BytesIO(b'%PDF-1.7'))
+        self.assertEqual(arquivo.read(), b'%PDF-1.7')
+        self.assertIsNone(caches[settings.RELATORIOS_PDF_CACHE].get(chave))
+
+    def test_requisicao_simultanea_aguarda_renderizacao_em_andamento(self):
+        chave = cache_pdf.assinatura(RelatorioEstoque({'lote': 'x'}))[0]
+        cache = caches[settings.RELATORIOS_PDF_CACHE]
+        cache.add(f"{chave}:lock", 1)
+
+        def concluir_renderizacao(*args):
+            cache.set(chave, b'pronto')
+
+        with mock.patch('MariaAlvezApp.cache_pdf.time.sleep', side_effect=concluir_renderizacao):
+            resultado = cache_pdf.obter_ou_gerar(chave, lambda: self.fail("não deveria renderizar de novo"))
+        self.assertEqual(resultado.read(), b'pronto')
+
+
+class PoolRenderizacaoPDFTests(TestCase):
+    def test_fila_cheia_responde_503(self):
+        fila_cheia = threading.BoundedSemaphore(1)
+        fila_cheia.acquire()
+        with override_settings(RELATORIOS_PDF_POOL_TIMEOUT=0), \
+                mock.patch.object(relatorios_pdf, '_obter_pool', return_value=(mock.Mock(), fila_cheia)):
+            response = self.client.get(reverse('relatorio_servicos_pdf'))
+        self.assertEqual(response.status_code, 503)
+        self.assertIn('Retry-After', response)
+
+    def test_vaga_fica_ocupada_ate_o_processo_terminar(self):
+        vagas = threading.BoundedSemaphore(1)
+        futuro = Future()
+        pool = mock.Mock(submit=mock.Mock(return_value=futuro))
+        with override_settings(RELATORIOS_PDF_POOL_TIMEOUT=0), \
+                mock.patch.object(relatorios_pdf, '_obter_pool', return_value=(pool, vagas)):
+            with self.assertRaises(relatorios_pdf.RenderizadorOcupado):
+                relatorios_pdf._converter_no_pool('<html></html>', 'http://testserver/')
+        # A requisição desistiu, mas a renderização continua no processo e segura a vaga
+        self.assertFalse(vagas.acquire(blocking=False))
+        futuro.set_result(b'%PDF')
+        self.assertTrue(vagas.acquire(blocking=False))
+
+    def test_worker_em_segundo_plano_nao_usa_pool(self):
+        with mock.patch.object(relatorios_pdf, 'html_para_pdf', return_value=b'%PDF') as converter, \
+                mock.patch.object(relatorios_pdf, '_converter_no_pool') as no_pool:
+            self.assertEqual(relatorios_pdf.gerar_pdf(RelatorioServicos({}), 'http://testserver/', usar_pool=False).read(), b'%PDF')
+        converter.assert_called_once()
+        no_pool.assert_not_called()
+
+
+class PDFTabularTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        popular_registros(3)
+
+    def test_repete_cabecalho_e_fecha_com_total(self):
+        saida = io.BytesIO()
+        documento = DocumentoTabular(saida, 'Teste', ['Animal', 'Observação'])
+        for indice in range(300):
+            documento.adicionar_linha([f'Animal {indice}', 'texto (com parênteses) \\ barra'])
+        self.assertEqual(documento.finalizar(), 300)
+
+        pdf = saida.getvalue()
+        self.assertTrue(pdf.startswith(b'%PDF-1.4'))
+        self.assertTrue(pdf.rstrip().endswith(b'%%EOF'))
+        self.assertGreater(len(documento.paginas), 1)
+        self.assertEqual(pdf.count(b'/Type /Page '), len(documento.paginas))
+
+    def test_relatorio_tabular_le_em_uma_consulta(self):
+        relatorio = RelatorioEstoque({})
+        with self.assertNumQueries(1):
+            pdf = relatorios_pdf.gerar_pdf(relatorio, 'http://testserver/')
+        self.assertTrue(pdf.read().startswith(b'%PDF'))
+
+    def test_view_entrega_o_arquivo_gerado(self):
+        response = self.client.get(reverse('relatorio_estoque_pdf'))
+        self.assertIsInstance(response, FileResponse)
+        self.assertEqual(response['Content-Disposition'], 'inline; filename="relatorio_estoque.pdf"')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF-1.4'))
+
+
+class BuscaTextualTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        popular_registros(3)
+        consulta = ConsultaClinica.objects.order_by('pk').first()
+        consulta.diagnostico = "Otite externa bilateral"
+        consulta.save()
+        RegistroServico.objects.filter(pk=RegistroServico.objects.order_by('pk').first().pk).update(outros_procedimentos="Curativo na pata")
+        cls.usuario = User.objects.create_superuser('admin', 'admin@example.com', 'senha')
+
+    def test_relatorios_filtram_pelo_texto(self):
+        self.assertEqual(len(RelatorioConsultas({'busca': 'otite'}).registros), 1)
+        self.assertEqual(len(RelatorioServicos({'busca_texto': 'curativo'}).registros), 1)
+        self.assertEqual(len(RelatorioServicos({'busca_texto': 'dipirona'}).registros), 3)
+
+    def test_busca_do_admin_combina_texto_e_demais_campos(self):
+        self.client.force_login(self.usuario)
+        url = reverse('admin:MariaAlvezApp_consultaclinica_changelist')
+        response = self.client.get(url, {'q': 'otite'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+        response = self.client.get(url, {'q': 'Animal 2'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+        # Cada campo é uma consulta de pks à parte (unidas), não um OR entre tabelas
+        model_admin = response.context['cl'].model_admin
+        qs, duplicadas = model_admin.get_search_results(response.wsgi_request, ConsultaClinica.objects.all(), 'otite')
+        self.assertIn(' UNION ', str(qs.query))
+        self.assertFalse(duplicadas)
+
+    def test_sql_mantem_vetor_por_trigger(self):
+        instalar, remover = busca.sql_busca_textual('tabela', [('titulo', 'A'), ('texto', 'B')])
+        sql = "\n".join(instalar)
+        self.assertIn('BEFORE INSERT OR UPDATE OF "titulo", "texto"', sql)
+        self.assertIn("setweight(to_tsvector('portugues_unaccent', coalesce(NEW.\"texto\", '')), 'B')", sql)
+        self.assertIn('USING gin (busca)', sql)
+        self.assertEqual(len(remover), 5)
+
+
+class DashboardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Revacinação de hoje até hoje + 9 dias: 1 vacina e 1 vermífugo "do dia"
+        popular_registros(10)
+        cls.usuario = User.objects.create_superuser('admin', 'admin@example.com', 'senha')
+
+    def test_snapshot_com_uma_query_por_card(self):
+        with self.assertNumQueries(5):
+            snapshot = dashboard.montar_snapshot(timezone.localdate())
+        self.assertEqual(snapshot['agendamentos_hoje']['total'], 10)
+        self.assertEqual(len(snapshot['agendamentos_hoje']['itens']), dashboard.ITENS_POR_CARD)
+        self.assertEqual(snapshot['vacinas_hoje']['total'], 1)
+        self.assertEqual(snapshot['vacinas_hoje']['itens'][0]['tutor'], 'Tutor 0')
+        self.assertEqual(snapshot['medicamentos_vencer']['total'], 0)
+
+    def test_snapshot_em_cache_ate_alteracao(self):
+        with mock.patch.object(dashboard, 'montar_snapshot', wraps=dashboard.montar_snapshot) as montar:
+            dashboard.obter_snapshot()
+            dashboard.obter_snapshot()
+            self.assertEqual(montar.call_count, 1)
+
+            registro = RegistroVermifugos.objects.order_by('pk').last()
+            registro.data_readministracao = timezone.localdate()
+            with self.captureOnCommitCallbacks(execute=True):
+                registro.save()
+            self.assertEqual(dashboard.obter_snapshot()['vermifugos_hoje']['total'], 2)
+            self.assertEqual(montar.call_count, 2)
+
+    def test_cards_no_admin_e_no_painel(self):
+        self.client.force_login(self.usuario)
+        for url in (reverse('admin:index'), reverse('painel_gerencial')):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertContains(response, 'Agendamentos de Hoje')
+                self.assertContains(response, 'Animal 0')
+
+
+class AutocompleteFiltrosTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        popular_registros(30)
+        cls.usuario = User.objects.create_superuser('admin', 'admin@example.com', 'senha')
+
+    def test_endpoint_com_prefixo_e_limite(self):
+        self.client.force_login(self.usuario)
+        url = reverse('autocomplete', args=['animal'])
+        with self.assertNumQueries(3):  # sessão, usuário e a busca (tutor no mesmo JOIN)
+            response = self.client.get(url, {'q': 'Animal 1', 'limite': 5})
+        resultados = response.json()['resultados']
+        self.assertEqual(len(resultados), 5)
+        self.assertTrue(all(item['texto'].startswith('Animal 1') for item in resultados))
+        self.assertIn('Tutor: Tutor 1', resultados[0]['texto'])
+
+        response = self.client.get(url, {'limite': 1000})
+        self.assertEqual(len(response.json()['resultados']), 30)
+        self.assertEqual(self.client.get(reverse('autocomplete', args=['inexistente'])).status_code, 404)
+
+    def test_endpoint_exige_login(self):
+        response = self.client.get(reverse('autocomplete', args=['tutor']), {'q': 'Tutor'})
+        self.assertEqual(response.status_code, 302)
+
+    def test_formulario_renderiza_so_a_opcao_escolhida(self):
+        animal = Animal.objects.order_by('pk').first()
+        for relatorio_cls in (RelatorioConsultas, RelatorioVacinacao, RelatorioVermifugos, RelatorioServicos, RelatorioFilaCastracao):
+            with self.subTest(relatorio=relatorio_cls.__name__):
+                form = relatorio_cls(QueryDict(f'animal={animal.pk}')).form
+                self.assertTrue(form.is_valid())
+                with self.assertNumQueries(1):
+                    html = str(form['animal'])
+                self.assertEqual(html.count('<option'), 2)
+                self.assertIn(f'Tutor: {animal.tutor.nome}', html)
+                self.assertIn('data-autocomplete-url', html)
+
+
+def popular_em_massa(quantidade, inicio=0):
+    """Versão com bulk_create de popular_registros, para medir o admin com muitos registros."""
+    hoje = timezone.localdate()
+    agora = timezone.now()
+    veterinario, _ = Veterinario.objects.get_or_create(nome="Vet Massa", crmv="CRMV-MASSA", defaults={'telefone': "49999999999"})
+    empresa, _ = EmpresaTerceirizada.objects.get_or_create(razao_social="Empresa Massa", cnpj="999999999999999999")
+    vacina = EstoqueMedicamento.objects.filter(produto__tipo_medicamento=Produto.VACINA).first() or criar_lote("V-Massa", Produto.VACINA)
+    vermifugo = EstoqueMedicamento.objects.filter(produto__tipo_medicamento=Produto.VERMIFUGO).first() or criar_lote("Verm-Massa", Produto.VERMIFUGO)
+    numeros = range(inicio, inicio + quantidade)
+
+    tutores = Tutor.objects.bulk_create(
+        Tutor(nome=f"Tutor M{i}", cpf=f"9{i:010d}", telefone="49999999999", data_nascimento=date(1990, 1, 1),
+              cep="89500-000", endereco="Rua A", cidade="Caçador", estado="SC")
+        for i in numeros
+    )
+    animais = Animal.objects.bulk_create(
+        Animal(nome=f"Animal M{i}", especie="Gato", sexo='F', peso=4, rfid=None, tutor=tutor) for i, tutor in zip(numeros, tutores)
+    )
+    agendamentos = AgendamentoConsultas.objects.bulk_create(AgendamentoConsultas(animal=animal, data_consulta=agora) for animal in animais)
+    consultas = ConsultaClinica.objects.bulk_create(
+        ConsultaClinica(animal=a.animal, veterinario=veterinario, data_atendimento=agora, agendamento_origem=a) for a in agendamentos
+    )
+    MedicamentoConsulta.objects.bulk_create(MedicamentoConsulta(consulta=c, produto=vacina.produto, medicamento_estoque=vacina, quantidade_aplicada=1) for c in consultas)
+    Exames.objects.bulk_create(Exames(consulta=c, animal=c.animal, nome="Hemograma", tipo='Laboratorial') for c in consultas)
+    RegistroVacinacao.objects.bulk_create(
+        RegistroVacinacao(animal=animal, produto=vacina.produto, medicamento_aplicado=vacina, data_aplicacao=hoje, data_revacinacao=hoje) for animal in animais
+    )
+    RegistroVermifugos.objects.bulk_create(
+        RegistroVermifugos(animal=animal, produto=vermifugo.produto, medicamento_administrado=vermifugo, data_administracao=hoje, data_readministracao=hoje) for animal in animais
+    )
+    RegistroServico.objects.bulk_create(RegistroServico(empresa=empresa, animal=animal, medicamentos_aplicados="Dipirona") for animal in animais)
+    MovimentoEstoqueMedicamento.objects.bulk_create(
+        MovimentoEstoqueMedicamento(estoque_item=vacina, tipo=MovimentoEstoqueMedicamento.ENTRADA, quantidade=1) for _ in numeros
+    )
+
+
+class AdminQueryBudgetTests(TestCase):
+    MODELOS = (
+        Animal, AgendamentoConsultas, ConsultaClinica, Exames, MovimentoEstoqueMedicamento,
+        RegistroVacinacao, RegistroVermifugos, RegistroServico,
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_superuser('admin', 'admin@example.com', 'senha')
+        popular_em_massa(10)
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def _urls(self):
+        for model in self.MODELOS:
+            info = (model._meta.app_label, model._meta.model_name)
+            obj = model.objects.order_by('pk').first()
+            yield f'{model.__name__} (lista)', reverse('admin:%s_%s_changelist' % info)
+            yield f'{model.__name__} (edição)', reverse('admin:%s_%s_change' % info, args=[obj.pk])
+            yield f'{model.__name__} (inclusão)', reverse('admin:%s_%s_add' % info)
+
+    def _medir(self):
+        contagens = {}
+        for nome, url in self._urls():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, nome)
+            contagens[nome] = len(queries)
+        return contagens
+
+    def test_queries_nao_crescem_com_os_registros(self):
+        # 10 linhas na página da lista, depois 100 (página cheia) e por fim 10.000 registros
+        self._medir()  # aquece caches por processo (ContentType, permissões)
+        com_10 = self._medir()
+        popular_em_massa(90, inicio=10)
+        com_100 = self._medir()
+        popular_em_massa(9900, inicio=100)
+        com_10000 = self._medir()
+        self.assertEqual(com_10, com_100)
+        self.assertEqual(com_100, com_10000)
+
+
+def buscador_cep_falso(cep, timeout):
+    if cep == '00000000':
+        return None
+    return {'logradouro': 'Rua Externa', 'bairro': 'Centro', 'cidade': 'Caçador', 'uf': 'SC'}
+
+
+@override_settings(CEP_BUSCADOR='MariaAlvezApp.tests.buscador_cep_falso')
+class ResolucaoCEPTests(TestCase):
+    def setUp(self):
+        cep._cache.limpar()
+        self.addCleanup(cep._cache.limpar)
+
+    def test_busca_externa_so_quando_nao_esta_na_base(self):
+        with mock.patch('MariaAlvezApp.tests.buscador_cep_falso', wraps=buscador_cep_falso) as buscador:
+            self.assertEqual(cep.resolver('89500-000')['logradouro'], 'Rua Externa')
+            cep._cache.limpar()
+            self.assertEqual(cep.resolver('89500000')['cidade'], 'Caçador')  # agora vem da tabela local
+            self.assertEqual(buscador.call_count, 1)
+        with self.assertNumQueries(0):
+            cep.resolver('89500000')  # cache em memória
+        with self.assertRaises(cep.CEPNaoEncontrado):
+            cep.resolver('00000-000')
+        with self.assertRaises(cep.CEPInvalido):
+            cep.resolver('123')
+
+    @override_settings(CEP_BUSCADOR='')
+    def test_importacao_e_resolucao_offline(self):
+        arquivo = io.StringIO(
+            "CEP;Logradouro;Bairro;Localidade;UF\n"
+            "89500-000;Rua A;Centro;Caçador;sc\n"
+            "89500-000;Rua A (atualizada);Centro;Caçador;SC\n"
+            "123;Rua B;Centro;Caçador;SC\n"
+            "01001000;Praça da Sé;Sé;São Paulo;SP\n"
+        )
+        self.assertEqual(cep.importar(arquivo, tamanho_lote=1), (3, 1))
+        self.assertEqual(EnderecoCEP.objects.count(), 2)
+        self.assertEqual(cep.resolver('89500000')['logradouro'], 'Rua A (atualizada)')
+        self.assertEqual(cep.resolver('01001-000')['uf'], 'SP')
+        with self.assertRaises(cep.CEPNaoEncontrado):
+            cep.resolver('88000000')
+
+    def test_endpoint_e_preenchimento_do_tutor(self):
+        usuario = User.objects.create_superuser('admin', 'admin@example.com', 'senha')
+        self.client.force_login(usuario)
+        response = self.client.get(reverse('api_cep', args=['89500000']))
+        self.assertEqual(response.json()['bairro'], 'Centro')
+        self.assertEqual(self.client.get(reverse('api_cep', args=['00000000'])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('api_cep', args=['12'])).status_code, 400)
+
+        tutor = Tutor(nome="Ana", cpf="52998224725", telefone="49999999999", data_nascimento=date(1990, 1, 1),
+                      cep="89500000", endereco="-", cidade="-", estado="SC")
+        with self.assertNumQueries(0):  # CEP já resolvido pelo endpoint: vem do cache em memória
+            tutor.clean()
+        self.assertEqual((tutor.endereco, tutor.cidade, tutor.cep), ("Rua Externa, Centro", "Caçador", "89500-000"))
+
+
+def gerar_cpf(numero):
+    base = [int(d) for d in f"{numero:09d}"]
+    for tamanho in (9, 10):
+        soma = sum(d * (tamanho + 1 - i) for i, d in enumerate(base))
+        base.append((soma * 10 % 11) % 10)
+    return ''.join(map(str, base))
+
+
+@override_settings(CEP_BUSCADOR='MariaAlvezApp.tests.buscador_cep_falso')
+class ImportacaoCadastrosTests(TestCase):
+    CABECALHO = "tutor_nome;cpf;telefone;tutor_data_nascimento;cep;animal_nome;especie;sexo;idade_anos;peso;rfid\n"
+
+    def setUp(self):
+        cep._cache.limpar()
+        self.addCleanup(cep._cache.limpar)
+
+    def _csv(self, *linhas):
+        return io.BytesIO((self.CABECALHO + "".join(f"{linha}\n" for linha in linhas)).encode('utf-8'))
+
+    def test_importa_valida_e_reporta_erros_por_linha(self):
+        existente = Tutor.objects.create(
+            nome="Já Cadastrado", cpf=f"{gerar_cpf(1)[:3]}.{gerar_cpf(1)[3:6]}.{gerar_cpf(1)[6:9]}-{gerar_cpf(1)[9:]}",
+            telefone="49999999999", data_nascimento=date(1980, 1, 1), cep="89500-000", endereco="Rua", cidade="Caçador", estado="SC",
+        )
+        arquivo = self._csv(
+            f"Ana;{gerar_cpf(2)};49999999999;01/02/1990;89500-000;Rex;Cachorro;M;3;10,5;",
+            f"Ana;{gerar_cpf(2)};49999999999;01/02/1990;89500-000;Mimi;Gato;F;1;4;",
+            f"Outro nome;{gerar_cpf(1)};49999999999;01/02/1990;89500000;Bolt;Cachorro;macho;2;8;",
+            f"Bia;{gerar_cpf(3)};49999999999;01/02/1990;00000000;Tom;Gato;M;2;4;",
+            "Caio;11111111111;49999999999;01/02/1990;89500000;;;;;;",
+            f"Duda;{gerar_cpf(4)};49999999999;31/12/1990;89500000;Luna;Gato;X;2;4;",
+        )
+        with mock.patch('MariaAlvezApp.tests.buscador_cep_falso', wraps=buscador_cep_falso) as buscador:
+            resultado = importacao.importar(arquivo, 'cadastros.csv', tamanho_lote=4)
+        self.assertEqual(buscador.call_count, 2)  # 89500000 e 00000000, uma vez cada
+
+        self.assertEqual((resultado.tutores_criados, resultado.tutores_existentes, resultado.animais_criados), (1, 1, 3))
+        self.assertEqual([linha for linha, _ in resultado.erros], [5, 6, 7])
+        self.assertIn("CEP não encontrado", resultado.erros[0][1])
+        self.assertIn("CPF inválido", resultado.erros[1][1])
+        self.assertIn("sexo", resultado.erros[2][1])
+
+        ana = Tutor.objects.get(nome="Ana")
+        self.assertEqual((ana.cep, ana.endereco, ana.estado), ("89500-000", "Rua Externa, Centro", "SC"))
+        self.assertEqual(sorted(ana.animais_tutor.values_list('nome', flat=True)), ["Mimi", "Rex"])
+        self.assertEqual(existente.animais_tutor.get().nome, "Bolt")
+
+        # Reimportar o mesmo arquivo não duplica tutores nem animais
+        arquivo.seek(0)
+        resultado = importacao.importar(arquivo, 'cadastros.csv')
+        self.assertEqual((resultado.tutores_criados, resultado.animais_criados, resultado.animais_existentes), (0, 0, 3))
+
+    def test_upload_xlsx_no_admin(self):
+        from openpyxl import Workbook
+
+        planilha = Workbook()
+        planilha.active.append(self.CABECALHO.strip().split(';'))
+        planilha.active.append(["Ana", int(gerar_cpf(5)), 49999999999, date(1990, 2, 1), 89500000, "Rex", "Cachorro", "M", 3, 10.5, None])
+        conteudo = io.BytesIO()
+        planilha.save(conteudo)
+        conteudo.name = 'cadastros.xlsx'
+        conteudo.seek(0)
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'senha'))
+        url = reverse('admin:MariaAlvezApp_tutor_importar')
+        self.assertContains(self.client.get(reverse('admin:MariaAlvezApp_tutor_changelist')), url)
+        response = self.client.post(url, {'arquivo': conteudo})
+        self.assertContains(response, "1 tutor(es) criado(s)")
+        self.assertEqual(Animal.objects.get().tutor.cpf, f"{gerar_cpf(5)[:3]}.{gerar_cpf(5)[3:6]}.{gerar_cpf(5)[6:9]}-{gerar_cpf(5)[9:]}")
+
+
+def saldo_do_livro(estoque):
+    """Saldo recalculado a partir dos movimentos do lote."""
+    movimentos = MovimentoEstoqueMedicamento.objects.filter(estoque_item=estoque)
+    entradas = sum(movimentos.filter(tipo=MovimentoEstoqueMedicamento.ENTRADA).values_list('quantidade', flat=True))
+    saidas = sum(movimentos.filter(tipo=MovimentoEstoqueMedicamento.SAIDA).values_list('quantidade', flat=True))
+    return entradas - saidas
+
+
+class SaldoEstoqueTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tutor = Tutor.objects.create(
+            nome="Tutor", cpf="12345678909", telefone="49999999999",
+            data_nascimento=date(1990, 1, 1), cep="89500-000", endereco="Rua A", cidade="Caçador", estado="SC",
+        )
+        cls.animal = Animal.objects.create(nome="Rex", especie="Cachorro", sexo='M', peso=10, rfid=None, tutor=cls.tutor)
+
+    def test_instancias_desatualizadas_nao_perdem_saidas(self):
+        estoque = criar_lote("V10", Produto.VACINA, quantidade=5)
+        hoje = timezone.localdate()
+
+        RegistroVacinacao.objects.create(animal=self.animal, produto=estoque.produto, data_aplicacao=hoje, data_revacinacao=hoje)
+        RegistroVacinacao.objects.create(animal=self.animal, produto=estoque.produto, data_aplicacao=hoje, data_revacinacao=hoje)
+        # Editar o lote com o saldo antigo em memória não desfaz as saídas
+        estoque.quantidade = 5
+        estoque.data_validade += timedelta(days=1)
+        estoque.save()
+
+        estoque.refresh_from_db()
+        self.assertEqual(estoque.quantidade, 3)
+        self.assertEqual(estoque.quantidade, saldo_do_livro(estoque))
+
+    def test_saida_maior_que_saldo_e_recusada(self):
+        estoque = criar_lote("Dipirona", Produto.MEDICAMENTO, quantidade=2)
+        consulta = ConsultaClinica.objects.create(animal=self.animal)
+
+        uso = MedicamentoConsulta(consulta=consulta, produto=estoque.produto, quantidade_aplicada=3)
+        with self.assertRaisesMessage(ValidationError, "Estoque insuficiente em lotes dentro da validade. Disponível: 2."):
+            uso.full_clean()
+        with self.assertRaisesMessage(ValidationError, "Disponível: 2, Pedido: 3."):
+            uso.save()
+        self.assertFalse(MedicamentoConsulta.objects.exists())
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            EstoqueMedicamento.objects.filter(pk=estoque.pk).update(quantidade=-1)
+        estoque.refresh_from_db()
+        self.assertEqual(estoque.quantidade, saldo_do_livro(estoque))
+
+
+@skipUnless(connection.vendor == 'postgresql', "Concorrência real exige PostgreSQL (SQLite serializa as escritas).")
+class EstresseEstoqueTests(TransactionTestCase):
+    TRABALHADORES = 40
+    SAIDAS_POR_TRABALHADOR = 8
+    SALDO_INICIAL = 300
+
+    def test_saidas_concorrentes_batem_com_o_livro(self):
+        estoque = criar_lote("V10", Produto.VACINA, quantidade=self.SALDO_INICIAL)
+        tutor = Tutor.objects.create(
+            nome="Tutor", cpf="12345678909", telefone="49999999999",
+            data_nascimento=date(1990, 1, 1), cep="89500-000", endereco="Rua A", cidade="Caçador", estado="SC",
+        )
+        animal = Animal.objects.create(nome="Rex", especie="Cachorro", sexo='M', peso=10, rfid=None, tutor=tutor)
+        consultas = ConsultaClinica.objects.bulk_create(
+            ConsultaClinica(animal=animal) for _ in range(self.TRABALHADORES * self.SAIDAS_POR_TRABALHADOR)
+        )
+        hoje = timezone.localdate()
+        largada = threading.Barrier(self.TRABALHADORES)
+        resultados = []
+
+        def trabalhador(indice):
+            aceitas = recusadas = 0
+            largada.wait()
+            try:
+                for j in range(self.SAIDAS_POR_TRABALHADOR):
+                    try:
+                        if j % 2:
+                            RegistroVacinacao.objects.create(animal=animal, produto_id=estoque.produto_id, data_aplicacao=hoje, data_revacinacao=hoje)
+                        else:
+                            consulta = consultas[indice * self.SAIDAS_POR_TRABALHADOR + j]
+                            MedicamentoConsulta.objects.create(consulta=consulta, produto_id=estoque.produto_id, quantidade_aplicada=1)
+                        aceitas += 1
+                    except ValidationError:
+                        recusadas += 1
+                resultados.append((aceitas, recusadas))
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=trabalhador, args=(i,)) for i in range(self.TRABALHADORES)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        aceitas = sum(a for a, _ in resultados)
+        recusadas = sum(r for _, r in resultados)
+        estoque.refresh_from_db()
+        self.assertEqual(len(resultados), self.TRABALHADORES)
+        self.assertEqual(aceitas, self.SALDO_INICIAL)
+        self.assertEqual(recusadas, self.TRABALHADORES * self.SAIDAS_POR_TRABALHADOR - self.SALDO_INICIAL)
+        self.assertEqual(estoque.quantidade, 0)
+        self.assertEqual(estoque.quantidade, saldo_do_livro(estoque))
+
+
+class ExclusaoEmMassaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        tutor = Tutor.objects.create(
+            nome="Tutor", cpf="12345678909", telefone="49999999999",
+            data_nascimento=date(1990, 1, 1), cep="89500-000", endereco="Rua A", cidade="Caçador", estado="SC",
+        )
+        cls.animal = Animal.objects.create(nome="Rex", especie="Cachorro", sexo='M', peso=10, rfid=None, tutor=tutor)
+
+    def vacinar_em_massa(self, estoque, quantidade):
+        hoje = timezone.localdate()
+        MovimentoEstoqueMedicamento.objects.create(estoque_item=estoque, tipo=MovimentoEstoqueMedicamento.SAIDA, quantidade=quantidade)
+        return RegistroVacinacao.objects.bulk_create(
+            RegistroVacinacao(animal=self.animal, produto=estoque.produto, medicamento_aplicado=estoque, data_aplicacao=hoje, data_revacinacao=hoje)
+            for _ in range(quantidade)
+        )
+
+    def test_exclusao_em_massa_estorna_com_consultas_constantes(self):
+        consultas_por_tamanho = []
+        for tamanho in (10, 900):
+            estoque = criar_lote(f"V10-{tamanho}", Produto.VACINA, quantidade=1000)
+            outro = criar_lote(f"V8-{tamanho}", Produto.VACINA, quantidade=1000)
+            self.vacinar_em_massa(estoque, tamanho)
+            self.vacinar_em_massa(outro, 5)
+
+            with CaptureQueriesContext(connection) as queries:
+                RegistroVacinacao.objects.filter(medicamento_aplicado__in=[estoque, outro]).delete()
+            # O DELETE final sai em lotes de 100 pelo Collector do Django; o estorno é constante
+            consultas_por_tamanho.append(sum(1 for q in queries if not q['sql'].startswith('DELETE')))
+
+            for lote in (estoque, outro):
+                lote.refresh_from_db()
+                self.assertEqual(lote.quantidade, 1000)
+                self.assertEqual(lote.quantidade, saldo_do_livro(lote))
+            self.assertTrue(estoque.movimentoestoquemedicamento_set.filter(
+                observacao=f"Estorno por exclusão em massa de {tamanho} registro(s) de vacinação."
+            ).exists())
+        self.assertEqual(consultas_por_tamanho[0], consultas_por_tamanho[1])
+
+    def test_acao_excluir_do_admin_estorna_estoque(self):
+        estoque = criar_lote("V10", Produto.VACINA, quantidade=50)
+        registros = self.vacinar_em_massa(estoque, 20)
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'senha'))
+        response = self.client.post(reverse('admin:MariaAlvezApp_registrovacinacao_changelist'), {
+            'action': 'delete_selected', 'post': 'yes',
+            '_selected_action': [r.pk for r in registros[:15]],
+        })
+        self.assertEqual(response.status_code, 302)
+        estoque.refresh_from_db()
+        self.assertEqual((RegistroVacinacao.objects.count(), estoque.quantidade), (5, 45))
+        self.assertEqual(estoque.quantidade, saldo_do_livro(estoque))
+
+    def test_excluir_agendamentos_remove_consulta_e_estorna_medicamentos(self):
+        estoque = criar_lote("Dipirona", Produto.MEDICAMENTO, quantidade=10)
+        for _ in range(3):
+            agendamento = AgendamentoConsultas.objects.create(animal=self.animal)
+            MedicamentoConsulta.objects.create(consulta=agendamento.consulta_gerada, produto=estoque.produto, quantidade_aplicada=2)
+        estoque.refresh_from_db()
+        self.assertEqual(estoque.quantidade, 4)
+
+        AgendamentoConsultas.objects.all().delete()
+        estoque.refresh_from_db()
+        self.assertFalse(ConsultaClinica.objects.exists())
+        self.assertEqual(estoque.quantidade, 10)
+        self.assertEqual(estoque.quantidade, saldo_do_livro(estoque))
+
+    def test_excluir_movimentos_desfaz_efeito_no_saldo(self):
+        estoque = criar_lote("V10", Produto.VACINA, quantidade=10)
+        self.vacinar_em_massa(estoque, 4)
+
+        with self.assertRaisesMessage(ValidationError, "Saldo insuficiente"):
+            MovimentoEstoqueMedicamento.objects.filter(tipo=MovimentoEstoqueMedicamento.ENTRADA).delete()
+        MovimentoEstoqueMedicamento.objects.filter(tipo=MovimentoEstoqueMedicamento.SAIDA).delete()
+        estoque.refresh_from_db()
+        self.assertEqual(estoque.quantidade, 10)
+        self.assertEqual(estoque.quantidade, saldo_do_livro(estoque))
+
+
+class ConciliacaoEstoqueTests(TestCase):
+    def setUp(self):
+        self.estoque = criar_lote("V10", Produto.VACINA, quantidade=100)
+        self.outro = criar_lote("V8", Produto.VACINA, quantidade=50)
+        MovimentoEstoqueMedicamento.objects.create(estoque_item=self.estoque, tipo=MovimentoEstoqueMedicamento.SAIDA, quantidade=30)
+        # Movimentos antigos o bastante para entrar num consolidado
+        MovimentoEstoqueMedicamento.objects.update(data=timezone.now() - timedelta(days=1))
+
+    def test_detecta_e_corrige_divergencia(self):
+        EstoqueMedicamento.objects.filter(pk=self.estoque.pk).update(quantidade=75)
+
+        saida = io.StringIO()
+        call_command('conciliar_estoque', stdout=saida)
+        self.assertIn("registrado 75, livro 70, diferença +5", saida.getvalue())
+        self.estoque.refresh_from_db()
+        self.assertEqual(self.estoque.quantidade, 75)
+
+        call_command('conciliar_estoque', '--corrigir', stdout=io.StringIO())
+        self.estoque.refresh_from_db()
+        self.assertEqual(self.estoque.quantidade, 70)
+        self.assertEqual(servico_estoque.conciliar(), [])
+
+    def test_consolidado_limita_a_leitura_aos_movimentos_posteriores(self):
+        self.assertEqual(servico_estoque.registrar_saldos(), 2)
+        self.assertEqual(servico_estoque.registrar_saldos(), 0)  # Nada se moveu desde o consolidado
+        self.assertEqual(SaldoConsolidado.objects.get(estoque_item=self.estoque).saldo, 70)
+
+        MovimentoEstoqueMedicamento.objects.create(estoque_item=self.estoque, tipo=MovimentoEstoqueMedicamento.SAIDA, quantidade=5)
+        with self.assertNumQueries(1):
+            self.assertEqual(servico_estoque.conciliar(), [])
+        self.assertEqual({l.pk: l.saldo_livro for l in servico_estoque.saldos_pelo_livro()}, {self.estoque.pk: 65, self.outro.pk: 50})
+
+        # Excluir um movimento já coberto pelo consolidado descarta o consolidado do lote
+        MovimentoEstoqueMedicamento.objects.get(estoque_item=self.estoque, quantidade=30).delete()
+        self.assertFalse(SaldoConsolidado.objects.filter(estoque_item=self.estoque).exists())
+        self.assertTrue(SaldoConsolidado.objects.filter(estoque_item=self.outro).exists())
+        self.assertEqual(servico_estoque.conciliar(), [])
+        self.assertEqual({l.pk: l.saldo_livro for l in servico_estoque.saldos_pelo_livro()}, {self.estoque.pk: 95, self.outro.pk: 50})
+
+
+class EstoqueHistoricoTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        agora = timezone.now()
+        cls.vacina = criar_lote("V10", Produto.VACINA, quantidade=100)
+        cls.vermifugo = criar_lote("Verm", Produto.VERMIFUGO, quantidade=40)
+        EstoqueMedicamento.objects.update(data_cadastro=agora.date() - timedelta(days=10))
+        MovimentoEstoqueMedicamento.objects.update(data=agora - timedelta(days=10))
+        saida = MovimentoEstoqueMedicamento.objects.create(estoque_item=cls.vacina, tipo=MovimentoEstoqueMedicamento.SAIDA, quantidade=30)
+        MovimentoEstoqueMedicamento.objects.filter(pk=saida.pk).update(data=agora - timedelta(days=5))
+        MovimentoEstoqueMedicamento.objects.create(estoque_item=cls.vacina, tipo=MovimentoEstoqueMedicamento.SAIDA, quantidade=20)
+        cls.hoje = timezone.localdate()
+
+    def saldos(self, dias_atras, agrupar='lote'):
+        relatorio = RelatorioEstoqueHistorico({'data': (self.hoje - timedelta(days=dias_atras)).isoformat()})
+        return relatorio.saldos_agrupados(agrupar)
+
+    def test_saldo_na_data_com_e_sem_consolidado(self):
+        esperado = {7: 100, 5: 70, 0: 50}
+        for consolidado in (False, True):
+            if consolidado:
+                servico_estoque.registrar_saldos()
+            for dias, saldo in esperado.items():
+                with self.subTest(dias=dias, consolidado=consolidado):
+                    lotes = {item['lote']: item['saldo'] for item in self.saldos(dias)}
+                    self.assertEqual(lotes, {"L-V10": saldo, "L-Verm": 40})
+        self.assertEqual(self.saldos(11), [])  # Antes do cadastro dos lotes
+
+        self.assertEqual(
+            self.saldos(5, 'tipo'),
+            [{'tipo': 'vacina', 'rotulo': 'Vacina', 'saldo': 70}, {'tipo': 'vermifugo', 'rotulo': 'Vermífugo', 'saldo': 40}],
+        )
+
+    def test_relatorio_e_api(self):
+        self.client.force_login(User.objects.create_user('staff', password='senha', is_staff=True))
+        data = (self.hoje - timedelta(days=5)).isoformat()
+
+        response = self.client.get(reverse('api_estoque_saldo'), {'data': data, 'agrupar': 'medicamento', 'tipo_medicamento': 'vacina'})
+        self.assertEqual(response.json(), {
+            'data': data, 'agrupamento': 'medicamento',
+            'resultados': [{'medicamento': 'V10', 'tipo': 'vacina', 'saldo': 70}],
+        })
+        self.assertEqual(self.client.get(reverse('api_estoque_saldo'), {'data': 'ontem'}).status_code, 400)
+
+        self.assertContains(self.client.get(reverse('relatorio_estoque_historico'), {'data': data}), "<td>70</td>")
+        csv_texto = b''.join(self.client.get(reverse('relatorio_estoque_historico_csv'), {'data': data}).streaming_content).decode('utf-8-sig')
+        self.assertIn("L-V10", csv_texto)
+        self.assertIn("70", csv_texto)
+
+
+class ProdutoLoteTests(TestCase):
+    def setUp(self):
+        self.a = criar_lote("V10", Produto.VACINA, quantidade=30, lote="A")
+        self.b = criar_lote("V10", Produto.VACINA, quantidade=20, lote="B")
+        self.outro = criar_lote("V8", Produto.VACINA, quantidade=5, lote="A")  # Mesmo código de lote, outro medicamento
+        self.v10 = self.a.produto
+
+    def test_total_do_medicamento_acompanha_os_lotes(self):
+        MovimentoEstoqueMedicamento.objects.create(estoque_item=self.b, tipo=MovimentoEstoqueMedicamento.SAIDA, quantidade=8)
+        MovimentoEstoqueMedicamento.objects.filter(estoque_item=self.a, tipo=MovimentoEstoqueMedicamento.ENTRADA).delete()
+        with self.assertNumQueries(1):
+            self.assertEqual(servico_estoque.saldo_do_medicamento("V10"), 12)
+        self.assertEqual(servico_estoque.saldo_do_medicamento("V8"), 5)
+        self.assertEqual(servico_estoque.conciliar_totais(), [])
+
+        with self.assertRaises(ValidationError):
+            EstoqueMedicamento(produto=self.v10, lote="A", data_validade=self.a.data_validade).validate_constraints()
+
+    def test_lote_trocado_de_medicamento_leva_o_saldo(self):
+        self.b.produto = self.outro.produto
+        self.b.save()
+        totais = dict(Produto.objects.values_list('nome', 'quantidade_total'))
+        self.assertEqual(totais, {"V10": 30, "V8": 25})
+
+    def test_conciliacao_corrige_o_total(self):
+        Produto.objects.filter(pk=self.v10.pk).update(quantidade_total=99)
+        EstoqueMedicamento.objects.filter(pk=self.outro.pk).update(quantidade=7)
+
+        saida = io.StringIO()
+        call_command('conciliar_estoque', '--corrigir', stdout=saida)
+        self.assertIn("V10: total registrado 99, soma dos lotes 50 (corrigido)", saida.getvalue())
+        self.assertEqual(dict(Produto.objects.values_list('nome', 'quantidade_total')), {"V10": 50, "V8": 5})
+        self.assertEqual(servico_estoque.conciliar_totais(), [])
+
+
+class DispensacaoFEFOTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        hoje = timezone.localdate()
+        cls.vence_antes = criar_lote("V10", Produto.VACINA, quantidade=3, lote="A")
+        cls.vence_depois = criar_lote("V10", Produto.VACINA, quantidade=10, lote="B")
+        cls.vencido = criar_lote("V10", Produto.VACINA, quantidade=50, lote="C")
+        cls.vazio = criar_lote("V10", Produto.VACINA, quantidade=1, lote="D")
+        cls.so_vencido = criar_lote("V8", Produto.VACINA, quantidade=5, lote="E")
+        MovimentoEstoqueMedicamento.objects.create(estoque_item=cls.vazio, tipo=MovimentoEstoqueMedicamento.SAIDA, quantidade=1)
+        for lote, dias in ((cls.vence_antes, 10), (cls.vence_depois, 30), (cls.vencido, -1), (cls.vazio, 5), (cls.so_vencido, -1)):
+            EstoqueMedicamento.objects.filter(pk=lote.pk).update(data_validade=hoje + timedelta(days=dias))
+        cls.vacina = cls.vence_antes.produto
+        tutor = Tutor.objects.create(
+            nome="Tutor", cpf="12345678909", telefone="49999999999",
+            data_nascimento=date(1990, 1, 1), cep="89500-000", endereco="Rua A", cidade="Caçador", estado="SC",
+        )
+        cls.animal = Animal.objects.create(nome="Rex", especie="Cachorro", sexo='M', peso=10, rfid=None, tutor=tutor)
+
+    def saldos(self):
+        saldos = dict(EstoqueMedicamento.objects.values_list('pk', 'quantidade'))
+        return saldos[self.vence_antes.pk], saldos[self.vence_depois.pk], saldos[self.vencido.pk]
+
+    def test_dispensa_do_lote_que_vence_primeiro_dividindo_entre_lotes(self):
+        alocacoes = servico_estoque.dispensar(self.vacina, 5, "Campanha de vacinação")
+        self.assertEqual([(a.lote.pk, a.quantidade) for a in alocacoes], [(self.vence_antes.pk, 3), (self.vence_depois.pk, 2)])
+        self.assertEqual(self.saldos(), (0, 8, 50))
+        self.assertEqual(servico_estoque.conciliar(), [])
+
+        with self.assertRaisesMessage(ValidationError, "Disponível: 8, Pedido: 9."):
+            servico_estoque.dispensar(self.vacina, 9, "Campanha de vacinação")
+        self.assertEqual(EstoqueMedicamento.objects.get(pk=self.vence_depois.pk).quantidade, 8)
+
+    def test_consulta_informa_o_medicamento_e_divide_entre_lotes(self):
+        consulta = ConsultaClinica.objects.create(animal=self.animal, data_atendimento=timezone.now())
+        MedicamentoConsulta.objects.create(consulta=consulta, produto=self.vacina, quantidade_aplicada=5)
+        self.assertEqual(
+            list(consulta.medicamentoconsulta_set.order_by('pk').values_list('medicamento_estoque', 'quantidade_aplicada')),
+            [(self.vence_antes.pk, 3), (self.vence_depois.pk, 2)],
+        )
+        self.assertEqual(self.saldos(), (0, 8, 50))
+
+        # Mudar a quantidade devolve o que a linha consumiu e dispensa de novo
+        uso = consulta.medicamentoconsulta_set.get(medicamento_estoque=self.vence_antes)
+        uso.quantidade_aplicada = 1
+        uso.save()
+        self.assertEqual(self.saldos(), (2, 8, 50))
+        self.assertEqual(servico_estoque.conciliar(), [])
+
+    def test_vacinacao_usa_lote_fefo_e_troca_se_vencer_na_nova_data(self):
+        hoje = timezone.localdate()
+        registro = RegistroVacinacao.objects.create(animal=self.animal, produto=self.vacina, data_aplicacao=hoje, data_revacinacao=hoje)
+        self.assertEqual(registro.medicamento_aplicado, self.vence_antes)
+        self.assertEqual(self.saldos(), (2, 10, 50))
+
+        # Registro já aplicado não muda de lote enquanto ele servir para a data
+        registro.data_revacinacao += timedelta(days=1)
+        registro.save()
+        self.assertEqual(self.saldos(), (2, 10, 50))
+
+        # Na nova data o lote A já venceu: a unidade volta para ele e sai do B
+        registro.data_aplicacao = hoje + timedelta(days=20)
+        registro.save()
+        registro.refresh_from_db()
+        self.assertEqual(registro.medicamento_aplicado, self.vence_depois)
+        self.assertEqual(self.saldos(), (3, 9, 50))
+
+    def test_autocomplete_de_dispensacao_oferece_medicamentos_com_lote_utilizavel(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'senha'))
+        url = reverse('admin:autocomplete')
+        parametros = {'app_label': 'MariaAlvezApp', 'term': ''}
+
+        response = self.client.get(url, {**parametros, 'model_name': 'registrovacinacao', 'field_name': 'produto'})
+        self.assertEqual([int(r['id']) for r in response.json()['results']], [self.vacina.pk])
+
+        # Entrada de estoque continua podendo escolher qualquer lote
+        response = self.client.get(url, {**parametros, 'model_name': 'movimentoestoquemedicamento', 'field_name': 'estoque_item'})
+        self.assertEqual(len(response.json()['results']), 5)
+
+    def test_medicamento_sem_lote_dentro_da_validade_e_recusado(self):
+        hoje = timezone.localdate()
+        registro = RegistroVacinacao(animal=self.animal, produto=self.so_vencido.produto, data_aplicacao=hoje, data_revacinacao=hoje)
+        with self.assertRaisesMessage(ValidationError, "Nenhum lote desta vacina"):
+            registro.clean()
+
+
+class PrevisaoEstoqueTests(TestCase):
+    def test_projecao_de_ruptura_perda_e_pedido(self):
+        hoje = date(2025, 3, 10)
+        dia = lambda n: hoje + timedelta(days=n)
+        linhas = [
+            # Consumo de 10/dia: o lote que vence em 10 dias acaba no dia 10, o seguinte no dia 15
+            ("A", 'vacina', "A1", dia(9), 100, 600),
+            ("A", 'vacina', "A2", dia(100), 50, 300),
+            # Consumo de 5/dia: o lote vencido não conta, do outro só 25 saem antes de vencer
+            ("B", 'vermifugo', "B0", dia(-1), 7, None),
+            ("B", 'vermifugo', "B1", dia(4), 100, 450),
+            # Sem saídas: nada a pedir e todo o saldo vence parado
+            ("C", 'outro', "C1", dia(30), 20, None),
+        ]
+        a, b, c = previsao.projetar(linhas, hoje, janela_dias=90, prazo_dias=15, cobertura_dias=30)
+
+        self.assertEqual((a.consumo_diario, a.estoque, a.ruptura_em, a.perda_prevista, a.sugestao_pedido), (10, 150, dia(15), 0, 300))
+        self.assertEqual([(l.consumo_previsto, l.perda_prevista) for l in b.lotes], [(25, 75)])
+        self.assertEqual((b.vencido, b.ruptura_em, b.sugestao_pedido, b.tipo_medicamento), (7, dia(5), 200, 'Vermífugo'))
+        self.assertEqual((c.consumo_diario, c.ruptura_em, c.perda_prevista, c.sugestao_pedido), (0, None, 20, 0))
+
+    def test_previsao_em_cache_ate_o_proximo_movimento(self):
+        lote = criar_lote("V10", Produto.VACINA, quantidade=100)
+        antiga = MovimentoEstoqueMedicamento.objects.create(estoque_item=lote, tipo=MovimentoEstoqueMedicamento.SAIDA, quantidade=50)
+        MovimentoEstoqueMedicamento.objects.filter(pk=antiga.pk).update(data=timezone.now() - timedelta(days=200))
+        MovimentoEstoqueMedicamento.objects.create(estoque_item=lote, tipo=MovimentoEstoqueMedicamento.SAIDA, quantidade=45)
+
+        with self.assertNumQueries(1):
+            previsao.carregar_lotes(timezone.localdate(), settings.ESTOQUE_PREVISAO_JANELA_DIAS)
+
+        with mock.patch.object(previsao, 'calcular', wraps=previsao.calcular) as calcular:
+            [item] = previsao.obter_previsao()
+            previsao.obter_previsao()
+            self.assertEqual(calcular.call_count, 1)
+            self.assertEqual((item.consumo_diario, item.estoque), (0.5, 5))  # Só a saída dentro da janela
+
+            with self.captureOnCommitCallbacks(execute=True):
+                MovimentoEstoqueMedicamento.objects.create(estoque_item=lote, tipo=MovimentoEstoqueMedicamento.SAIDA, quantidade=4)
+            [item] = previsao.obter_previsao()
+            self.assertEqual(calcular.call_count, 2)
+            self.assertEqual(item.estoque, 1)
+
+        response = self.client.get(reverse('relatorio_reposicao'))
+        self.assertContains(response, 'V10')
+        linhas = list(csv.reader(io.StringIO(b''.join(self.client.get(reverse('relatorio_reposicao_csv')).streaming_content).decode('utf-8-sig')), delimiter=';'))
+        self.assertEqual(linhas[1][0], 'V10')
+
+
+class AgendaTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        popular_registros(2)
+        cls.a, cls.b = Animal.objects.order_by('pk')
+        cls.v1 = Veterinario.objects.get()
+        cls.v2 = Veterinario.objects.create(nome="Vet 2", crmv="CRMV-V2", telefone="49999999999")
+        AgendamentoConsultas.objects.all().delete()
+        cls.dia = timezone.localdate() + timedelta(days=7)
+        AgendamentoConsultas.objects.create(animal=cls.a, veterinario=cls.v1, data_consulta=cls.em("09:00"))
+        AgendamentoConsultas.objects.create(animal=cls.b, veterinario=cls.v2, data_consulta=cls.em("10:00"), is_castracao=True)
+        cls.usuario = User.objects.create_superuser('admin', 'admin@example.com', 'senha')
+
+    @classmethod
+    def em(cls, hora, dia=None):
+        return timezone.make_aware(datetime.combine(dia or cls.dia, datetime.strptime(hora, "%H:%M").time()))
+
+    def horarios(self, **filtros):
+        [dia] = agenda.disponibilidade(self.dia, **filtros)['dias']
+        return {h['hora']: h for h in dia['horarios']}
+
+    def test_horarios_livres_por_veterinario_animal_e_duracao(self):
+        livres = {hora: h['livre'] for hora, h in self.horarios(veterinario=self.v1.pk).items()}
+        self.assertEqual((livres['08:45'], livres['09:00'], livres['09:15']), (True, False, True))
+
+        # A castração das 10:00 ocupa quatro horários: sobra uma vaga, só com o outro veterinário
+        horarios = self.horarios(animal=self.b.pk)
+        self.assertEqual([horarios[h]['livre'] for h in ('10:00', '10:45', '11:00')], [False, False, True])
+        self.assertEqual((horarios['10:30']['vagas'], horarios['10:30']['veterinarios_livres']), (1, [self.v1.pk]))
+
+        # Uma castração às 08:15 chegaria às 09:00 do veterinário 1
+        livres = {hora: h['livre'] for hora, h in self.horarios(veterinario=self.v1.pk, is_castracao=True).items()}
+        self.assertEqual((livres['08:00'], livres['08:15']), (True, False))
+
+    def test_conflitos_no_formulario(self):
+        self.assertIsNone(agenda.conflito(self.em("09:00"), veterinario=self.v2.pk, animal=self.b.pk))
+        with override_settings(AGENDA_CAPACIDADE_POR_HORARIO=1):
+            self.assertIn("vagas", agenda.conflito(self.em("09:00"), veterinario=self.v2.pk, animal=self.b.pk))
+
+        dados = {'animal': self.a.pk, 'veterinario': self.v1.pk, 'data_consulta_date': self.dia.isoformat(), 'hora_consulta': '08:45', 'is_castracao': True}
+        form = AgendamentoConsultasForm(dados)
+        self.assertFalse(form.is_valid())
+        self.assertEqual(form.errors['hora_consulta'], ["Já existe uma consulta agendada para este animal nesse horário."])
+
+        # Editando o próprio agendamento, o horário dele não conta como ocupado
+        agendamento = AgendamentoConsultas.objects.get(animal=self.a)
+        form = AgendamentoConsultasForm({**dados, 'hora_consulta': '09:00', 'is_castracao': False}, instance=agendamento)
+        self.assertTrue(form.is_valid(), form.errors)
+
+    def test_semana_cheia_em_duas_consultas(self):
+        segunda = self.dia - timedelta(days=self.dia.weekday())
+        AgendamentoConsultas.objects.bulk_create(
+            AgendamentoConsultas(animal=self.a, data_consulta=self.em(f"{8 + i % 10:02d}:{i % 4 * 15:02d}", segunda + timedelta(days=i % 7)))
+            for i in range(700)
+        )
+        with self.assertNumQueries(2):
+            resultado = agenda.disponibilidade(segunda, 7, animal=self.a.pk)
+        self.assertEqual(len(resultado['dias']), 7)
+        self.assertFalse(any(dia['horarios'][0]['livre'] for dia in resultado['dias']))  # 08:00 ocupado em todos os dias
+
+    def test_endpoint(self):
+        url = reverse('api_agenda_horarios')
+        self.assertEqual(self.client.get(url, {'data': self.dia.isoformat()}).status_code, 302)
+
+        self.client.force_login(self.usuario)
+        resposta = self.client.get(url, {'data': self.dia.isoformat(), 'semana': '1', 'veterinario': self.v1.pk}).json()
+        segunda = self.dia - timedelta(days=self.dia.weekday())
+        self.assertEqual([d['data'] for d in resposta['dias']], [(segunda + timedelta(days=n)).isoformat() for n in range(7)])
+        self.assertEqual(resposta['capacidade'], 2)
+        self.assertEqual(self.client.get(url, {'data': 'amanhã'}).status_code, 400)
+
+    def test_duracao_gravada_no_agendamento(self):
+        castracao = AgendamentoConsultas.objects.get(animal=self.b)
+        self.assertEqual(castracao.data_fim, self.em("11:00"))
+        # Mudar a duração configurada não altera o que já estava agendado
+        with override_settings(AGENDA_DURACAO_CASTRACAO_MINUTOS=15):
+            livres = {hora: h['livre'] for hora, h in self.horarios(animal=self.b.pk).items()}
+        self.assertEqual((livres['10:45'], livres['11:00']), (False, True))
+
+    def test_violacao_da_restricao_vira_erro_no_formulario(self):
+        # Simula a corrida: a verificação do formulário não vê o conflito e o banco recusa a gravação
+        violacao = IntegrityError('conflicting key value violates exclusion constraint "agendamento_animal_sem_sobreposicao"')
+        with mock.patch.object(models.Model, 'save_base', side_effect=violacao):
+            with self.assertRaises(agenda.HorarioOcupado) as contexto:
+                AgendamentoConsultas(animal=self.a, data_consulta=self.em("09:00")).save()
+        self.assertEqual(contexto.exception.message_dict, {'data_consulta': [agenda.CONFLITO_ANIMAL]})
+
+        self.client.force_login(self.usuario)
+        dados = {'animal': self.a.pk, 'veterinario': self.v2.pk, 'data_consulta_date': self.dia.isoformat(), 'hora_consulta': '09:00', '_save': 'Salvar'}
+        # O banco recusa e a verificação do formulário não enxerga o conflito (ex.: agendamento
+        # antigo sobreposto): o formulário volta com o erro, sem 500
+        with mock.patch.object(agenda, 'conflito', return_value=None), \
+                mock.patch.object(models.Model, 'save_base', side_effect=violacao):
+            response = self.client.post(reverse('admin:MariaAlvezApp_agendamentoconsultas_add'), dados)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['adminform'].form.errors['hora_consulta'], [agenda.CONFLITO_ANIMAL])
+        self.assertEqual(AgendamentoConsultas.objects.count(), 2)
+
+        # Na edição, a segunda recusa seguida também vira erro no formulário
+        agendamento = AgendamentoConsultas.objects.get(animal=self.a)
+        url = reverse('admin:MariaAlvezApp_agendamentoconsultas_change', args=[agendamento.pk])
+        with mock.patch.object(agenda, 'conflito', return_value=None), \
+                mock.patch.object(models.Model, 'save_base', side_effect=violacao):
+            for _ in range(2):
+                response = self.client.post(url, {**dados, 'hora_consulta': '09:15'})
+                self.assertContains(response, agenda.CONFLITO_ANIMAL)
+        agendamento.refresh_from_db()
+        self.assertEqual(agendamento.data_consulta, self.em("09:00"))
+
+
+@skipUnless(connection.vendor == 'postgresql', "Concorrência real exige PostgreSQL (SQLite serializa as escritas).")
+class EstresseAgendaTests(TransactionTestCase):
+    TRABALHADORES = 30
+
+    def test_agendamentos_concorrentes_no_mesmo_horario(self):
+        popular_registros(2)
+        a, b = Animal.objects.order_by('pk')
+        veterinario = Veterinario.objects.get()
+        AgendamentoConsultas.objects.all().delete()
+        inicio = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=7), time(9, 0)))
+        largada = threading.Barrier(self.TRABALHADORES)
+        resultados = []
+
+        def trabalhador(indice):
+            # Metade disputa o animal `a`; a outra metade, com o animal `b`, disputa o mesmo veterinário
+            # num horário que se sobrepõe (castração começando 15 minutos antes)
+            animal, castracao = (a, False) if indice % 2 else (b, True)
+            largada.wait()
+            try:
+                with transaction.atomic():
+                    AgendamentoConsultas.objects.create(
+                        animal=animal, veterinario=veterinario, is_castracao=castracao,
+                        data_consulta=inicio - timedelta(minutes=0 if indice % 2 else 15),
+                    )
+                resultados.append('aceito')
+            except agenda.HorarioOcupado as exc:
+                resultados.append(exc.message_dict['data_consulta'][0])
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=trabalhador, args=(i,)) for i in range(self.TRABALHADORES)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(resultados), self.TRABALHADORES)
+        self.assertEqual(resultados.count('aceito'), 1)
+        self.assertEqual(AgendamentoConsultas.objects.count(), 1)
+        self.assertEqual(ConsultaClinica.objects.filter(agendamento_origem__isnull=False).count(), 1)
+        self.assertTrue(set(resultados) - {'aceito'} <= {agenda.CONFLITO_ANIMAL, agenda.CONFLITO_VETERINARIO})
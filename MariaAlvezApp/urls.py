@@ -9,7 +9,13 @@ from .views import (
     relatorio_vacinacao_pdf,
     relatorio_vermifugos_pdf,
     relatorio_servicos_pdf,
-    relatorio_fila_castracao_pdf 
+    relatorio_fila_castracao_pdf,
+    relatorio_consultas_csv, relatorio_consultas_xlsx,
+    relatorio_estoque_csv, relatorio_estoque_xlsx,
+    relatorio_vacinacao_csv, relatorio_vacinacao_xlsx,
+    relatorio_vermifugos_csv, relatorio_vermifugos_xlsx,
+    relatorio_servicos_csv, relatorio_servicos_xlsx,
+    relatorio_fila_castracao_csv, relatorio_fila_castracao_xlsx,
 )
 from . import views
 
@@ -18,21 +24,53 @@ urlpatterns = [
 
     path('relatorios/consultas/', relatorio_consultas, name='relatorio_consultas'),
     path('relatorios/consultas/pdf/', relatorio_consultas_pdf, name='relatorio_consultas_pdf'),
+    path('relatorios/consultas/csv/', relatorio_consultas_csv, name='relatorio_consultas_csv'),
+    path('relatorios/consultas/xlsx/', relatorio_consultas_xlsx, name='relatorio_consultas_xlsx'),
 
     path('relatorios/estoque/', relatorio_estoque, name='relatorio_estoque'),
     path('relatorios/estoque/pdf/', relatorio_estoque_pdf, name='relatorio_estoque_pdf'),
+    path('relatorios/estoque/csv/', relatorio_estoque_csv, name='relatorio_estoque_csv'),
+    path('relatorios/estoque/xlsx/', relatorio_estoque_xlsx, name='relatorio_estoque_xlsx'),
+
+    path('relatorios/estoque-historico/', views.relatorio_estoque_historico, name='relatorio_estoque_historico'),
+    path('relatorios/estoque-historico/pdf/', views.relatorio_estoque_historico_pdf, name='relatorio_estoque_historico_pdf'),
+    path('relatorios/estoque-historico/csv/', views.relatorio_estoque_historico_csv, name='relatorio_estoque_historico_csv'),
+    path('relatorios/estoque-historico/xlsx/', views.relatorio_estoque_historico_xlsx, name='relatorio_estoque_historico_xlsx'),
+
+    path('relatorios/reposicao/', views.relatorio_reposicao, name='relatorio_reposicao'),
+    path('relatorios/reposicao/csv/', views.relatorio_reposicao_csv, name='relatorio_reposicao_csv'),
+    path('relatorios/reposicao/xlsx/', views.relatorio_reposicao_xlsx, name='relatorio_reposicao_xlsx'),
 
     path('relatorios/vacinacao/', relatorio_vacinacao, name='relatorio_vacinacao'),
     path('relatorios/vacinacao/pdf/', relatorio_vacinacao_pdf, name='relatorio_vacinacao_pdf'),
+    path('relatorios/vacinacao/csv/', relatorio_vacinacao_csv, name='relatorio_vacinacao_csv'),
+    path('relatorios/vacinacao/xlsx/', relatorio_vacinacao_xlsx, name='relatorio_vacinacao_xlsx'),
 
     path('relatorios/vermifugos/', relatorio_vermifugos, name='relatorio_vermifugos'),
     path('relatorios/vermifugos/pdf/', relatorio_vermifugos_pdf, name='relatorio_vermifugos_pdf'),
+    path('relatorios/vermifugos/csv/', relatorio_vermifugos_csv, name='relatorio_vermifugos_csv'),
+    path('relatorios/vermifugos/xlsx/', relatorio_vermifugos_xlsx, name='relatorio_vermifugos_xlsx'),
     
     path('relatorios/servicos/', relatorio_servicos, name='relatorio_servicos'),
     path('relatorios/servicos/pdf/', relatorio_servicos_pdf, name='relatorio_servicos_pdf'),
+    path('relatorios/servicos/csv/', relatorio_servicos_csv, name='relatorio_servicos_csv'),
+    path('relatorios/servicos/xlsx/', relatorio_servicos_xlsx, name='relatorio_servicos_xlsx'),
 
     path('relatorios/fila-castracao/', relatorio_fila_castracao, name='relatorio_fila_castracao'),
     path('relatorios/fila-castracao/pdf/', relatorio_fila_castracao_pdf, name='relatorio_fila_castracao_pdf'),
+    path('relatorios/fila-castracao/csv/', relatorio_fila_castracao_csv, name='relatorio_fila_castracao_csv'),
+    path('relatorios/fila-castracao/xlsx/', relatorio_fila_castracao_xlsx, name='relatorio_fila_castracao_xlsx'),
+
+    path('relatorios/autocomplete/<str:fonte>/', views.autocomplete, name='autocomplete'),
+
+    path('api/cep/<str:cep>/', views.api_cep, name='api_cep'),
+    path('api/estoque/saldo/', views.api_estoque_saldo, name='api_estoque_saldo'),
+    path('api/agenda/horarios/', views.api_agenda_horarios, name='api_agenda_horarios'),
+
+    path('relatorios/tarefas-pdf/nova/<str:nome>/', views.tarefa_pdf_criar, name='tarefa_pdf_criar'),
+    path('relatorios/tarefas-pdf/<uuid:pk>/', views.tarefa_pdf, name='tarefa_pdf'),
+    path('relatorios/tarefas-pdf/<uuid:pk>/status/', views.tarefa_pdf_status, name='tarefa_pdf_status'),
+    path('relatorios/tarefas-pdf/<uuid:pk>/download/', views.tarefa_pdf_download, name='tarefa_pdf_download'),
 
     path('admin/painel-gerencial/', views.painel_gerencial, name='painel_gerencial'),
 ]
\ No newline at end of file
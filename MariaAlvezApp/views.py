@@ -1,526 +1,248 @@
 # MariaAlvezApp/views.py
 
-from django.shortcuts import render
-from django.db.models import Q 
-from django.http import HttpResponse
-from django.template.loader import get_template
-from django.utils import timezone
-from datetime import timedelta, datetime
+from datetime import timedelta
+
+from django.shortcuts import render, redirect, get_object_or_404
+from django.http import HttpResponse, JsonResponse, FileResponse, Http404
+from django.views.decorators.http import require_GET, require_POST
+from django.contrib.admin.views.decorators import staff_member_required
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 
 # Importar modelos e formulários do próprio MariaAlvezApp
-from .models import (
-    AgendamentoConsultas, ConsultaClinica, EstoqueMedicamento,
-    RegistroVacinacao, RegistroVermifugos, Animal, Tutor
-)
-from .forms import (
-    FiltroConsultaForm, FiltroEstoqueForm, FiltroVacinacaoForm,
-    FiltroVermifugosForm, FiltroRegistroServicoForm, FiltroFilaCastracaoForm
+from .models import TarefaRelatorioPDF
+from .forms import FiltroAgendaHorariosForm
+from .exportacao import resposta_csv, resposta_xlsx
+from .relatorios import (
+    RelatorioConsultas, RelatorioEstoque, RelatorioEstoqueHistorico, RelatorioVacinacao,
+    RelatorioVermifugos, RelatorioServicos, RelatorioFilaCastracao
 )
 
-# Importar modelos do app Terceiros
-from Terceiros.models import RegistroServico, EmpresaTerceirizada 
-
 # Para PDF
-from weasyprint import HTML, CSS
-from django.conf import settings 
-from django.contrib.staticfiles.storage import staticfiles_storage 
+from .relatorios_pdf import gerar_pdf, RenderizadorOcupado
+from . import cache_pdf
+from .dashboard import obter_snapshot
+from .previsao import RelatorioReposicao
+from . import tarefas_pdf
+from .autocomplete import FONTES, limite_da_requisicao
+from . import cep as servico_cep
+from . import agenda
 
 
 def relatorios_index(request):
     return render(request, 'relatorios/relatorios_index.html')
 
+def _render_relatorio(request, relatorio):
+    return render(request, relatorio.template_name, relatorio.get_context())
+
+def _render_relatorio_pdf(request, relatorio):
+    chave, ultima_alteracao = cache_pdf.assinatura(relatorio)
+    etag = quote_etag(chave.rsplit(':', 1)[-1])
+
+    # O navegador revalida com If-None-Match/If-Modified-Since: sem mudanças, responde 304 sem renderizar
+    response = get_conditional_response(request, etag=etag, last_modified=ultima_alteracao)
+    if response is None:
+        try:
+            arquivo = cache_pdf.obter_ou_gerar(chave, lambda: gerar_pdf(relatorio, request.build_absolute_uri()))
+        except RenderizadorOcupado as exc:
+            response = HttpResponse(f"{exc} Tente novamente em instantes ou use o PDF em segundo plano.", status=503)
+            response['Retry-After'] = '30'
+            return response
+        response = FileResponse(arquivo, content_type='application/pdf', filename=f'relatorio_{relatorio.nome}.pdf')
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(ultima_alteracao)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
 def relatorio_consultas(request):
-    form = FiltroConsultaForm(request.GET)
-    consultas = ConsultaClinica.objects.all().order_by('-data_atendimento')
-
-    if form.is_valid():
-        data_inicio = form.cleaned_data.get('data_inicio')
-        data_fim = form.cleaned_data.get('data_fim')
-        tutor = form.cleaned_data.get('tutor')
-        animal = form.cleaned_data.get('animal')
-
-        if data_inicio:
-            consultas = consultas.filter(data_atendimento__date__gte=data_inicio)
-        if data_fim:
-            consultas = consultas.filter(data_atendimento__date__lte=data_fim)
-        if tutor:
-            consultas = consultas.filter(animal__tutor=tutor)
-        if animal:
-            consultas = consultas.filter(animal=animal)
-
-    context = {'consultas': consultas, 'form': form}
-    return render(request, 'relatorios/relatorio_consultas.html', context)
+    return _render_relatorio(request, RelatorioConsultas(request.GET))
 
 def relatorio_consultas_pdf(request):
-    form = FiltroConsultaForm(request.GET)
-    consultas = ConsultaClinica.objects.all().order_by('-data_atendimento')
-
-    if form.is_valid():
-        data_inicio = form.cleaned_data.get('data_inicio')
-        data_fim = form.cleaned_data.get('data_fim')
-        tutor = form.cleaned_data.get('tutor')
-        animal = form.cleaned_data.get('animal')
-
-        if data_inicio:
-            consultas = consultas.filter(data_atendimento__date__gte=data_inicio)
-        if data_fim:
-            consultas = consultas.filter(data_atendimento__date__lte=data_fim)
-        if tutor:
-            consultas = consultas.filter(animal__tutor=tutor)
-        if animal:
-            consultas = consultas.filter(animal=animal)
-
-    template = get_template('relatorios/relatorio_consultas_pdf.html')
-    html = template.render({'consultas': consultas, 'total_consultas': consultas.count()})
-    
-    pdf_file = HTML(string=html, base_url=request.build_absolute_uri()).write_pdf(
-        stylesheets=[
-            CSS(string='@page { size: A4; margin: 1cm; }'),
-            CSS(url=request.build_absolute_uri(staticfiles_storage.url('admin/css/base.css'))),
-            CSS(url=request.build_absolute_uri(staticfiles_storage.url('admin/css/forms.css'))),
-            CSS(url=request.build_absolute_uri(staticfiles_storage.url('admin/css/changelists.css'))),
-        ]
-    )
-
-    response = HttpResponse(pdf_file, content_type='application/pdf')
-    response['Content-Disposition'] = 'inline; filename="relatorio_consultas.pdf"'
-    return response
+    return _render_relatorio_pdf(request, RelatorioConsultas(request.GET))
+
+def relatorio_consultas_csv(request):
+    return resposta_csv(RelatorioConsultas(request.GET))
+
+def relatorio_consultas_xlsx(request):
+    return resposta_xlsx(RelatorioConsultas(request.GET))
 
 def relatorio_estoque(request):
-    form = FiltroEstoqueForm(request.GET)
-    estoque = EstoqueMedicamento.objects.all().order_by('data_validade')
-    hoje = timezone.now().date()
-
-    if form.is_valid():
-        medicamento = form.cleaned_data.get('medicamento')
-        lote = form.cleaned_data.get('lote')
-        data_validade_inicio = form.cleaned_data.get('data_validade_inicio')
-        data_validade_fim = form.cleaned_data.get('data_validade_fim')
-        status_estoque = form.cleaned_data.get('status_estoque')
-
-        if medicamento:
-            estoque = estoque.filter(medicamento__icontains=medicamento)
-        if lote:
-            estoque = estoque.filter(lote__icontains=lote)
-        if data_validade_inicio:
-            estoque = estoque.filter(data_validade__gte=data_validade_inicio)
-        if data_validade_fim:
-            estoque = estoque.filter(data_validade__lte=data_validade_fim)
-
-        if status_estoque == 'com_estoque':
-            estoque = estoque.filter(quantidade__gt=0)
-        elif status_estoque == 'sem_estoque':
-            estoque = estoque.filter(quantidade=0)
-        elif status_estoque == 'vencidos':
-            estoque = estoque.filter(data_validade__lt=hoje)
-        elif status_estoque == 'vencendo':
-            limite_vencimento = hoje + timedelta(days=30)
-            estoque = estoque.filter(data_validade__range=(hoje, limite_vencimento))
-
-    context = {'estoque': estoque, 'form': form, 'hoje': hoje}
-    return render(request, 'relatorios/relatorio_estoque.html', context)
+    return _render_relatorio(request, RelatorioEstoque(request.GET))
 
 def relatorio_estoque_pdf(request):
-    form = FiltroEstoqueForm(request.GET)
-    estoque = EstoqueMedicamento.objects.all().order_by('data_validade')
-    hoje = timezone.now().date()
-
-    if form.is_valid():
-        medicamento = form.cleaned_data.get('medicamento')
-        lote = form.cleaned_data.get('lote')
-        data_validade_inicio = form.cleaned_data.get('data_validade_inicio')
-        data_validade_fim = form.cleaned_data.get('data_validade_fim')
-        status_estoque = form.cleaned_data.get('status_estoque')
-
-        if medicamento:
-            estoque = estoque.filter(medicamento__icontains=medicamento)
-        if lote:
-            estoque = estoque.filter(lote__icontains=lote)
-        if data_validade_inicio:
-            estoque = estoque.filter(data_validade__gte=data_validade_inicio)
-        if data_validade_fim:
-            estoque = estoque.filter(data_validade__lte=data_validade_fim)
-
-        if status_estoque == 'com_estoque':
-            estoque = estoque.filter(quantidade__gt=0)
-        elif status_estoque == 'sem_estoque':
-            estoque = estoque.filter(quantidade=0)
-        elif status_estoque == 'vencidos':
-            estoque = estoque.filter(data_validade__lt=hoje)
-        elif status_estoque == 'vencendo':
-            limite_vencimento = hoje + timedelta(days=30)
-            estoque = estoque.filter(data_validade__range=(hoje, limite_vencimento))
-    
-    template = get_template('relatorios/relatorio_estoque_pdf.html')
-    html = template.render({'estoque': estoque, 'total_lotes': estoque.count(), 'hoje': hoje})
-    pdf_file = HTML(string=html, base_url=request.build_absolute_uri()).write_pdf(
-        stylesheets=[
-            CSS(string='@page { size: A4; margin: 1cm; }'),
-            CSS(url=request.build_absolute_uri(staticfiles_storage.url('admin/css/base.css'))),
-            CSS(url=request.build_absolute_uri(staticfiles_storage.url('admin/css/forms.css'))),
-            CSS(url=request.build_absolute_uri(staticfiles_storage.url('admin/css/changelists.css'))),
-        ]
-    )
-
-    response = HttpResponse(pdf_file, content_type='application/pdf')
-    response['Content-Disposition'] = 'inline; filename="relatorio_estoque.pdf"'
-    return response
+    return _render_relatorio_pdf(request, RelatorioEstoque(request.GET))
+
+def relatorio_estoque_csv(request):
+    return resposta_csv(RelatorioEstoque(request.GET))
+
+def relatorio_estoque_xlsx(request):
+    return resposta_xlsx(RelatorioEstoque(request.GET))
+
+def relatorio_estoque_historico(request):
+    return _render_relatorio(request, RelatorioEstoqueHistorico(request.GET))
+
+def relatorio_estoque_historico_pdf(request):
+    return _render_relatorio_pdf(request, RelatorioEstoqueHistorico(request.GET))
 
+def relatorio_estoque_historico_csv(request):
+    return resposta_csv(RelatorioEstoqueHistorico(request.GET))
+
+def relatorio_estoque_historico_xlsx(request):
+    return resposta_xlsx(RelatorioEstoqueHistorico(request.GET))
+
+def relatorio_reposicao(request):
+    return _render_relatorio(request, RelatorioReposicao(request.GET))
+
+def relatorio_reposicao_csv(request):
+    return resposta_csv(RelatorioReposicao(request.GET))
+
+def relatorio_reposicao_xlsx(request):
+    return resposta_xlsx(RelatorioReposicao(request.GET))
 
 def relatorio_vacinacao(request):
-    form = FiltroVacinacaoForm(request.GET)
-    vacinacoes = RegistroVacinacao.objects.all().order_by('-data_aplicacao')
-    hoje = timezone.now().date()
-
-    if form.is_valid():
-        animal = form.cleaned_data.get('animal')
-        data_aplicacao_inicio = form.cleaned_data.get('data_aplicacao_inicio')
-        data_aplicacao_fim = form.cleaned_data.get('data_aplicacao_fim')
-        status_revacinacao = form.cleaned_data.get('status_revacinacao')
-        medicamento = form.cleaned_data.get('medicamento')
-
-        if animal:
-            vacinacoes = vacinacoes.filter(animal=animal)
-        if data_aplicacao_inicio:
-            vacinacoes = vacinacoes.filter(data_aplicacao__gte=data_aplicacao_inicio)
-        if data_aplicacao_fim:
-            vacinacoes = vacinacoes.filter(data_aplicacao__lte=data_aplicacao_fim)
-        if medicamento:
-            vacinacoes = vacinacoes.filter(medicamento_aplicado=medicamento)
-
-        if status_revacinacao:
-            if status_revacinacao == 'ok':
-                vacinacoes = vacinacoes.filter(Q(data_revacinacao__gte=hoje + timedelta(days=31)) | Q(data_revacinacao__isnull=True))
-            elif status_revacinacao == 'vencendo':
-                limite_vencimento = hoje + timedelta(days=30)
-                vacinacoes = vacinacoes.filter(data_revacinacao__range=(hoje, limite_vencimento))
-            elif status_revacinacao == 'atrasada':
-                vacinacoes = vacinacoes.filter(data_revacinacao__lt=hoje)
-            elif status_revacinacao == 'nao_definida':
-                vacinacoes = vacinacoes.filter(data_revacinacao__isnull=True)
-    
-    for vacina in vacinacoes:
-        if vacina.data_revacinacao:
-            vacina.days_diff = (vacina.data_revacinacao - hoje).days
-        else:
-            vacina.days_diff = None
-
-    context = {'vacinacoes': vacinacoes, 'form': form, 'hoje': hoje}
-    return render(request, 'relatorios/relatorio_vacinacao.html', context)
+    return _render_relatorio(request, RelatorioVacinacao(request.GET))
 
 def relatorio_vacinacao_pdf(request):
-    form = FiltroVacinacaoForm(request.GET)
-    vacinacoes = RegistroVacinacao.objects.all().order_by('-data_aplicacao')
-    hoje = timezone.now().date()
-
-    if form.is_valid():
-        animal = form.cleaned_data.get('animal')
-        data_aplicacao_inicio = form.cleaned_data.get('data_aplicacao_inicio')
-        data_aplicacao_fim = form.cleaned_data.get('data_aplicacao_fim')
-        status_revacinacao = form.cleaned_data.get('status_revacinacao')
-        medicamento = form.cleaned_data.get('medicamento')
-
-        if animal:
-            vacinacoes = vacinacoes.filter(animal=animal)
-        if data_aplicacao_inicio:
-            vacinacoes = vacinacoes.filter(data_aplicacao__gte=data_aplicacao_inicio)
-        if data_aplicacao_fim:
-            vacinacoes = vacinacoes.filter(data_aplicacao__lte=data_aplicacao_fim)
-        if medicamento:
-            vacinacoes = vacinacoes.filter(medicamento_aplicado=medicamento)
-
-        if status_revacinacao:
-            if status_revacinacao == 'ok':
-                vacinacoes = vacinacoes.filter(Q(data_revacinacao__gte=hoje + timedelta(days=31)) | Q(data_revacinacao__isnull=True))
-            elif status_revacinacao == 'vencendo':
-                limite_vencimento = hoje + timedelta(days=30)
-                vacinacoes = vacinacoes.filter(data_revacinacao__range=(hoje, limite_vencimento))
-            elif status_revacinacao == 'atrasada':
-                vacinacoes = vacinacoes.filter(data_revacinacao__lt=hoje)
-            elif status_revacinacao == 'nao_definida':
-                vacinacoes = vacinacoes.filter(data_revacinacao__isnull=True)
-
-    for vacina in vacinacoes:
-        if vacina.data_revacinacao:
-            vacina.days_diff = (vacina.data_revacinacao - hoje).days
-        else:
-            vacina.days_diff = None
-
-    template = get_template('relatorios/relatorio_vacinacao_pdf.html')
-    html = template.render({'vacinacoes': vacinacoes, 'total_registros': vacinacoes.count(), 'hoje': hoje})
-    
-    pdf_file = HTML(string=html, base_url=request.build_absolute_uri()).write_pdf(
-        stylesheets=[
-            CSS(string='@page { size: A4; margin: 1cm; }'),
-            CSS(url=request.build_absolute_uri(staticfiles_storage.url('admin/css/base.css'))),
-            CSS(url=request.build_absolute_uri(staticfiles_storage.url('admin/css/forms.css'))),
-            CSS(url=request.build_absolute_uri(staticfiles_storage.url('admin/css/changelists.css'))),
-        ]
-    )
-
-    response = HttpResponse(pdf_file, content_type='application/pdf')
-    response['Content-Disposition'] = 'inline; filename="relatorio_vacinacao.pdf"'
-    return response
+    return _render_relatorio_pdf(request, RelatorioVacinacao(request.GET))
+
+def relatorio_vacinacao_csv(request):
+    return resposta_csv(RelatorioVacinacao(request.GET))
 
+def relatorio_vacinacao_xlsx(request):
+    return resposta_xlsx(RelatorioVacinacao(request.GET))
 
 def relatorio_vermifugos(request):
-    form = FiltroVermifugosForm(request.GET)
-    vermifugos = RegistroVermifugos.objects.all().order_by('-data_administracao')
-    hoje = timezone.now().date()
-
-    if form.is_valid():
-        animal = form.cleaned_data.get('animal')
-        data_administracao_inicio = form.cleaned_data.get('data_administracao_inicio')
-        data_administracao_fim = form.cleaned_data.get('data_administracao_fim')
-        status_readministracao = form.cleaned_data.get('status_readministracao')
-        medicamento = form.cleaned_data.get('medicamento')
-
-        if animal:
-            vermifugos = vermifugos.filter(animal=animal)
-        if data_administracao_inicio:
-            vermifugos = vermifugos.filter(data_administracao__gte=data_administracao_inicio)
-        if data_administracao_fim:
-            vermifugos = vermifugos.filter(data_administracao__lte=data_administracao_fim)
-        if medicamento:
-            vermifugos = vermifugos.filter(medicamento_administrado=medicamento)
-
-        if status_readministracao:
-            if status_readministracao == 'ok':
-                vermifugos = vermifugos.filter(Q(data_readministracao__gte=hoje + timedelta(days=31)) | Q(data_readministracao__isnull=True))
-            elif status_readministracao == 'vencendo':
-                limite_readministracao = hoje + timedelta(days=30)
-                vermifugos = vermifugos.filter(data_readministracao__range=(hoje, limite_readministracao))
-            elif status_readministracao == 'atrasada':
-                vermifugos = vermifugos.filter(data_readministracao__lt=hoje)
-            elif status_readministracao == 'nao_definida':
-                vermifugos = vermifugos.filter(data_readministracao__isnull=True)
-
-    for vermifugo in vermifugos:
-        if vermifugo.data_readministracao:
-            vermifugo.days_diff = (vermifugo.data_readministracao - hoje).days
-        else:
-            vermifugo.days_diff = None
-
-    context = {'vermifugos': vermifugos, 'form': form, 'hoje': hoje}
-    return render(request, 'relatorios/relatorio_vermifugos.html', context)
+    return _render_relatorio(request, RelatorioVermifugos(request.GET))
 
 def relatorio_vermifugos_pdf(request):
-    form = FiltroVermifugosForm(request.GET)
-    vermifugos = RegistroVermifugos.objects.all().order_by('-data_administracao')
-    hoje = timezone.now().date()
-
-    if form.is_valid():
-        animal = form.cleaned_data.get('animal')
-        data_administracao_inicio = form.cleaned_data.get('data_administracao_inicio')
-        data_administracao_fim = form.cleaned_data.get('data_administracao_fim')
-        status_readministracao = form.cleaned_data.get('status_readministracao')
-        medicamento = form.cleaned_data.get('medicamento')
-
-        if animal:
-            vermifugos = vermifugos.filter(animal=animal)
-        if data_administracao_inicio:
-            vermifugos = vermifugos.filter(data_administracao__gte=data_administracao_inicio)
-        if data_administracao_fim:
-            vermifugos = vermifugos.filter(data_administracao__lte=data_administracao_fim)
-        if medicamento:
-            vermifugos = vermifugos.filter(medicamento_administrado=medicamento)
-
-        if status_readministracao:
-            if status_readministracao == 'ok':
-                vermifugos = vermifugos.filter(Q(data_readministracao__gte=hoje + timedelta(days=31)) | Q(data_readministracao__isnull=True))
-            elif status_readministracao == 'vencendo':
-                limite_readministracao = hoje + timedelta(days=30)
-                vermifugos = vermifugos.filter(data_readministracao__range=(hoje, limite_readministracao))
-            elif status_readministracao == 'atrasada':
-                vermifugos = vermifugos.filter(data_readministracao__lt=hoje)
-            elif status_readministracao == 'nao_definida':
-                vermifugos = vermifugos.filter(data_readministracao__isnull=True)
-
-    for vermifugo in vermifugos:
-        if vermifugo.data_readministracao:
-            vermifugo.days_diff = (vermifugo.data_readministracao - hoje).days
-        else:
-            vermifugo.days_diff = None
-
-    template = get_template('relatorios/relatorio_vermifugos_pdf.html')
-    html = template.render({'vermifugos': vermifugos, 'total_registros': vermifugos.count(), 'hoje': hoje})
-    
-    pdf_file = HTML(string=html, base_url=request.build_absolute_uri()).write_pdf(
-        stylesheets=[
-            CSS(string='@page { size: A4; margin: 1cm; }'),
-            CSS(url=request.build_absolute_uri(staticfiles_storage.url('admin/css/base.css'))),
-            CSS(url=request.build_absolute_uri(staticfiles_storage.url('admin/css/forms.css'))),
-            CSS(url=request.build_absolute_uri(staticfiles_storage.url('admin/css/changelists.css'))),
-        ]
-    )
-
-    response = HttpResponse(pdf_file, content_type='application/pdf')
-    response['Content-Disposition'] = 'inline; filename="relatorio_vermifugos.pdf"'
-    return response
+    return _render_relatorio_pdf(request, RelatorioVermifugos(request.GET))
+
+def relatorio_vermifugos_csv(request):
+    return resposta_csv(RelatorioVermifugos(request.GET))
+
+def relatorio_vermifugos_xlsx(request):
+    return resposta_xlsx(RelatorioVermifugos(request.GET))
 
 # --- NOVAS VIEWS PARA RELATÓRIO DE SERVIÇOS ---
 def relatorio_servicos(request):
-    form = FiltroRegistroServicoForm(request.GET)
-    servicos = RegistroServico.objects.all().order_by('-data_hora_procedimento')
-
-    if form.is_valid():
-        animal = form.cleaned_data.get('animal')
-        empresa = form.cleaned_data.get('empresa')
-        data_inicio = form.cleaned_data.get('data_inicio')
-        data_fim = form.cleaned_data.get('data_fim')
-        busca_texto = form.cleaned_data.get('busca_texto')
-
-        if animal:
-            servicos = servicos.filter(animal=animal)
-        if empresa:
-            servicos = servicos.filter(empresa=empresa)
-        if data_inicio:
-            servicos = servicos.filter(data_hora_procedimento__date__gte=data_inicio)
-        if data_fim:
-            servicos = servicos.filter(data_hora_procedimento__date__lte=data_fim)
-        
-        if busca_texto:
-            servicos = servicos.filter(
-                Q(medicamentos_aplicados__icontains=busca_texto) |
-                Q(outros_procedimentos__icontains=busca_texto)
-            )
-
-    context = {'servicos': servicos, 'form': form}
-    return render(request, 'relatorios/relatorio_servicos.html', context)
+    return _render_relatorio(request, RelatorioServicos(request.GET))
 
 def relatorio_servicos_pdf(request):
-    form = FiltroRegistroServicoForm(request.GET)
-    servicos = RegistroServico.objects.all().order_by('-data_hora_procedimento')
-
-    if form.is_valid():
-        animal = form.cleaned_data.get('animal')
-        empresa = form.cleaned_data.get('empresa')
-        data_inicio = form.cleaned_data.get('data_inicio')
-        data_fim = form.cleaned_data.get('data_fim')
-        busca_texto = form.cleaned_data.get('busca_texto')
-
-        if animal:
-            servicos = servicos.filter(animal=animal)
-        if empresa:
-            servicos = servicos.filter(empresa=empresa)
-        if data_inicio:
-            servicos = servicos.filter(data_hora_procedimento__date__gte=data_inicio)
-        if data_fim:
-            servicos = servicos.filter(data_hora_procedimento__date__lte=data_fim)
-        
-        if busca_texto:
-            servicos = servicos.filter(
-                Q(medicamentos_aplicados__icontains=busca_texto) |
-                Q(outros_procedimentos__icontains=busca_texto)
-            )
-
-    template = get_template('relatorios/relatorio_servicos_pdf.html')
-    html = template.render({'servicos': servicos, 'total_registros': servicos.count()})
-    
-    pdf_file = HTML(string=html, base_url=request.build_absolute_uri()).write_pdf(
-        stylesheets=[
-            CSS(string='@page { size: A4; margin: 1cm; }'),
-            CSS(url=request.build_absolute_uri(staticfiles_storage.url('admin/css/base.css'))),
-            CSS(url=request.build_absolute_uri(staticfiles_storage.url('admin/css/forms.css'))),
-            CSS(url=request.build_absolute_uri(staticfiles_storage.url('admin/css/changelists.css'))),
-        ]
-    )
-
-    response = HttpResponse(pdf_file, content_type='application/pdf')
-    response['Content-Disposition'] = 'inline; filename="relatorio_servicos.pdf"'
-    return response
+    return _render_relatorio_pdf(request, RelatorioServicos(request.GET))
+
+def relatorio_servicos_csv(request):
+    return resposta_csv(RelatorioServicos(request.GET))
 
+def relatorio_servicos_xlsx(request):
+    return resposta_xlsx(RelatorioServicos(request.GET))
 
 def relatorio_fila_castracao(request):
-    form = FiltroFilaCastracaoForm(request.GET)
-    # Filtra apenas agendamentos que são marcados como castração
-    fila_castracao = AgendamentoConsultas.objects.filter(is_castracao=True).order_by('data_consulta')
-
-    if form.is_valid():
-        animal = form.cleaned_data.get('animal')
-        tutor = form.cleaned_data.get('tutor')
-        data_inicio = form.cleaned_data.get('data_inicio')
-        data_fim = form.cleaned_data.get('data_fim')
-
-        if animal:
-            fila_castracao = fila_castracao.filter(animal=animal)
-        if tutor:
-            fila_castracao = fila_castracao.filter(animal__tutor=tutor)
-        if data_inicio:
-            fila_castracao = fila_castracao.filter(data_consulta__date__gte=data_inicio)
-        if data_fim:
-            fila_castracao = fila_castracao.filter(data_consulta__date__lte=data_fim)
-
-    context = {'fila_castracao': fila_castracao, 'form': form}
-    return render(request, 'relatorios/relatorio_fila_castracao.html', context)
+    return _render_relatorio(request, RelatorioFilaCastracao(request.GET))
 
 def relatorio_fila_castracao_pdf(request):
-    form = FiltroFilaCastracaoForm(request.GET)
-    fila_castracao = AgendamentoConsultas.objects.filter(is_castracao=True).order_by('data_consulta')
-
-    if form.is_valid():
-        animal = form.cleaned_data.get('animal')
-        tutor = form.cleaned_data.get('tutor')
-        data_inicio = form.cleaned_data.get('data_inicio')
-        data_fim = form.cleaned_data.get('data_fim')
-
-        if animal:
-            fila_castracao = fila_castracao.filter(animal=animal)
-        if tutor:
-            fila_castracao = fila_castracao.filter(animal__tutor=tutor)
-        if data_inicio:
-            fila_castracao = fila_castracao.filter(data_consulta__date__gte=data_inicio)
-        if data_fim:
-            fila_castracao = fila_castracao.filter(data_consulta__date__lte=data_fim)
-            
-    template = get_template('relatorios/relatorio_fila_castracao_pdf.html')
-    html = template.render({'fila_castracao': fila_castracao, 'total_registros': fila_castracao.count()})
-    
-    pdf_file = HTML(string=html, base_url=request.build_absolute_uri()).write_pdf(
-        stylesheets=[
-            CSS(string='@page { size: A4; margin: 1cm; }'),
-            CSS(url=request.build_absolute_uri(staticfiles_storage.url('admin/css/base.css'))),
-            CSS(url=request.build_absolute_uri(staticfiles_storage.url('admin/css/forms.css'))),
-            CSS(url=request.build_absolute_uri(staticfiles_storage.url('admin/css/changelists.css'))),
-        ]
-    )
-
-    response = HttpResponse(pdf_file, content_type='application/pdf')
-    response['Content-Disposition'] = 'inline; filename="relatorio_fila_castracao.pdf"'
-    return response
+    return _render_relatorio_pdf(request, RelatorioFilaCastracao(request.GET))
+
+def relatorio_fila_castracao_csv(request):
+    return resposta_csv(RelatorioFilaCastracao(request.GET))
+
+def relatorio_fila_castracao_xlsx(request):
+    return resposta_xlsx(RelatorioFilaCastracao(request.GET))
+
+
+# --- AUTOCOMPLETE DOS FILTROS ---
+@staff_member_required
+@require_GET
+def autocomplete(request, fonte):
+    if fonte not in FONTES:
+        raise Http404("Fonte de autocomplete não encontrada.")
+    termo = request.GET.get('q', '').strip()
+    resultados = FONTES[fonte].buscar(termo, limite_da_requisicao(request.GET.get('limite')))
+    return JsonResponse({'resultados': resultados})
+
+
+# --- CEP ---
+@staff_member_required
+@require_GET
+def api_cep(request, cep):
+    # Usado pelo js/cep_lookup.js do cadastro de tutores: mesma base local/cache do Tutor.clean()
+    try:
+        endereco = servico_cep.resolver(cep)
+    except servico_cep.CEPInvalido:
+        return JsonResponse({'erro': "Digite um CEP com 8 dígitos."}, status=400)
+    except servico_cep.CEPNaoEncontrado:
+        return JsonResponse({'erro': "CEP não encontrado."}, status=404)
+    except servico_cep.CEPIndisponivel:
+        return JsonResponse({'erro': "Erro ao buscar o CEP."}, status=503)
+    return JsonResponse(endereco)
+
+
+# --- ESTOQUE EM DATA PASSADA ---
+@staff_member_required
+@require_GET
+def api_estoque_saldo(request):
+    # ?data=AAAA-MM-DD&agrupar=lote|medicamento|tipo, com os mesmos filtros do relatório
+    agrupamento = request.GET.get('agrupar', 'lote')
+    if agrupamento not in ('lote', 'medicamento', 'tipo'):
+        return JsonResponse({'erro': "Use agrupar=lote, medicamento ou tipo."}, status=400)
+    relatorio = RelatorioEstoqueHistorico(request.GET)
+    if not relatorio.form.is_valid():
+        return JsonResponse({'erro': relatorio.form.errors.get_json_data()}, status=400)
+    return JsonResponse({
+        'data': relatorio.data_referencia.isoformat(),
+        'agrupamento': agrupamento,
+        'resultados': relatorio.saldos_agrupados(agrupamento),
+    })
+
+
+# --- HORÁRIOS LIVRES DA AGENDA ---
+@staff_member_required
+@require_GET
+def api_agenda_horarios(request):
+    # ?data=AAAA-MM-DD[&semana=1][&veterinario=ID][&animal=ID][&castracao=1][&excluir=ID]
+    form = FiltroAgendaHorariosForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'erro': form.errors.get_json_data()}, status=400)
+    dados = form.cleaned_data
+    inicio, dias = dados['data'], 1
+    if dados['semana']:
+        inicio, dias = inicio - timedelta(days=inicio.weekday()), 7
+    return JsonResponse(agenda.disponibilidade(
+        inicio, dias,
+        veterinario=dados['veterinario'], animal=dados['animal'],
+        is_castracao=dados['castracao'], excluir=dados['excluir'],
+    ))
+
+
+# --- PDF EM SEGUNDO PLANO ---
+@require_POST
+def tarefa_pdf_criar(request, nome):
+    try:
+        tarefa = tarefas_pdf.enfileirar(nome, request.GET.urlencode(), request.build_absolute_uri('/'))
+    except ValueError:
+        raise Http404("Relatório não encontrado.")
+    return redirect('tarefa_pdf', pk=tarefa.pk)
+
+def tarefa_pdf(request, pk):
+    tarefa = get_object_or_404(TarefaRelatorioPDF, pk=pk)
+    return render(request, 'relatorios/tarefa_pdf.html', {'tarefa': tarefa})
+
+def tarefa_pdf_status(request, pk):
+    tarefa = get_object_or_404(TarefaRelatorioPDF, pk=pk)
+    return JsonResponse({
+        'status': tarefa.status,
+        'status_display': tarefa.get_status_display(),
+        'finalizada': tarefa.finalizada,
+        'erro': tarefa.erro,
+    })
+
+def tarefa_pdf_download(request, pk):
+    tarefa = get_object_or_404(TarefaRelatorioPDF, pk=pk, status=TarefaRelatorioPDF.CONCLUIDA)
+    if not tarefa.arquivo:
+        raise Http404("Arquivo não disponível.")
+    return FileResponse(tarefa.arquivo.open('rb'), content_type='application/pdf', filename=f"relatorio_{tarefa.relatorio}.pdf")
 
 
 def painel_gerencial(request):
-    hoje = timezone.localdate()
-    
-    # Agendamentos de HOJE: Filtrar EXATAMENTE para hoje
-    agendamentos_hoje_qs = AgendamentoConsultas.objects.filter(data_consulta__date=hoje).order_by('data_consulta')
-    
-    # Vacinas do Dia: Filtrar para revacinações que vencem EXATAMENTE hoje
-    vacinas_hoje_qs = RegistroVacinacao.objects.filter(data_revacinacao=hoje).order_by('data_revacinacao')
-
-    # Vermífugos do Dia: Filtrar para readministrações que vencem EXATAMENTE hoje
-    vermifugos_hoje_qs = RegistroVermifugos.objects.filter(data_readministracao=hoje).order_by('data_readministracao')
-
-    # Medicamentos a Vencer (30 dias ou vencidos) - Esta lógica parece estar correta para o objetivo
-    data_limite_vencimento = hoje + timedelta(days=30)
-    medicamentos_criticos_qs = EstoqueMedicamento.objects.filter(data_validade__lte=data_limite_vencimento).exclude(quantidade=0).order_by('data_validade')
-
-    # Agendamentos da Semana: Filtrar da segunda-feira desta semana até o domingo
-    dia_semana_atual = hoje.weekday() # 0 = segunda, 6 = domingo
-    inicio_semana = hoje - timedelta(days=dia_semana_atual)
-    fim_semana = inicio_semana + timedelta(days=6)
-    agendamentos_semana_qs = AgendamentoConsultas.objects.filter(
-        data_consulta__date__gte=inicio_semana,
-        data_consulta__date__lte=fim_semana
-    ).order_by('data_consulta')
-
-    context = {
-        'agendamentos_hoje': agendamentos_hoje_qs, 
-        'vacinas_hoje': vacinas_hoje_qs,   
-        'vermifugos_hoje': vermifugos_hoje_qs, 
-        'medicamentos_vencer': medicamentos_criticos_qs, 
-        'agendamentos_semana': agendamentos_semana_qs, 
-        'hoje': hoje,
-    }
-    return render(request, 'admin/painel_gerencial.html', context)
\ No newline at end of file
+    # Mesmo snapshot diário usado pelos cards da página inicial do admin (ver dashboard.py)
+    return render(request, 'admin/painel_gerencial.html', obter_snapshot())
\ No newline at end of file
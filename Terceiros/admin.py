@@ -1,4 +1,5 @@
 from django.contrib import admin
+from MariaAlvezApp.busca import BuscaTextualAdminMixin
 from Terceiros.models import EmpresaTerceirizada, RegistroServico
 
 @admin.register(EmpresaTerceirizada)
@@ -7,8 +8,11 @@ class EmpresaTerceirizadaAdmin(admin.ModelAdmin):
     search_fields = ['razao_social', 'cnpj']
 
 @admin.register(RegistroServico)
-class RegistroServicoAdmin(admin.ModelAdmin):
+class RegistroServicoAdmin(BuscaTextualAdminMixin, admin.ModelAdmin):
     list_display = ('animal', 'empresa', 'data_hora_procedimento', 'valor_servico')
+    search_fields = ['animal__nome', 'empresa__razao_social', 'medicamentos_aplicados', 'outros_procedimentos']
+    campos_busca_textual = ('medicamentos_aplicados', 'outros_procedimentos')
     list_filter = ('empresa', 'data_hora_procedimento')
     autocomplete_fields = ['animal', 'empresa']
+    list_select_related = ('animal__tutor', 'empresa')
     date_hierarchy = 'data_hora_procedimento'
\ No newline at end of file
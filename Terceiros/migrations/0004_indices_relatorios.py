@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MariaAlvezApp', '0010_indices_relatorios'),
+        ('Terceiros', '0003_alter_registroservico_animal'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='registroservico',
+            index=models.Index(fields=['data_hora_procedimento'], name='Terceiros_r_data_ho_69214c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registroservico',
+            index=models.Index(fields=['empresa', 'data_hora_procedimento'], name='Terceiros_r_empresa_a75ee3_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registroservico',
+            index=models.Index(fields=['animal', 'data_hora_procedimento'], name='Terceiros_r_animal__47ee77_idx'),
+        ),
+    ]
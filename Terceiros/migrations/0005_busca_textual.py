@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:45
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# SQL congelado aqui (gerado na época por MariaAlvezApp.busca): mudanças futuras naquele
+# módulo não alteram o que esta migração faz.
+# Trigger e índices da busca textual (só PostgreSQL).
+SQL_INSTALAR = [
+    '''CREATE OR REPLACE FUNCTION "Terceiros_registroservico_busca_atualizar"() RETURNS trigger AS $$
+        BEGIN
+            NEW.busca := setweight(to_tsvector('portugues_unaccent', coalesce(NEW."medicamentos_aplicados", '')), 'A') || setweight(to_tsvector('portugues_unaccent', coalesce(NEW."outros_procedimentos", '')), 'B');
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql''',
+    '''CREATE TRIGGER "Terceiros_registroservico_busca" BEFORE INSERT OR UPDATE OF "medicamentos_aplicados", "outros_procedimentos"
+        ON "Terceiros_registroservico" FOR EACH ROW EXECUTE FUNCTION "Terceiros_registroservico_busca_atualizar"()''',
+    '''UPDATE "Terceiros_registroservico" SET busca = setweight(to_tsvector('portugues_unaccent', coalesce("medicamentos_aplicados", '')), 'A') || setweight(to_tsvector('portugues_unaccent', coalesce("outros_procedimentos", '')), 'B')''',
+    'CREATE INDEX "Terceiros_registroservico_busca_gin" ON "Terceiros_registroservico" USING gin (busca)',
+    'CREATE INDEX "Terceiros_registroservico_medicamentos_aplicados_trgm" ON "Terceiros_registroservico" USING gin ("medicamentos_aplicados" gin_trgm_ops)',
+    'CREATE INDEX "Terceiros_registroservico_outros_procedimentos_trgm" ON "Terceiros_registroservico" USING gin ("outros_procedimentos" gin_trgm_ops)',
+]
+SQL_REMOVER = [
+    'DROP TRIGGER IF EXISTS "Terceiros_registroservico_busca" ON "Terceiros_registroservico"',
+    'DROP FUNCTION IF EXISTS "Terceiros_registroservico_busca_atualizar"()',
+    'DROP INDEX IF EXISTS "Terceiros_registroservico_busca_gin"',
+    'DROP INDEX IF EXISTS "Terceiros_registroservico_medicamentos_aplicados_trgm"',
+    'DROP INDEX IF EXISTS "Terceiros_registroservico_outros_procedimentos_trgm"',
+]
+
+
+def _somente_postgresql(comandos):
+    def aplicar(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for sql in comandos:
+            schema_editor.execute(sql)
+    return aplicar
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('MariaAlvezApp', '0011_busca_textual'),
+        ('Terceiros', '0004_indices_relatorios'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='registroservico',
+            name='busca',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(_somente_postgresql(SQL_INSTALAR), _somente_postgresql(SQL_REMOVER)),
+    ]
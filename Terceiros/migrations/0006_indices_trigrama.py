@@ -0,0 +1,34 @@
+from django.db import migrations
+
+# SQL congelado aqui (gerado na época por MariaAlvezApp.busca): mudanças futuras naquele
+# módulo não alteram o que esta migração faz.
+# Índice de trigramas do autocomplete do filtro de empresa (só PostgreSQL).
+SQL_INSTALAR = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS "Terceiros_empresaterceirizada_razao_social_trgm" ON "Terceiros_empresaterceirizada" USING gin ("razao_social" gin_trgm_ops)',
+]
+SQL_REMOVER = [
+    'DROP INDEX IF EXISTS "Terceiros_empresaterceirizada_razao_social_trgm"',
+]
+
+
+def _somente_postgresql(comandos):
+    def aplicar(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for sql in comandos:
+            schema_editor.execute(sql)
+    return aplicar
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Terceiros', '0005_busca_textual'),
+        ('MariaAlvezApp', '0012_indices_trigrama'),
+    ]
+
+    operations = [
+        # Autocomplete do filtro de empresa no relatório de serviços (só PostgreSQL)
+        migrations.RunPython(_somente_postgresql(SQL_INSTALAR), _somente_postgresql(SQL_REMOVER)),
+    ]
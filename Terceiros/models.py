@@ -1,6 +1,7 @@
 # Terceiros/models.py
 
 from django.db import models
+from django.contrib.postgres.search import SearchVectorField
 from django.utils import timezone
 from MariaAlvezApp.models import Animal
 from django.core.exceptions import ValidationError
@@ -141,6 +142,7 @@ class RegistroServico(models.Model):
         verbose_name="Outros Procedimentos Realizados",
         help_text="Descreva outros procedimentos, como curativos, exames, etc."
     )
+    busca = SearchVectorField(null=True, editable=False)  # Textos do serviço; mantido por trigger (ver MariaAlvezApp/busca.py)
     
     def clean(self): # <--- ADICIONE ESTE MÉTODO OU ATUALIZE-O
         super().clean()
@@ -166,4 +168,9 @@ class RegistroServico(models.Model):
     class Meta:
         verbose_name = "Registro de Serviço"
         verbose_name_plural = "Registros de Serviços"
-        ordering = ['-data_hora_procedimento']
\ No newline at end of file
+        ordering = ['-data_hora_procedimento']
+        indexes = [
+            models.Index(fields=['data_hora_procedimento']),
+            models.Index(fields=['empresa', 'data_hora_procedimento']),
+            models.Index(fields=['animal', 'data_hora_procedimento']),
+        ]
@@ -18,13 +18,24 @@ echo "PostgreSQL está pronto!"
 # Configurar variáveis de ambiente do Django
 export DJANGO_SETTINGS_MODULE=MariaAlvez.settings
 
-# Rodar as migrações do Django
-echo "Executando migrações do Django..."
-python manage.py makemigrations --noinput
-python manage.py migrate --noinput
+# Containers auxiliares (ex.: worker) não migram: só o web altera o banco, e rodar as
+# migrações em dois containers ao mesmo tempo disputa as mesmas tabelas
+if [ "${AGUARDAR_MIGRACOES}" = "1" ]; then
+  until python manage.py migrate --check > /dev/null 2>&1; do
+    echo "Aguardando o container web aplicar as migrações..."
+    sleep 2
+  done
+  echo "Migrações aplicadas."
+else
+  # Rodar as migrações do Django
+  echo "Executando migrações do Django..."
+  python manage.py makemigrations --noinput
+  python manage.py migrate --noinput
+  python manage.py createcachetable
+fi
 
 # Criar superusuário se não existir
-if [ -n "${DJANGO_SUPERUSER_USERNAME}" ] && [ -n "${DJANGO_SUPERUSER_EMAIL}" ] && [ -n "${DJANGO_SUPERUSER_PASSWORD}" ]; then
+if [ "${AGUARDAR_MIGRACOES}" != "1" ] && [ -n "${DJANGO_SUPERUSER_USERNAME}" ] && [ -n "${DJANGO_SUPERUSER_EMAIL}" ] && [ -n "${DJANGO_SUPERUSER_PASSWORD}" ]; then
   echo "Verificando/criando superusuário Django..."
   python manage.py shell -c "
 from django.contrib.auth import get_user_model
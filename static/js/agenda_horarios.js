@@ -0,0 +1,58 @@
+// static/js/agenda_horarios.js
+//
+// Formulário de agendamento: a cada mudança de data, veterinário, animal ou tipo, busca os
+// horários livres do dia no endpoint da agenda (data-horarios-url) e desabilita as opções
+// de hora sem vaga. A validação final continua no servidor (AgendamentoConsultasForm.clean).
+
+document.addEventListener('DOMContentLoaded', function () {
+    const select = document.querySelector('select[data-horarios-url]');
+    if (!select) return;
+
+    const form = select.form;
+    const campo = function (nome) { return form.querySelector('[name="' + nome + '"]'); };
+    let controlador = null;
+
+    function atualizar() {
+        const data = campo('data_consulta_date');
+        if (!data || !data.value) return;
+
+        const params = new URLSearchParams({ data: data.value });
+        ['veterinario', 'animal'].forEach(function (nome) {
+            const elemento = campo(nome);
+            if (elemento && elemento.value) params.set(nome, elemento.value);
+        });
+        const castracao = campo('is_castracao');
+        if (castracao && castracao.checked) params.set('castracao', '1');
+        if (select.dataset.excluir) params.set('excluir', select.dataset.excluir);
+
+        if (controlador) controlador.abort();
+        controlador = new AbortController();
+        fetch(select.dataset.horariosUrl + '?' + params.toString(), {
+            headers: { 'Accept': 'application/json' },
+            signal: controlador.signal,
+        })
+            .then(resp => resp.json())
+            .then(function (resposta) {
+                const dia = resposta.dias && resposta.dias[0];
+                if (!dia) return;
+                const horarios = new Map(dia.horarios.map(h => [h.hora, h]));
+                select.querySelectorAll('option').forEach(function (opcao) {
+                    const horario = horarios.get(opcao.value);
+                    const ocupado = Boolean(horario) && !horario.livre;
+                    opcao.disabled = ocupado;
+                    opcao.textContent = opcao.value + (ocupado ? ' (ocupado)' : '');
+                });
+            })
+            .catch(function () { /* Sem a consulta, todas as horas seguem disponíveis para escolha */ });
+    }
+
+    ['data_consulta_date', 'veterinario', 'animal', 'is_castracao'].forEach(function (nome) {
+        const elemento = campo(nome);
+        if (elemento) elemento.addEventListener('change', atualizar);
+    });
+    // O autocomplete do admin (select2) avisa mudanças pelo jQuery, não por eventos nativos
+    if (window.django && window.django.jQuery) {
+        window.django.jQuery(form).on('change', 'select[name="animal"], select[name="veterinario"]', atualizar);
+    }
+    atualizar();
+});
@@ -0,0 +1,60 @@
+// static/js/autocomplete_filtro.js
+//
+// Selects dos filtros dos relatórios com data-autocomplete-url: o servidor só renderiza a
+// opção escolhida; ao digitar no campo de busca, as opções são trocadas pelos resultados
+// do endpoint de autocomplete.
+
+document.addEventListener('DOMContentLoaded', function () {
+    document.querySelectorAll('select[data-autocomplete-url]').forEach(function (select) {
+        const busca = document.createElement('input');
+        busca.type = 'search';
+        busca.placeholder = 'Digite para buscar...';
+        busca.autocomplete = 'off';
+        busca.classList.add('autocomplete-busca');
+        select.parentNode.insertBefore(busca, select);
+
+        const opcaoVazia = select.querySelector('option[value=""]');
+        let temporizador = null;
+        let controlador = null;
+
+        function preencher(resultados) {
+            const escolhido = select.value;
+            select.innerHTML = '';
+            if (opcaoVazia) select.appendChild(opcaoVazia);
+            resultados.forEach(function (item) {
+                const opcao = document.createElement('option');
+                opcao.value = item.id;
+                opcao.textContent = item.texto;
+                select.appendChild(opcao);
+            });
+            if (escolhido && select.querySelector('option[value="' + escolhido + '"]')) {
+                select.value = escolhido;
+            } else if (resultados.length) {
+                select.value = resultados[0].id;
+            }
+        }
+
+        function buscar() {
+            const termo = busca.value.trim();
+            if (controlador) controlador.abort();
+            controlador = new AbortController();
+
+            const url = new URL(select.dataset.autocompleteUrl, window.location.origin);
+            url.searchParams.set('q', termo);
+            fetch(url, { signal: controlador.signal, headers: { 'Accept': 'application/json' } })
+                .then(function (response) {
+                    if (!response.ok) throw new Error('Erro ao buscar opções.');
+                    return response.json();
+                })
+                .then(function (dados) { preencher(dados.resultados); })
+                .catch(function (erro) {
+                    if (erro.name !== 'AbortError') console.error(erro);
+                });
+        }
+
+        busca.addEventListener('input', function () {
+            clearTimeout(temporizador);
+            temporizador = setTimeout(buscar, 250);
+        });
+    });
+});
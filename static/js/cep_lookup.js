@@ -31,16 +31,17 @@ document.addEventListener('DOMContentLoaded', function () {
             return;
         }
 
-        fetch(`https://viacep.com.br/ws/${cep}/json/`)
+        // Endpoint local (base de CEPs do sistema); a API externa só é consultada pelo servidor
+        fetch(`/api/cep/${cep}/`, { headers: { 'Accept': 'application/json' } })
             .then(resp => resp.json())
             .then(data => {
                 if (data.erro) {
-                    mostrarErro("CEP não encontrado.");
+                    mostrarErro(data.erro);
                     return;
                 }
 
-                document.querySelector('input[name="endereco"]').value = data.logradouro || '';
-                document.querySelector('input[name="cidade"]').value = data.localidade || '';
+                document.querySelector('input[name="endereco"]').value = [data.logradouro, data.bairro].filter(Boolean).join(', ');
+                document.querySelector('input[name="cidade"]').value = data.cidade || '';
                 document.querySelector('input[name="estado"]').value = data.uf || '';
                 limparErro();
             })